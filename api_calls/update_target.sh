@@ -0,0 +1,10 @@
+#!/bin/bash
+
+curl -X PUT http://localhost:9988/update-target -H "Content-Type: application/json" -d '{
+    "id": "4",
+    "name": "replica 4",
+    "address": "mimir-cloud_metrics_generator-4",
+    "metrics_port": 8000,
+    "metrics_path": "/metrics",
+    "expected_series": 4
+}'
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, Iterable, Iterator
 
 class AbstractDataType(ABC):
     @abstractmethod
@@ -22,6 +22,34 @@ class AbstractDataType(ABC):
     def remove(self, key: int)->Any | None:
         ...
 
+    def find_many(self, keys: Iterable[int])->list[Any]:
+        """
+        Runs find_max_smaller_than for a batch of keys.
+        Data types that can resolve a whole batch faster should override it
+        """
+        return [self.find_max_smaller_than(key) for key in keys]
+
+    def iter_values(self)->Iterator[Any]:
+        """
+        Yields the stored values in key order.
+        Data types that can traverse themselves lazily should override it
+        """
+        yield from self.list()
+
+    @abstractmethod
+    def inorder(self)->list[tuple[int, Any]]:
+        """
+        Returns the (key, value) pairs in key order
+        """
+        ...
+
+    @abstractmethod
+    def iter_range(self, first_key: int, last_key: int)->Iterator[tuple[int, Any]]:
+        """
+        Yields the (key, value) pairs with first_key <= key < last_key in key order
+        """
+        ...
+
     @abstractmethod
     def list(self)->list[Any]:
         ...
@@ -30,6 +58,6 @@ class AbstractDataType(ABC):
     def find_max_smaller_than(self, key: int)->Any:
         ...
 
-    # @abstractmethod
-    # def find_min_greater_than(self, key: int)->Any:
-    #     ...
\ No newline at end of file
+    @abstractmethod
+    def find_min_greater_than(self, key: int)->Any:
+        ...
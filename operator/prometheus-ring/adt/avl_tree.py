@@ -0,0 +1,193 @@
+from typing import Any
+from .abstract_data_type import AbstractDataType
+from .tree_traversal import TreeTraversal
+
+class AVLNode:
+    def __init__(self, key: int, value: Any):
+        self.left = None
+        self.right = None
+        self.key = key
+        self.value = value
+        self.height = 1
+
+class AVLTree(TreeTraversal, AbstractDataType):
+    """
+    Self balancing binary search tree.
+    Keeps the height of the tree in O(log n), so inserts, removals and floor lookups
+    do not degrade when the ring indexes are inserted in a skewed order
+    """
+    def __init__(self):
+        self.root: AVLNode | None = None
+        self.size = 0
+
+    def insert(self, key: int, value: Any)->None:
+        """
+        Inserts a value in the tree. If the key already exists, its value is replaced
+        """
+        self.root = self._insert(self.root, key, value)
+
+    def _insert(self, root: AVLNode | None, key: int, value: Any)->AVLNode:
+        if root is None:
+            self.size += 1
+            return AVLNode(key, value)
+
+        if key < root.key:
+            root.left = self._insert(root.left, key, value)
+        elif key > root.key:
+            root.right = self._insert(root.right, key, value)
+        else:
+            root.value = value
+            return root
+        return self._rebalance(root)
+
+    def search(self, key: int)->Any | None:
+        node = self._search(key)
+        if node is None:
+            return None
+        return node.value
+
+    def _search(self, key: int)->AVLNode | None:
+        node = self.root
+        while node is not None and node.key != key:
+            node = node.left if key < node.key else node.right
+        return node
+
+    def update(self, key: int, new_value: Any)->Any | None:
+        """
+        Updates the node value, if found. Else, returns None
+        """
+        node = self._search(key)
+        if node is None:
+            return None
+        old_value = node.value
+        node.value = new_value
+        return old_value
+
+    def remove(self, key: int)->Any | None:
+        """
+        Removes a key from the tree. Returns the removed value, or None if not found
+        """
+        node = self._search(key)
+        if node is None:
+            return None
+        self.root = self._remove(self.root, key)
+        self.size -= 1
+        return node.value
+
+    def _remove(self, root: AVLNode | None, key: int)->AVLNode | None:
+        if root is None:
+            return None
+
+        if key < root.key:
+            root.left = self._remove(root.left, key)
+        elif key > root.key:
+            root.right = self._remove(root.right, key)
+        else:
+            if root.left is None:
+                return root.right
+            if root.right is None:
+                return root.left
+
+            successor = self._min_key_node(root.right)
+            root.right = self._remove_min(root.right)
+            successor.left = root.left
+            successor.right = root.right
+            root = successor
+        return self._rebalance(root)
+
+    def _remove_min(self, root: AVLNode)->AVLNode | None:
+        if root.left is None:
+            return root.right
+        root.left = self._remove_min(root.left)
+        return self._rebalance(root)
+
+    def _min_key_node(self, node: AVLNode)->AVLNode:
+        current = node
+        while current.left is not None:
+            current = current.left
+        return current
+
+    def find_max_smaller_than(self, key: int)->Any:
+        """
+        Returns the value of the greatest key strictly smaller than the provided key
+        """
+        node = self.root
+        max_node = None
+        while node is not None:
+            if node.key < key:
+                max_node = node
+                node = node.right
+            else:
+                node = node.left
+        if max_node is None:
+            return None
+        return max_node.value
+
+    def find_min_greater_than(self, key: int)->Any:
+        """
+        Returns the value of the smallest key strictly greater than the provided key
+        """
+        node = self.root
+        min_node = None
+        while node is not None:
+            if node.key > key:
+                min_node = node
+                node = node.left
+            else:
+                node = node.right
+        if min_node is None:
+            return None
+        return min_node.value
+
+    # Balancing functions
+    def _height(self, node: AVLNode | None)->int:
+        return node.height if node is not None else 0
+
+    def _update_height(self, node: AVLNode)->None:
+        node.height = 1 + max(self._height(node.left), self._height(node.right))
+
+    def _balance_factor(self, node: AVLNode)->int:
+        return self._height(node.left) - self._height(node.right)
+
+    def _rotate_right(self, root: AVLNode)->AVLNode:
+        """
+             root          left
+            /    \\        /    \\
+          left    c  ->  a     root
+         /    \\               /    \\
+        a      b              b      c
+        """
+        new_root = root.left
+        root.left = new_root.right
+        new_root.right = root
+        self._update_height(root)
+        self._update_height(new_root)
+        return new_root
+
+    def _rotate_left(self, root: AVLNode)->AVLNode:
+        """
+          root               right
+         /    \\             /    \\
+        a     right   ->  root     c
+             /    \\      /    \\
+            b      c     a      b
+        """
+        new_root = root.right
+        root.right = new_root.left
+        new_root.left = root
+        self._update_height(root)
+        self._update_height(new_root)
+        return new_root
+
+    def _rebalance(self, root: AVLNode)->AVLNode:
+        self._update_height(root)
+        balance = self._balance_factor(root)
+        if balance > 1:                                         # Left heavy
+            if self._balance_factor(root.left) < 0:             # Left-right case
+                root.left = self._rotate_left(root.left)
+            return self._rotate_right(root)
+        if balance < -1:                                        # Right heavy
+            if self._balance_factor(root.right) > 0:            # Right-left case
+                root.right = self._rotate_right(root.right)
+            return self._rotate_left(root)
+        return root
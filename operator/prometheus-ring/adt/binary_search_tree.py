@@ -1,5 +1,6 @@
 from typing import Any
 from .abstract_data_type import AbstractDataType
+from .tree_traversal import TreeTraversal
 
 class BSTNode:
     def __init__(self, key: int, value: Any):
@@ -8,7 +9,7 @@ class BSTNode:
         self.key = key
         self.value = value
 
-class BinarySearchTree(AbstractDataType):
+class BinarySearchTree(TreeTraversal, AbstractDataType):
     def __init__(self):
         self.root: BSTNode | None = None
         
@@ -68,21 +69,6 @@ class BinarySearchTree(AbstractDataType):
         
         return self._update(root.left, key)
     
-    def inorder(self)->list[Any | None]:
-        return self._inorder(self.root)
-    
-    def list(self)->list[Any]:
-        return [node for key, node in self.inorder()]
-
-
-    def _inorder(self, root):
-        res = []
-        if root:
-            res = self._inorder(root.left)
-            res.append((root.key, root.value))
-            res = res + self._inorder(root.right)
-        return res
-
     def print_tree(self):
         lines = self._build_tree_string(self.root, 0, False, '-')[0]
         for line in lines:
@@ -141,8 +127,16 @@ class BinarySearchTree(AbstractDataType):
 
         return new_box, len(new_box[0]), new_root_start, new_root_end
 
-    def remove(self, key: str)->BSTNode | None:
-        return self._remove(self.root, key)
+    def remove(self, key: int)->Any | None:
+        """
+        Removes a key from the tree. Returns the removed value, or None if not found
+        """
+        node = self._search(self.root, key)
+        if node is None:
+            return None
+        value = node.value                      # The node may take the key and value of its successor
+        self.root = self._remove(self.root, key)
+        return value
 
     def _remove(self, root, key):
         if root is None:
@@ -161,6 +155,7 @@ class BinarySearchTree(AbstractDataType):
 
             temp = self._min_key_node(root.right)
             root.key = temp.key
+            root.value = temp.value
             root.right = self._remove(root.right, temp.key)
 
         return root
@@ -0,0 +1,132 @@
+from typing import Any, Iterable, Iterator
+from bisect import bisect_left
+from .abstract_data_type import AbstractDataType
+import numpy as np
+
+class SortedArray(AbstractDataType):
+    """
+    Keeps the keys in a contiguous sorted list, with a parallel list for the values.
+    Lookups are binary searches over the keys, which is cheap to read, while inserts and removals
+    shift the lists. It suits the ring, where nodes rarely change but targets are looked up all the time
+    """
+    def __init__(self):
+        self.keys: list[int] = []
+        self.values: list[Any] = []
+        self._arrays: tuple[np.ndarray, np.ndarray] | None = None      # Keys and values as arrays, built on demand by find_many
+
+    def insert(self, key: int, value: Any)->None:
+        """
+        Inserts a value in the array. If the key already exists, its value is replaced
+        """
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            self.values[position] = value
+            self._arrays = None
+            return
+        self.keys.insert(position, key)
+        self.values.insert(position, value)
+        self._arrays = None
+
+    def _position(self, key: int)->int | None:
+        """
+        Returns the position of the key, or None if not found
+        """
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return position
+        return None
+
+    def search(self, key: int)->Any | None:
+        position = self._position(key)
+        if position is None:
+            return None
+        return self.values[position]
+
+    def update(self, key: int, new_value: Any)->Any | None:
+        """
+        Updates the key value, if found. Else, returns None
+        """
+        position = self._position(key)
+        if position is None:
+            return None
+        old_value = self.values[position]
+        self.values[position] = new_value
+        self._arrays = None
+        return old_value
+
+    def remove(self, key: int)->Any | None:
+        """
+        Removes a key from the array. Returns the removed value, or None if not found
+        """
+        position = self._position(key)
+        if position is None:
+            return None
+        del self.keys[position]
+        self._arrays = None
+        return self.values.pop(position)
+
+    def inorder(self)->list[tuple[int, Any]]:
+        return list(zip(self.keys, self.values))
+
+    def find_many(self, keys: Iterable[int])->list[Any]:
+        """
+        Resolves a batch of keys at once, as find_max_smaller_than would for each one, with a single
+        numpy.searchsorted over the keys array. The arrays are cached until the array changes
+        """
+        queries = np.array(list(keys), dtype=object)
+        if len(queries) == 0:
+            return []
+        if len(self.keys) == 0:
+            return [None] * len(queries)
+        key_array, value_array = self._get_arrays()
+        positions = np.zeros(len(queries), dtype=np.int64)
+        above = queries > self.keys[-1]             # The ring queries hash + 1, which may not fit in the uint64 keys
+        inside = ~above & (queries > self.keys[0])
+        positions[above] = len(self.keys)
+        positions[inside] = np.searchsorted(key_array, queries[inside].astype(np.uint64))
+        return value_array[positions - 1].tolist()      # Position 0 picks the trailing None
+
+    def _get_arrays(self)->tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the keys as an uint64 array and the values as an object array followed by None
+        """
+        if self._arrays is None:
+            value_array = np.fromiter([*self.values, None], dtype=object, count=len(self.values) + 1)
+            self._arrays = (np.array(self.keys, dtype=np.uint64), value_array)
+        return self._arrays
+
+    def list(self)->list[Any]:
+        return list(self.values)
+
+    def iter_items(self)->Iterator[tuple[int, Any]]:
+        return zip(self.keys, self.values)
+
+    def iter_values(self)->Iterator[Any]:
+        return iter(self.values)
+
+    def iter_range(self, first_key: int, last_key: int)->Iterator[tuple[int, Any]]:
+        """
+        Yields the (key, value) pairs with first_key <= key < last_key in order
+        """
+        start = bisect_left(self.keys, first_key)
+        stop = bisect_left(self.keys, last_key, start)
+        for position in range(start, stop):
+            yield self.keys[position], self.values[position]
+
+    def find_max_smaller_than(self, key: int)->Any:
+        """
+        Returns the value of the greatest key strictly smaller than the provided key
+        """
+        position = bisect_left(self.keys, key)
+        if position == 0:
+            return None
+        return self.values[position - 1]
+
+    def find_min_greater_than(self, key: int)->Any:
+        """
+        Returns the value of the smallest key strictly greater than the provided key
+        """
+        position = bisect_left(self.keys, key + 1)
+        if position == len(self.keys):
+            return None
+        return self.values[position]
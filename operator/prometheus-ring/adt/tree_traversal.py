@@ -0,0 +1,53 @@
+from typing import Any, Iterator
+
+class TreeTraversal:
+    """
+    In order traversals of a binary search tree, for the trees whose nodes have left, right, key and value,
+    and whose root is self.root.
+    Use explicit stacks, so deep trees do not reach the recursion limit
+    """
+    def inorder(self)->list[tuple[int, Any]]:
+        return list(self.iter_items())
+
+    def list(self)->list[Any]:
+        return list(self.iter_values())
+
+    def iter_items(self)->Iterator[tuple[int, Any]]:
+        """
+        Yields the (key, value) pairs in order
+        """
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.key, node.value
+            node = node.right
+
+    def iter_values(self)->Iterator[Any]:
+        for key, value in self.iter_items():
+            yield value
+
+    def iter_range(self, first_key: int, last_key: int)->Iterator[tuple[int, Any]]:
+        """
+        Yields the (key, value) pairs with first_key <= key < last_key in order.
+        Subtrees out of the range are not visited
+        """
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            while node is not None:
+                if node.key < first_key:            # The whole left subtree is out of the range
+                    node = node.right
+                else:
+                    stack.append(node)
+                    node = node.left
+            if not stack:
+                return
+            node = stack.pop()
+            if node.key >= last_key:
+                return
+            yield node.key, node.value
+            node = node.right
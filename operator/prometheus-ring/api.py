@@ -1,23 +1,44 @@
 from .orquestrator import Orquestrator
 from .swarm_orquestrator import SwarmOrquestrator
-from .ring import Ring, KeyNotFoundError
+from .ring import Ring, RebalanceReport, KeyNotFoundError, StaleReshardingPlanError
+from .node import Node
+from .resharding import ReshardingPlan
 from .target import Target
 from .service_discovery import ServiceDiscovery
+from .load_collector import LoadCollector
+from pydantic import TypeAdapter
 import logging
 
 logger = logging.getLogger(__name__)
 
+target_list_adapter = TypeAdapter(list[Target])
+
+RESHARD_MAX_ATTEMPTS = 3
+
+def parse_targets(body: bytes)->list[Target]:
+    """
+    Parses a batch of targets, either a JSON array or NDJSON (one target object per line).
+    Raises ValueError if the body is not valid
+    """
+    body = body.strip()
+    if body.startswith(b'['):
+        return target_list_adapter.validate_json(body)
+    return [Target.model_validate_json(line) for line in body.splitlines() if line.strip()]
+
 class API:
     def __init__(
             self,
             ring: Ring,
             orquestrator: SwarmOrquestrator,
-            service_discovery: ServiceDiscovery | None
+            service_discovery: ServiceDiscovery | None,
+            load_collector: LoadCollector | None = None,
         )->None:
 
         self.ring = ring
         self.orquestrator = orquestrator
         self.service_discovery = service_discovery
+        self.load_collector = load_collector
+        self.targets_json: tuple[int, list[dict]] | None = None         # Last /targets response and its ring generation
 
     def register_target(self, target: Target)->None:
         """
@@ -28,8 +49,31 @@ class API:
         logger.debug(f'inserting target {target}')
         if new_node is not None:
             self.orquestrator.create_node(new_node)
+            self._resize_nodes()
             # TODO: Implement some async call here
 
+    def update_target(self, target: Target)->None:
+        """
+        Updates a target being monitored, e.g. its expected series.
+        Scales up the ring if the node is left above the maximum load. Raises KeyNotFoundError if the target is not registered
+        """
+        new_node = self.ring.update(target.id, target)
+        logger.debug(f'updating target {target}')
+        if new_node is not None:
+            self.orquestrator.create_node(new_node)
+            self._resize_nodes()
+
+    def register_targets(self, targets: list[Target])->None:
+        """
+        Registers a batch of targets to be monitored.
+        The ring places all of them at once and the nodes created by the splits are launched at the end
+        """
+        new_nodes = self.ring.insert_many(targets, [target.id for target in targets])
+        logger.debug(f'inserted {len(targets)} targets, {len(new_nodes)} new nodes')
+        if len(new_nodes) > 0:
+            self.orquestrator.create_nodes(new_nodes)
+            self._resize_nodes()
+
     # def register_target(self, target: Target)->None:
     #     """
     #     Registers a target to be monitored.
@@ -60,18 +104,34 @@ class API:
         Unregisters a target being monitored by prometheus.
         If the node is underloaded, scales down the ring
         """
-        logger.debug(f'nodes: {self.ring.get_nodes()}')
-        
         try:
-            self.ring.get(target_id)
-            node_to_delete = self.ring.delete(target_id)                        # Returns a node if ring scaled down
+            node_to_delete = self.ring.delete(target_id)                        # Returns a node if ring scaled down, raises KeyNotFoundError
             if node_to_delete is not None:
+                new_nodes = self.ring.split_overloaded_nodes()                  # The node receiving the targets may be overloaded
+                if len(new_nodes) > 0:
+                    self.orquestrator.create_nodes(new_nodes)
+                    self._resize_nodes()
                 self.orquestrator.delete_node(node_to_delete)                      # Removing previous node
 
         except KeyNotFoundError:
             # TODO: treat this
             pass
 
+    def unregister_targets(self, target_ids: list[str])->None:
+        """
+        Unregisters a batch of targets being monitored by prometheus.
+        The ring is scaled down once, after every target is removed.
+        Raises KeyNotFoundError if any of the targets is not registered
+        """
+        nodes_to_delete = self.ring.delete_many(target_ids)
+        logger.debug(f'deleted {len(target_ids)} targets, {len(nodes_to_delete)} nodes removed')
+        if len(nodes_to_delete) > 0:
+            new_nodes = self.ring.split_overloaded_nodes()
+            if len(new_nodes) > 0:
+                self.orquestrator.create_nodes(new_nodes)
+                self._resize_nodes()
+            self.orquestrator.delete_nodes(nodes_to_delete)
+
     # def unregister_target(self, target_id)->None:
     #     """
     #     Unregisters a target being monitored by prometheus.
@@ -100,24 +160,84 @@ class API:
 
 
 
-    def build_targets_json(self)->dict:
+    def rebalance(self)->list[RebalanceReport]:
+        """
+        Moves the boundaries between adjacent nodes with uneven loads.
+        No node is created nor deleted, so the orquestrator is not called
+        """
+        reports = self.ring.rebalance()
+        logger.debug(f'{len(reports)} pairs of nodes rebalanced, {sum(report.moved_keys for report in reports)} keys moved')
+        return reports
+
+    def reshard(self, target_load: int | None = None, max_moved_keys: int | None = None, dry_run: bool = False)->ReshardingPlan:
+        """
+        Plans the re-sharding of the ring to even quantiles of the key hashes and, unless it's a dry run,
+        applies it, launching the new nodes before removing the merged ones.
+        The plan is made without blocking writes, so it is made again if the ring changed before applying it
+        """
+        for attemp in range(RESHARD_MAX_ATTEMPTS):
+            plan = self.ring.plan_resharding(target_load, max_moved_keys)
+            logger.debug(f'resharding plan: {len(plan.steps)} steps, {plan.moved_keys} keys moved, {plan.node_count} nodes')
+            if dry_run or len(plan.steps) == 0:
+                return plan
+            try:
+                new_nodes, nodes_to_delete = self.ring.apply_resharding(plan)
+                break
+            except StaleReshardingPlanError as e:
+                logger.warning(f'Attemp {attemp} of resharding failed: {str(e)}. Planning again...')
+        else:
+            raise StaleReshardingPlanError(f'The ring changed while resharding in {RESHARD_MAX_ATTEMPTS} attemps')
+        if len(new_nodes) > 0:
+            self.orquestrator.create_nodes(new_nodes)
+            self._resize_nodes()
+        if len(nodes_to_delete) > 0:
+            self.orquestrator.delete_nodes(nodes_to_delete)
+        return plan
+
+    def collect_loads(self)->list[Node]:
+        """
+        Measures the loads of the prometheus nodes and feeds them to the ring, launching the nodes created by the splits
+        """
+        if self.load_collector is None:
+            return []
+        loads = self.load_collector.collect(self.ring.get_nodes())
+        new_nodes = self.ring.measure_loads(loads)
+        logger.debug(f'{len(loads)} node loads measured, {len(new_nodes)} new nodes')
+        if len(new_nodes) > 0:
+            self.orquestrator.create_nodes(new_nodes)
+            self._resize_nodes()
+        return new_nodes
+
+    def _resize_nodes(self)->None:
+        """
+        Updates the services of the running nodes resized to a bigger capacity class by the last splits
+        """
+        resized_nodes = self.ring.pop_resized_nodes()
+        if len(resized_nodes) > 0:
+            self.orquestrator.update_nodes(resized_nodes)
+
+    def build_targets_json(self)->list[dict]:
+        """
+        Builds the http service discovery targets from a snapshot of the ring, so no lock is held while building them.
+        Only the ids and endpoints of the targets are read, from the columns of columnar nodes.
+        The result is reused until the ring changes
+        """
+        snapshot = self.ring.snapshot()
+        if self.targets_json is not None and self.targets_json[0] == snapshot.generation:
+            return self.targets_json[1]
         targets_json: list[dict] = []
-        nodes = self.ring.get_nodes()
-        logger.debug(f'Nodes: {nodes}')
-        for node in nodes:
-            logger.debug(f'node: {node}')
-            targets = node.list_items()
-            # TODO: this is very bad for performance, but is simpler to implement;
-            # maybe we can make this a background task or something
-            for target in targets:
+        for node in snapshot.iter_nodes():
+            node_index = str(node.index)
+            for target_id, endpoint in node.iter_endpoints():
                 targets_json.append(
                     {
-                        'targets': [target.endpoint],
+                        'targets': [endpoint],
                         'labels': {
-                            'node_index': str(node.index),
+                            'node_index': node_index,
                             '__metrics__path__': '/metrics',
-                            'target_id': target.id,
+                            'target_id': target_id,
                         }
                     }
                 )
-        return targets_json
\ No newline at end of file
+        self.targets_json = (snapshot.generation, targets_json)
+        return targets_json
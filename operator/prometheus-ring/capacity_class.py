@@ -0,0 +1,15 @@
+from pydantic import BaseModel, Field
+
+class CapacityClass(BaseModel, frozen=True):
+    """
+    Size of a prometheus node: the expected series it holds at 100% load, and the resources
+    reserved for its swarm service
+    """
+    name: str
+    capacity: int = Field(ge=1)
+    cpu_reservation: float | None = Field(default=None)        # CPUs
+    memory_reservation: int | None = Field(default=None)       # Bytes
+
+    @property
+    def nano_cpu_reservation(self)->int | None:
+        return int(self.cpu_reservation * 1e9) if self.cpu_reservation is not None else None
@@ -0,0 +1,245 @@
+from .node import Node
+from .target import TargetRecord
+from .hash import stable_hash
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping
+from typing import Iterator
+
+class ColumnarTargets(Mapping):
+    """
+    Read-only view of the targets of a columnar node by key. The records are built from the columns when read
+    """
+    def __init__(self, node: 'ColumnarNode')->None:
+        self._node = node
+
+    def __getitem__(self, key: str)->TargetRecord:
+        row = self._node._row(key)
+        if row is None:
+            raise KeyError(key)
+        return self._node._record(row)
+
+    def __iter__(self)->Iterator[str]:
+        return iter(self._node._keys)
+
+    def __len__(self)->int:
+        return len(self._node._keys)
+
+    def __contains__(self, key: object)->bool:
+        return key in self._node.hashes
+
+class TargetColumns(Mapping):
+    """
+    Read-only copy of the columns of a columnar node, taken for its snapshots. Copying the columns
+    does not build a record per target: the records are built from the columns when read
+    """
+    def __init__(self, node: 'ColumnarNode')->None:
+        self._keys = list(node._keys)
+        self._ids = list(node._ids)
+        self._names = list(node._names)
+        self._addresses = list(node._addresses)
+        self._ports = array('I', node._ports)
+        self._paths = list(node._paths)
+        self._labels = list(node._labels)
+        self._weights = array('Q', node._weights)
+        self._rows = dict(zip(self._keys, range(len(self._keys))))
+
+    def __getitem__(self, key: str)->TargetRecord:
+        row = self._rows[key]
+        return TargetRecord(self._ids[row], self._names[row], self._addresses[row], self._ports[row], self._paths[row], self._labels[row], self._weights[row])
+
+    def __iter__(self)->Iterator[str]:
+        return iter(self._keys)
+
+    def __len__(self)->int:
+        return len(self._keys)
+
+    def __contains__(self, key: object)->bool:
+        return key in self._rows
+
+    def iter_endpoints(self)->Iterator[tuple[str, str]]:
+        """
+        Yields the id and the endpoint of each target, from the columns
+        """
+        return zip(self._ids, map('{}:{}'.format, self._addresses, self._ports))
+
+class ColumnarNode(Node):
+    """
+    Node storing its targets in parallel columns sorted by key hash, instead of a dict of records.
+    The keys of a hash range are contiguous rows, so exporting them is a binary search and a slice
+    """
+    def _reset_storage(self)->None:
+        self.hashes: dict[str, int] = dict()       # Key hashes, to find the row of a key
+        self._sorted_hashes = array('Q')
+        self._keys: list[str] = []
+        self._ids: list[str] = []
+        self._names: list[str] = []
+        self._addresses: list[str] = []             # Interned by TargetRecord
+        self._ports = array('I')
+        self._paths: list[str] = []                 # Interned by TargetRecord
+        self._labels: list[tuple] = []              # Shared label sets
+        self._weights = array('Q')                  # Expected series
+        self.weight = 0
+
+    @property
+    def targets(self)->ColumnarTargets:
+        return ColumnarTargets(self)
+
+    def _columns(self)->tuple:
+        return (self._sorted_hashes, self._keys, self._ids, self._names, self._addresses, self._ports, self._paths, self._labels, self._weights)
+
+    def _record(self, row: int)->TargetRecord:
+        return TargetRecord(self._ids[row], self._names[row], self._addresses[row], self._ports[row], self._paths[row], self._labels[row], self._weights[row])
+
+    def _row(self, key: str)->int | None:
+        """
+        Returns the row of a key: the first row of its hash, and then the rows with the same hash
+        """
+        key_hash = self.hashes.get(key)
+        if key_hash is None:
+            return None
+        row = bisect_left(self._sorted_hashes, key_hash)
+        while self._keys[row] != key:
+            row += 1
+        return row
+
+    def _range_rows(self, first_key_hash: int, last_key_hash: int | None)->tuple[int, int]:
+        """
+        Returns the first and the last (exclusive) rows with hashes inside a hash range
+        """
+        first_row = bisect_left(self._sorted_hashes, first_key_hash)
+        last_row = len(self._keys) if last_key_hash is None else bisect_left(self._sorted_hashes, last_key_hash)
+        return first_row, max(first_row, last_row)
+
+    def insert(self, key: str, target: TargetRecord, key_hash: int | None = None)->None:
+        if key in self.hashes:
+            self.delete(key)
+        if key_hash is None:
+            key_hash = stable_hash(key)
+        row = bisect_right(self._sorted_hashes, key_hash)
+        values = (key_hash, key, target.id, target.name, target.address, target.metrics_port, target.metrics_path, target.labels, target.expected_series)
+        for column, value in zip(self._columns(), values):
+            column.insert(row, value)
+        self.weight += target.expected_series
+        self.hashes[key] = key_hash
+        self.version += 1
+        if self.key_index is not None:
+            self.key_index[key] = (key_hash, self)
+
+    def has_key(self, key: str)->bool:
+        return key in self.hashes
+
+    def get(self, key: str)->TargetRecord | None:
+        row = self._row(key)
+        return self._record(row) if row is not None else None
+
+    def list_items(self)->list[TargetRecord]:
+        return list(self.iter_items())
+
+    def list_keys(self)->list[tuple[str, TargetRecord]]:
+        return list(zip(self._keys, self.iter_items()))
+
+    def iter_items(self)->Iterator[TargetRecord]:
+        return map(TargetRecord, self._ids, self._names, self._addresses, self._ports, self._paths, self._labels, self._weights)
+
+    def copy_targets(self)->TargetColumns:
+        return TargetColumns(self)
+
+    def delete(self, key: str)->TargetRecord:
+        row = self._row(key)
+        if row is None:
+            raise Exception(f'Key {key} not found')
+        target = self._record(row)
+        for column in self._columns():
+            del column[row]
+        self.weight -= target.expected_series
+        del self.hashes[key]
+        self.version += 1
+        self._unindex(key)
+        return target
+
+    def update(self, key: str, new_target: TargetRecord)->None:
+        if key not in self.hashes:
+            self.insert(key, new_target)
+            return
+        row = self._row(key)
+        self._ids[row], self._names[row], self._addresses[row] = new_target.id, new_target.name, new_target.address
+        self._ports[row], self._paths[row], self._labels[row] = new_target.metrics_port, new_target.metrics_path, new_target.labels
+        self.weight += new_target.expected_series - self._weights[row]
+        self._weights[row] = new_target.expected_series
+        self.version += 1
+
+    def export_keys(self, other_node: Node, first_key_hash: int = -1, last_key_hash: int | None = None)->None:
+        """
+        Exports the rows of a hash range to another node as a slice, and deletes them at once
+        """
+        first_row, last_row = self._range_rows(first_key_hash, last_key_hash)
+        self._export_rows(other_node, first_row, last_row)
+        self._delete_rows(first_row, last_row)
+
+    def export_keys_many(self, other_nodes: list[Node], first_key_hashes: list[int], last_key_hash: int | None = None)->None:
+        """
+        Exports the rows of consecutive hash ranges to many nodes, one slice for each, and deletes them at once
+        """
+        if not first_key_hashes:
+            return
+        last_row = self._range_rows(first_key_hashes[0], last_key_hash)[1]
+        bounds = [min(self._range_rows(first_key_hash, last_key_hash)[0], last_row) for first_key_hash in first_key_hashes] + [last_row]
+        for other_node, first_row, last_row in zip(other_nodes, bounds, bounds[1:]):
+            self._export_rows(other_node, first_row, last_row)
+        self._delete_rows(bounds[0], bounds[-1])
+
+    def keys_in_range(self, first_key_hash: int, last_key_hash: int | None)->list[str]:
+        first_row, last_row = self._range_rows(first_key_hash, last_key_hash)
+        return self._keys[first_row:last_row]
+
+    def _export_rows(self, other_node: Node, first_row: int, last_row: int)->None:
+        if first_row >= last_row:
+            return
+        if isinstance(other_node, ColumnarNode):
+            other_node._insert_rows([column[first_row:last_row] for column in self._columns()])
+            return
+        for row in range(first_row, last_row):
+            other_node.insert(self._keys[row], self._record(row), self._sorted_hashes[row])
+
+    def _insert_rows(self, rows: list)->None:
+        """
+        Inserts sorted rows of other node. Rows falling between two existing rows are inserted as a slice,
+        otherwise the columns are merged and sorted again
+        """
+        hashes, keys = rows[0], rows[1]
+        position = bisect_right(self._sorted_hashes, hashes[0])
+        if position == len(self._keys) or hashes[-1] <= self._sorted_hashes[position]:
+            for column, values in zip(self._columns(), rows):
+                column[position:position] = values
+        else:
+            merged = [column + values for column, values in zip(self._columns(), rows)]
+            order = sorted(range(len(merged[0])), key=merged[0].__getitem__)
+            for column, values in zip(self._columns(), merged):
+                sorted_values = [values[row] for row in order]
+                column[:] = array(values.typecode, sorted_values) if isinstance(values, array) else sorted_values
+        self.weight += sum(rows[-1])
+        for key, key_hash in zip(keys, hashes):
+            self.hashes[key] = key_hash
+            if self.key_index is not None:
+                self.key_index[key] = (key_hash, self)
+        self.version += 1
+
+    def _delete_rows(self, first_row: int, last_row: int)->None:
+        if first_row >= last_row:
+            return
+        for key in self._keys[first_row:last_row]:
+            del self.hashes[key]
+            self._unindex(key)
+        self.weight -= sum(self._weights[first_row:last_row])
+        for column in self._columns():
+            del column[first_row:last_row]
+        self.version += 1
+
+    def range_hashes(self, first_key_hash: int, last_key_hash: int | None)->list[int]:
+        first_row, last_row = self._range_rows(first_key_hash, last_key_hash)
+        return self._sorted_hashes[first_row:last_row].tolist()
+
+    def range_weights(self, first_key_hash: int, last_key_hash: int | None)->list[int]:
+        first_row, last_row = self._range_rows(first_key_hash, last_key_hash)
+        return self._weights[first_row:last_row].tolist()
@@ -2,10 +2,55 @@ import hashlib
 import os
 
 MAX_HASH_SIZE_DIGITS = 10 ** int(os.environ.get('MAX_HASH_SIZE', '8'))
-def stable_hash(key: str)->int:
+HASH_SPACE_64_BITS = 2 ** 64
+
+class HashFunctionDoesNotExist(Exception):
+    ...
+
+def sha1_hash(key: str)->int:
     """
-    returns the md5 hash of the key
+    Legacy hash: the SHA-1 digest of the key, reduced to MAX_HASH_SIZE decimal digits
     """
-    hash_value = int(hashlib.sha1(key.encode()).hexdigest(), 16)
+    hash_value = int.from_bytes(hashlib.sha1(key.encode()).digest(), 'big')
     return hash_value % MAX_HASH_SIZE_DIGITS
-    
\ No newline at end of file
+
+def blake2b_hash(key: str)->int:
+    """
+    64 bits blake2b digest of the key. Faster than SHA-1 and covers the whole 64 bits space
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+hash_functions = {
+    'sha1': sha1_hash,
+    'blake2b': blake2b_hash,
+}
+hash_spaces = {                             # Number of values each hash function can return
+    'sha1': MAX_HASH_SIZE_DIGITS,
+    'blake2b': HASH_SPACE_64_BITS,
+}
+
+hash_function_name = 'sha1'                 # Changed with set_hash_function
+_hash_function = hash_functions[hash_function_name]
+
+def set_hash_function(name: str)->None:
+    """
+    Changes the hash function used by stable_hash.
+    Keys hashed with the previous function must be rehashed, see Ring.rehash
+    """
+    global hash_function_name, _hash_function
+    if name not in hash_functions:
+        raise HashFunctionDoesNotExist(f'Hash function {name} is not mapped')
+    hash_function_name = name
+    _hash_function = hash_functions[name]
+
+def hash_space()->int:
+    """
+    Returns the number of values the current hash function can return
+    """
+    return hash_spaces[hash_function_name]
+
+def stable_hash(key: str)->int:
+    """
+    returns the hash of the key, using the configured hash function
+    """
+    return _hash_function(key)
@@ -0,0 +1,97 @@
+from .node import Node
+from dataclasses import dataclass
+import requests
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+HEAD_SERIES_METRIC = 'prometheus_tsdb_head_series'
+MEMORY_METRIC = 'process_resident_memory_bytes'
+
+sample_pattern = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})?\s+(\S+)')
+
+@dataclass
+class NodeMetrics:
+    """
+    Metrics read from the /metrics endpoint of the prometheus instance of a node
+    """
+    node_index: int
+    head_series: float
+    resident_memory_bytes: float | None = None
+
+def parse_metrics(text: str, names: set[str])->dict[str, float]:
+    """
+    Reads the samples of the provided metrics from the prometheus text exposition format.
+    Samples of the same metric with different labels are summed
+    """
+    values: dict[str, float] = dict()
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        match = sample_pattern.match(line)
+        if match is None or match.group(1) not in names:
+            continue
+        try:
+            value = float(match.group(3))
+        except ValueError:
+            continue
+        values[match.group(1)] = values.get(match.group(1), 0) + value
+    return values
+
+class LoadCollector:
+    """
+    Polls the prometheus instance of each node through its published port (node.port on host) and measures its load:
+    its head series relative to the node capacity or, if memory_limit is provided, its resident memory relative to it,
+    whichever is higher. The memory reservation of the capacity class of a node replaces memory_limit
+    """
+    def __init__(
+            self,
+            host: str = 'localhost',
+            memory_limit: int | None = None,        # Bytes of memory of a prometheus instance at 100% load
+            timeout: float = 5,
+        )->None:
+        self.host = host
+        self.memory_limit = memory_limit
+        self.timeout = timeout
+
+    def scrape(self, node: Node)->NodeMetrics | None:
+        """
+        Reads the metrics of a node. Returns None if the node can't be reached or doesn't expose its head series
+        """
+        url = f'http://{self.host}:{node.port}/metrics'
+        try:
+            response = requests.get(url, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning(f'Failed scraping the metrics of node {node.index} from {url}: {str(e)}')
+            return None
+        values = parse_metrics(response.text, {HEAD_SERIES_METRIC, MEMORY_METRIC})
+        if HEAD_SERIES_METRIC not in values:
+            logger.warning(f'Node {node.index} does not expose {HEAD_SERIES_METRIC} at {url}')
+            return None
+        return NodeMetrics(node.index, values[HEAD_SERIES_METRIC], values.get(MEMORY_METRIC))
+
+    def calc_load(self, node: Node, metrics: NodeMetrics)->float:
+        """
+        Calculates the load of a node from its metrics, in the same scale as Node.load
+        """
+        load = metrics.head_series / node.capacity * 100
+        memory_limit = self.memory_limit
+        if node.capacity_class is not None and node.capacity_class.memory_reservation:
+            memory_limit = node.capacity_class.memory_reservation
+        if memory_limit and metrics.resident_memory_bytes is not None:
+            load = max(load, metrics.resident_memory_bytes / memory_limit * 100)
+        return load
+
+    def collect(self, nodes: list[Node])->dict[int, float]:
+        """
+        Measures the load of each node, by node index. Nodes that can't be scraped are left out, so they keep their last load
+        """
+        loads: dict[int, float] = dict()
+        for node in nodes:
+            metrics = self.scrape(node)
+            if metrics is not None:
+                loads[node.index] = self.calc_load(node, metrics)
+        logger.debug(f'Measured loads: {loads}')
+        return loads
@@ -1,14 +1,21 @@
 from .adt.binary_search_tree import BinarySearchTree
+from .adt.avl_tree import AVLTree
+from .adt.sorted_array import SortedArray
 from .target import Target
 from .service_discovery import ServiceDiscovery
-from .ring import Ring, KeyNotFoundError, KeyAlreadyExistsError
+from .ring import Ring, KeyNotFoundError, KeyAlreadyExistsError, ReshardingNotSupportedError, StaleReshardingPlanError
 from .swarm_orquestrator import SwarmOrquestrator
-from .api import API
+from .api import API, parse_targets
+from .load_collector import LoadCollector
 from .settings import Settings
+from .hash import set_hash_function
 from .log_config import LogConfig
+import asyncio
+import dataclasses
 import logging
 import logging.config
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 import uvicorn
 
@@ -18,7 +25,16 @@ log_configs = LogConfig(settings.log_level)
 logging.config.dictConfig(log_configs.get_logging_config())
 logger = logging.getLogger(__name__)
 
-bst = BinarySearchTree()
+set_hash_function(settings.ring_hash_function)
+match settings.ring_adt:
+    case 'avl':
+        adt = AVLTree()
+    case 'sorted_array':
+        adt = SortedArray()
+    case 'bst':
+        adt = BinarySearchTree()
+    case _:
+        raise ValueError(f'Ring data type {settings.ring_adt} is not mapped')
 ring = Ring(
     node_capacity=settings.node_capacity,
     node_min_load=settings.node_min_load,
@@ -30,10 +46,22 @@ ring = Ring(
     sd_refresh_interval=settings.sd_refresh_interval,
     node_scrape_interval=settings.node_scrape_interval,
     node_scrape_timeout=settings.node_scrape_timeout,
-    adt=bst,
+    adt=adt,
     metrics_database_url=settings.metrics_database_url,
     metrics_database_port=settings.metrics_database_port,
-    metrics_database_path=settings.metrics_database_path
+    metrics_database_path=settings.metrics_database_path,
+    vnode_count=settings.node_vnode_count,
+    placement_policy=settings.ring_placement_policy,
+    load_balance_factor=settings.ring_load_balance_factor,
+    split_strategy=settings.ring_split_strategy,
+    split_quantile=settings.ring_split_quantile,
+    scale_hysteresis=settings.ring_scale_hysteresis,
+    scale_cooldown=settings.ring_scale_cooldown,
+    scale_cooldown_operations=settings.ring_scale_cooldown_operations,
+    rebalance_threshold=settings.ring_rebalance_threshold,
+    lock_stripe_count=settings.ring_lock_stripe_count,
+    node_storage=settings.node_storage,
+    capacity_classes=settings.node_capacity_classes,
 )
 
 orquestrator = SwarmOrquestrator(settings.docker_prometheus_image, settings.docker_network)
@@ -41,33 +69,117 @@ if settings.sd_provider == 'consul':
     service_discovery = ServiceDiscovery(settings.sd_host, settings.sd_port)
 else:
     service_discovery = None
-api = API(ring, orquestrator, service_discovery)
+if settings.ring_load_collect_interval > 0:
+    load_collector = LoadCollector(settings.node_metrics_host, settings.node_memory_limit or None)
+else:
+    load_collector = None
+api = API(ring, orquestrator, service_discovery, load_collector)
 
 first_node = ring.node_zero             # The first node has to be created manually
 orquestrator.create_node(first_node)
 
 app = FastAPI()
+# The endpoints using the ring are sync, so FastAPI runs them in its threadpool: requests changing
+# different nodes run concurrently, and waiting for a ring lock doesn't block the event loop
+
+async def rebalance_periodically(interval: float):
+    """
+    Background rebalancing policy: evens the loads of adjacent nodes by moving their boundaries
+    """
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(api.rebalance)
+
+async def collect_loads_periodically(interval: float):
+    """
+    Load feedback: measures the loads of the prometheus nodes, splitting the ones above the maximum load.
+    The nodes are polled in a thread, so the requests don't block the API
+    """
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(api.collect_loads)
+
+@app.on_event("startup")
+async def start_rebalancing():
+    if settings.ring_rebalance_interval > 0:
+        asyncio.create_task(rebalance_periodically(settings.ring_rebalance_interval))
+
+@app.on_event("startup")
+async def start_load_collection():
+    if settings.ring_load_collect_interval > 0:
+        asyncio.create_task(collect_loads_periodically(settings.ring_load_collect_interval))
 
 @app.post("/register-target")
-async def register_target(target: Target):
+def register_target(target: Target):
     try:
         api.register_target(target)
         return {"message": "Target registered successfully!"}
     except KeyAlreadyExistsError as e:
         raise HTTPException(status_code=400, detail=f"Error registering target: id {target.id} already exists")
 
+@app.post("/register-targets")
+async def register_targets(request: Request):
+    """
+    Registers a batch of targets, sent as a JSON array or as NDJSON
+    """
+    try:
+        targets = parse_targets(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Error parsing targets: {e}")
+    try:
+        await run_in_threadpool(api.register_targets, targets)
+        return {"message": f"{len(targets)} targets registered successfully!"}
+    except KeyAlreadyExistsError as e:
+        raise HTTPException(status_code=400, detail=f"Error registering targets: {e}")
+
+@app.put("/update-target")
+def update_target(target: Target):
+    try:
+        api.update_target(target)
+        return {"message": "Target updated successfully!"}
+    except KeyNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Error updating target: ID {target.id} not found")
+
 @app.delete("/unregister-target")
-async def unregister_target(target_id: str):
+def unregister_target(target_id: str):
     try:
         api.unregister_target(target_id)
         return {"message": "Target unregistered successfully!"}
     except KeyNotFoundError as e:
         raise HTTPException(status_code=404, detail=f"Error deregistering instance: ID {target_id} not found")
 
+@app.delete("/unregister-targets")
+def unregister_targets(target_ids: list[str]):
+    """
+    Unregisters a batch of targets, sent as a JSON array of ids
+    """
+    try:
+        api.unregister_targets(target_ids)
+        return {"message": f"{len(target_ids)} targets unregistered successfully!"}
+    except KeyNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Error deregistering targets: {e}")
+
+@app.post("/reshard")
+def reshard(target_load: int | None = None, max_moved_keys: int | None = None, dry_run: bool = False):
+    """
+    Re-shards the ring to even loads, moving the fewest keys. With dry_run the plan is only returned
+    """
+    try:
+        plan = api.reshard(target_load, max_moved_keys, dry_run)
+        return JSONResponse(content=dataclasses.asdict(plan))
+    except ReshardingNotSupportedError as e:
+        raise HTTPException(status_code=400, detail=f"Error resharding: {e}")
+    except StaleReshardingPlanError as e:
+        raise HTTPException(status_code=409, detail=f"Error resharding: {e}")
+
 @app.get("/targets")
-async def get_targets():
+def get_targets():
     targets = api.build_targets_json()
     return JSONResponse(content=targets)
 
+@app.get("/stats")
+def get_stats():
+    return JSONResponse(content=ring.stats())
+
 if __name__ == '__main__':
     uvicorn.run(app, log_config=settings.logging_config, port=9988, host='0.0.0.0')
\ No newline at end of file
@@ -1,5 +1,11 @@
-from .target import Target
+from .target import TargetRecord
+from .capacity_class import CapacityClass
 from .hash import stable_hash
+from typing import Iterator, Mapping
+from types import MappingProxyType
+from sortedcontainers import SortedList
+from .selection import weighted_quantile_rank
+from itertools import accumulate
 import yaml
 import logging
 
@@ -33,14 +39,21 @@ class Node:
             metrics_database_url: str | None = None,
             metrics_database_port: int | None = None,
             metrics_database_path: str | None = None,
+            tokens: list[int] | None = None,        # Positions of the node in the ring. Defaults to its index
+            key_index: dict[str, tuple[int, 'Node']] | None = None,     # Ring-wide (hash, node) of each key, see Ring.key_index
+            capacity_class: CapacityClass | None = None,                # Size of the node. Its capacity replaces the capacity provided
         )-> None:
 
         self.index = index
-        self.capacity = capacity
+        self.tokens = tokens if tokens is not None else [index]
+        self.capacity = capacity_class.capacity if capacity_class is not None else capacity
+        self.capacity_class = capacity_class
         self.replica_count = replica_count
         self.ready = False                          # This will need an integration with orquestrator health checks
-        self.targets = dict()
-        self.keys_to_delete = list()
+        self._reset_storage()
+        self.version = 0                            # Incremented on every change of the targets, see Ring.snapshot
+        self.measured_load_per_weight: float | None = None      # Load measured on the prometheus instance per unit of weight, see measure_load
+        self.key_index = key_index
         self.scrape_interval = scrape_interval
         self.scrape_timeout = scrape_timeout
         if self._time_literal_to_secs(self.scrape_interval) < self._time_literal_to_secs(self.scrape_timeout):
@@ -58,11 +71,32 @@ class Node:
         self.metrics_database_port = metrics_database_port
         self.metrics_database_path = metrics_database_path
 
-    def insert(self, key: str, target: Target) -> None:
+    def _reset_storage(self)->None:
+        """
+        Empties the targets of the node
+        """
+        self.targets: dict[str, TargetRecord] = dict()
+        self.hashes: dict[str, int] = dict()       # Key hashes, computed once when the key is inserted
+        self.sorted_keys: SortedList = SortedList()     # (hash, key) pairs in hash order, so hash ranges are found by bisection
+        self.weight = 0                             # Sum of the expected series of the targets
+
+    def insert(self, key: str, target: TargetRecord, key_hash: int | None = None) -> None:
         """
         Inserts a node
+        The key hash is stored with the target, so the key is never hashed again. If not provided, it is calculated
         """
+        if key_hash is None:
+            key_hash = stable_hash(key)
+        if key in self.hashes:
+            self.sorted_keys.remove((self.hashes[key], key))
+            self.weight -= self.targets[key].expected_series
         self.targets[key] = target
+        self.weight += target.expected_series
+        self.hashes[key] = key_hash
+        self.sorted_keys.add((key_hash, key))
+        self.version += 1
+        if self.key_index is not None:
+            self.key_index[key] = (key_hash, self)
 
     def has_key(self, key: str) -> bool:
         """
@@ -70,7 +104,7 @@ class Node:
         """
         return key in self.targets
     
-    def get(self, key: str) -> Target | None:
+    def get(self, key: str) -> TargetRecord | None:
         """
         Searchs and returns the node.
         Returns None if not found
@@ -83,56 +117,246 @@ class Node:
         """
         Returns whether the node is full or not
         """
-        return len(self.targets) >= self.capacity
+        return self.load >= 100
     
-    def list_items(self)->list[Target]:
+    def list_items(self)->list[TargetRecord]:
         """
         Lists all targets from this node
         """
         return list(self.targets.values())
 
-    def delete(self, key: str) -> Target:
+    def list_keys(self)->list[tuple[str, TargetRecord]]:
+        """
+        Lists all (key, target) pairs from this node
+        """
+        return list(self.targets.items())
+
+    def iter_items(self)->Iterator[TargetRecord]:
+        """
+        Yields all targets from this node, without copying them to a list
+        """
+        return iter(self.targets.values())
+
+    def copy_targets(self)->Mapping[str, TargetRecord]:
+        """
+        Returns a read-only copy of the targets of the node by key
+        """
+        return MappingProxyType(dict(self.targets))
+
+    def delete(self, key: str) -> TargetRecord:
         """
         Deletes a target from the node.
         """
         if not self.has_key(key):
             # raise KeyNotFoundError(f'Key {key} not found')
             raise Exception(f'Key {key} not found')
-        return self.targets.pop(key)
+        self.sorted_keys.remove((self.hashes.pop(key), key))
+        self.version += 1
+        self._unindex(key)
+        target = self.targets.pop(key)
+        self.weight -= target.expected_series
+        return target
     
-    def update(self, key: str, new_target: Target) -> None:
+    def get_hash(self, key: str) -> int | None:
+        """
+        Returns the stored hash of a key, or None if the key is not in the node
+        """
+        return self.hashes.get(key)
+
+    def update(self, key: str, new_target: TargetRecord) -> None:
         """
         Updates the target of a key. Returns old object if update or None if didn't find
         This is problably not useful in this implementation
         """
+        if key not in self.hashes:
+            self.hashes[key] = stable_hash(key)
+            self.sorted_keys.add((self.hashes[key], key))
+            if self.key_index is not None:
+                self.key_index[key] = (self.hashes[key], self)
+        else:
+            self.weight -= self.targets[key].expected_series
         self.targets[key] = new_target
+        self.weight += new_target.expected_series
+        self.version += 1
     
-    def export_keys(self, other_node: 'Node', first_key_hash: int = -1)->None:
+    def export_keys(self, other_node: 'Node', first_key_hash: int = -1, last_key_hash: int | None = None)->None:
         """
         Exports all instances with hash equal or greater than first_key_hash to another node
         If no fist_key_hash is provided, exports all keys to the other node
+        If last_key_hash is provided, only the keys with hash smaller than it are exported
+        Only the keys exported are visited, found by bisection of the sorted keys
         """
-        for key, target in self.targets.items():
-            if stable_hash(key) >= first_key_hash:
-                other_node.insert(key, target)     # Import and delete the key from the other node
-                self.keys_to_delete.append(key)
-        self.clean_keys()
+        first_position, last_position = self._range_positions(first_key_hash, last_key_hash)
+        self._export_positions(other_node, first_position, last_position)
+        self._delete_positions(first_position, last_position)
 
-    def clean_keys(self)->None:
+    def export_keys_many(self, other_nodes: list['Node'], first_key_hashes: list[int], last_key_hash: int | None = None)->None:
         """
-        Removes keys sent to other node
+        Exports the keys to many nodes in a single pass. Each node receives the keys with hash equal or greater
+        than its first key hash and smaller than the next one, or than last_key_hash for the last node.
+        The first key hashes must be sorted
         """
-        for key in self.keys_to_delete:
-            self.delete(key)
-        self.keys_to_delete = list()
+        if not first_key_hashes:
+            return
+        last_position = self._range_positions(first_key_hashes[0], last_key_hash)[1]
+        bounds = [min(self._range_positions(first_key_hash, last_key_hash)[0], last_position) for first_key_hash in first_key_hashes]
+        bounds.append(last_position)
+        for other_node, first_position, next_position in zip(other_nodes, bounds, bounds[1:]):
+            self._export_positions(other_node, first_position, next_position)
+        self._delete_positions(bounds[0], bounds[-1])
 
-    def calc_mid_hash(self)->int:
+    def keys_in_range(self, first_key_hash: int, last_key_hash: int | None)->list[str]:
         """
-        Calculates the mean hash of all of the node
+        Returns the keys with hash equal or greater than first_key_hash and smaller than last_key_hash, in hash order
+        """
+        first_position, last_position = self._range_positions(first_key_hash, last_key_hash)
+        return [key for key_hash, key in self.sorted_keys.islice(first_position, last_position)]
+
+    def split_at(self, key_hash: int, index: int, last_key_hash: int | None = None, tokens: list[int] | None = None, port: int | None = None)->'Node':
+        """
+        Creates a node with the same configuration, that takes the keys with hash equal or greater than key_hash
+        (and smaller than last_key_hash, if provided). The targets are moved to it, not copied
+        """
+        new_node = type(self)(
+            index=index,
+            capacity=self.capacity,
+            sd_provider=self.sd_provider,
+            port=port,
+            sd_host=self.sd_host,
+            sd_port=self.sd_port,
+            scrape_interval=self.scrape_interval,
+            scrape_timeout=self.scrape_timeout,
+            sd_refresh_interval=self.sd_refresh_interval,
+            replica_count=self.replica_count,
+            metrics_database_url=self.metrics_database_url,
+            metrics_database_port=self.metrics_database_port,
+            metrics_database_path=self.metrics_database_path,
+            tokens=tokens,
+            key_index=self.key_index,
+            capacity_class=self.capacity_class,
+        )
+        new_node.measured_load_per_weight = self.measured_load_per_weight      # The targets moved keep their measured series
+        self.export_keys(new_node, key_hash, last_key_hash)
+        return new_node
+
+    def pop_all(self)->list[tuple[str, TargetRecord]]:
+        """
+        Removes all targets from the node, returning them as (key, target) pairs
+        """
+        items = self.list_keys()
+        for key, target in items:
+            self._unindex(key)
+        self._reset_storage()
+        self.version += 1
+        return items
+
+    def calc_mid_hash(self, first_key_hash: int = -1, last_key_hash: int | None = None)->int:
+        """
+        Calculates the mean hash of all of the node, weighted by the expected series of each target
         A Future discussion if this is the best way to calculate the median instead.
+        If a hash range is provided, only the keys inside it are considered
         """
-        return sum([stable_hash(key) for key in self.targets.keys()]) // len(self.targets.keys())
-    
+        hashes = self.range_hashes(first_key_hash, last_key_hash)
+        if len(hashes) == 0:
+            return first_key_hash
+        weights = self.range_weights(first_key_hash, last_key_hash)
+        return sum(key_hash * weight for key_hash, weight in zip(hashes, weights)) // sum(weights)
+
+    def calc_split_hash(self, quantile: float = 0.5, first_key_hash: int = -1, last_key_hash: int | None = None)->int:
+        """
+        Calculates the hash at the weighted quantile of the node keys, so exporting the keys from it on
+        moves 1 - quantile of the expected series. The keys are kept sorted, so no selection is needed.
+        If a hash range is provided, only the keys inside it are considered
+        """
+        hashes = self.range_hashes(first_key_hash, last_key_hash)
+        if len(hashes) == 0:
+            return first_key_hash
+        cumulative_weights = list(accumulate(self.range_weights(first_key_hash, last_key_hash)))
+        return hashes[weighted_quantile_rank(cumulative_weights, quantile)]
+
+    def calc_split_hashes(self, count: int, first_key_hash: int = -1, last_key_hash: int | None = None)->list[int]:
+        """
+        Calculates the hashes that split the node keys in count parts with about the same expected series, i.e. its
+        hashes at the weighted quantiles 1/count, 2/count, ... The hashes are read in order from the sorted keys.
+        Returns them in order and without repetitions, so there may be less than count - 1 hashes.
+        If a hash range is provided, only the keys inside it are considered
+        """
+        hashes = self.range_hashes(first_key_hash, last_key_hash)
+        cumulative_weights = list(accumulate(self.range_weights(first_key_hash, last_key_hash)))
+        split_hashes = []
+        for part in range(1, count):
+            if len(hashes) == 0:
+                break
+            split_hash = hashes[weighted_quantile_rank(cumulative_weights, part / count)]
+            if split_hash > first_key_hash and (len(split_hashes) == 0 or split_hash > split_hashes[-1]):
+                split_hashes.append(split_hash)
+        return split_hashes
+
+    def range_hashes(self, first_key_hash: int, last_key_hash: int | None)->list[int]:
+        """
+        Returns the stored hashes of the keys of the node inside a hash range, sorted
+        """
+        first_position, last_position = self._range_positions(first_key_hash, last_key_hash)
+        return [key_hash for key_hash, key in self.sorted_keys.islice(first_position, last_position)]
+
+    def range_weights(self, first_key_hash: int, last_key_hash: int | None)->list[int]:
+        """
+        Returns the expected series of the targets of the node inside a hash range, in the order of range_hashes
+        """
+        first_position, last_position = self._range_positions(first_key_hash, last_key_hash)
+        return [self.targets[key].expected_series for key_hash, key in self.sorted_keys.islice(first_position, last_position)]
+
+    def calc_range_mid_hashes(self, ranges: list[tuple[int, int | None]], quantile: float = 0.5)->list[int]:
+        """
+        Calculates the weighted median (or the provided quantile) hash of each of the hash ranges the node owns, i.e. the keys
+        between each of its tokens and the next token of the ring, provided as (first_key_hash, last_key_hash).
+        The hashes are sorted from the most to the least loaded range. Ranges with a single key can't be split.
+        """
+        range_keys = []
+        for first_key_hash, last_key_hash in sorted(ranges):
+            cumulative_weights = list(accumulate(self.range_weights(first_key_hash, last_key_hash)))
+            range_keys.append((first_key_hash, self.range_hashes(first_key_hash, last_key_hash), cumulative_weights))
+        mid_hashes = []
+        for first_key_hash, hashes, cumulative_weights in sorted(range_keys, key=lambda item: item[2][-1] if item[2] else 0, reverse=True):
+            if len(hashes) == 0:
+                continue
+            mid_hash = hashes[weighted_quantile_rank(cumulative_weights, quantile)]
+            if mid_hash > first_key_hash:
+                mid_hashes.append(mid_hash)
+        return mid_hashes
+
+    def _range_positions(self, first_key_hash: int, last_key_hash: int | None)->tuple[int, int]:
+        """
+        Returns the first and the last (exclusive) positions of the sorted keys with hashes inside a hash range
+        """
+        first_position = self.sorted_keys.bisect_left((first_key_hash,))
+        last_position = len(self.sorted_keys) if last_key_hash is None else self.sorted_keys.bisect_left((last_key_hash,))
+        return first_position, max(first_position, last_position)
+
+    def _export_positions(self, other_node: 'Node', first_position: int, last_position: int)->None:
+        for key_hash, key in self.sorted_keys.islice(first_position, last_position):
+            other_node.insert(key, self.targets[key], key_hash)         # Import the key, it is deleted from this node afterwards
+
+    def _delete_positions(self, first_position: int, last_position: int)->None:
+        """
+        Deletes the keys between two positions of the sorted keys at once
+        """
+        if first_position >= last_position:
+            return
+        for key_hash, key in self.sorted_keys.islice(first_position, last_position):
+            self.weight -= self.targets.pop(key).expected_series
+            del self.hashes[key]
+            self._unindex(key)
+        del self.sorted_keys[first_position:last_position]
+        self.version += 1
+
+    def _unindex(self, key: str)->None:
+        """
+        Removes a key from the ring index, unless it was already moved to another node
+        """
+        if self.key_index is not None and self.key_index.get(key, (None, None))[1] is self:
+            del self.key_index[key]
+
     # def __str__(self) -> str:
     #     base_str = []
     #     for key, target in self.targets.items():
@@ -166,9 +390,37 @@ class Node:
     @property
     def load(self) -> int:
         """
-        Calculates the load of the node. Value ranges from 0 to 100
+        Calculates the load of the node, i.e. its expected series relative to its capacity. Value ranges from 0 to 100
+        Once the load is measured on its prometheus instance, the measured load is used instead, scaled by the weight
+        that entered or left the node since the measure
+        """
+        if self.measured_load_per_weight is not None:
+            return int(self.weight * self.measured_load_per_weight)
+        return int(self.weight / self.capacity * 100)
+
+    def set_capacity_class(self, capacity_class: CapacityClass)->None:
+        """
+        Resizes the node. A measured load is scaled to the new capacity
+        """
+        if self.measured_load_per_weight is not None:
+            self.measured_load_per_weight *= self.capacity / capacity_class.capacity
+        self.capacity = capacity_class.capacity
+        self.capacity_class = capacity_class
+        self.version += 1
+
+    def measure_load(self, measured_load: float)->None:
+        """
+        Sets the load measured on the prometheus instance of the node, e.g. from its head series.
+        It is kept relative to the weight of the node, so it follows the targets moved by later splits and merges
+        A measure of zero, e.g. from an instance not scraped yet, is ignored and the previous estimate is kept
         """
-        return int(len(self.targets.keys()) / self.capacity * 100)
+        if self.weight == 0:
+            self.measured_load_per_weight = None
+        elif measured_load > 0:
+            self.measured_load_per_weight = measured_load / self.weight
+        else:
+            return
+        self.version += 1
     
     # Prometheus specific functions
     def set_node_ready(self) -> None:
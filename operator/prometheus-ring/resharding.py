@@ -0,0 +1,165 @@
+import numpy as np
+from dataclasses import dataclass, field
+
+@dataclass
+class ReshardingStep:
+    """
+    One change of the ring topology.
+    action is 'move' (the node token moves to new_token), 'split' (a node is created at new_token)
+    or 'merge' (the node is removed). moved_keys is the number of keys changing of node
+    """
+    action: str
+    node_index: int | None
+    token: int | None
+    new_token: int | None
+    moved_keys: int
+
+@dataclass
+class ReshardingPlan:
+    """
+    Steps taking the ring from its current boundaries to the ideal ones, in ring order
+    """
+    steps: list[ReshardingStep] = field(default_factory=list)
+    moved_keys: int = 0
+    node_count: int = 0                         # Nodes after the plan is applied
+    generation: int | None = None               # Ring generation the plan was made at
+
+def ideal_boundaries(hashes: np.ndarray, node_count: int, weights: np.ndarray | None = None)->np.ndarray:
+    """
+    Calculates the boundaries that split the hashes in node_count evenly sized ranges, i.e. the hashes at
+    the quantiles 1/node_count, 2/node_count, ... The first boundary is always 0, the token of node zero.
+    Uses partial sorting to select the quantiles. Repeated boundaries are removed.
+    If the weights of the hashes are provided, the hashes must be sorted and the quantiles are weighted:
+    each boundary is the first hash after which the ranges before it hold their share of the total weight
+    """
+    if weights is None:
+        ranks = np.arange(1, node_count) * len(hashes) // node_count
+        boundaries = np.partition(hashes, ranks)[ranks] if len(ranks) > 0 else np.empty(0, dtype=hashes.dtype)
+    else:
+        cumulative_weights = np.concatenate(([0], np.cumsum(weights)))
+        ranks = np.searchsorted(cumulative_weights, np.arange(1, node_count) * cumulative_weights[-1] / node_count)
+        boundaries = hashes[np.minimum(ranks, len(hashes) - 1)] if len(hashes) > 0 else np.empty(0, dtype=hashes.dtype)
+    boundaries = np.unique(boundaries)
+    return np.concatenate((np.zeros(1, dtype=hashes.dtype), boundaries[boundaries > 0]))
+
+def plan_resharding(
+        hashes: np.ndarray,
+        tokens: list[tuple[int, int]],
+        target_count: int,
+        max_moved_keys: int | None = None,
+        weights: np.ndarray | None = None,
+    )->ReshardingPlan:
+    """
+    Plans the migration of a ring to boundaries at even quantiles of its key hashes, so every node
+    ends up with about target_count keys. tokens are the (token, node index) pairs of the ring, sorted,
+    the first one being node zero at 0.
+    If the weights (expected series) of the keys are provided, the quantiles are weighted and every node
+    ends up with about target_count series instead.
+    The current nodes are matched to the ideal boundaries in order, minimizing the keys that change of node:
+    moving a boundary moves the keys between the old and the new token, merging a node moves all of its keys
+    and splitting moves the keys of the new range. If max_moved_keys is provided, only the longest prefix of
+    the plan (in ring order) moving up to that many keys is kept, and the rest of the ring is left as is
+    """
+    if weights is None:
+        sorted_hashes, sorted_weights = np.sort(hashes), None
+        total_weight = len(sorted_hashes)
+    else:
+        order = np.argsort(hashes, kind='stable')
+        sorted_hashes, sorted_weights = hashes[order], weights[order]
+        total_weight = int(sorted_weights.sum())
+    key_count = len(sorted_hashes)
+    ideal_count = max(1, -(-total_weight // max(target_count, 1)))
+    boundaries = ideal_boundaries(sorted_hashes, ideal_count, sorted_weights)
+    current_tokens = np.array([token for token, index in tokens], dtype=sorted_hashes.dtype)
+
+    current_ranks = np.searchsorted(sorted_hashes, current_tokens).astype(np.int64)
+    ideal_ranks = np.searchsorted(sorted_hashes, boundaries).astype(np.int64)
+    current_sizes = np.diff(np.append(current_ranks, key_count))           # Cost of merging each node
+    ideal_sizes = np.diff(np.append(ideal_ranks, key_count))               # Cost of each split
+    costs, choices = _align(current_ranks, ideal_ranks, current_sizes, ideal_sizes)
+
+    path = _backtrack(costs, choices, len(boundaries) - 1, len(current_tokens) - 1)
+    steps: list[tuple[ReshardingStep | None, int | None]] = []         # Each step with the first current token after it
+    next_current_token = tokens[1][0] if len(tokens) > 1 else None
+    for action, ideal, current in path:
+        if action == 'match':
+            token, node_index = tokens[current]
+            new_token = int(boundaries[ideal])
+            moved_keys = abs(int(current_ranks[current]) - int(ideal_ranks[ideal]))
+            step = ReshardingStep('move', node_index, token, new_token, moved_keys) if new_token != token else None
+        elif action == 'merge':
+            token, node_index = tokens[current]
+            step = ReshardingStep('merge', node_index, token, None, int(current_sizes[current]))
+        else:
+            step = ReshardingStep('split', None, None, int(boundaries[ideal]), int(ideal_sizes[ideal]))
+        if current is not None:
+            next_current_token = tokens[current + 1][0] if current + 1 < len(tokens) else None
+        steps.append((step, next_current_token))
+
+    plan = ReshardingPlan()
+    total_moved_keys = sum(step.moved_keys for step, next_current_token in steps if step is not None)
+    for step, next_current_token in steps:
+        if step is None:
+            continue
+        if max_moved_keys is not None and total_moved_keys > max_moved_keys:
+            if plan.moved_keys + step.moved_keys > max_moved_keys:
+                break
+            if step.new_token is not None and next_current_token is not None and step.new_token >= next_current_token:
+                break                   # The rest of the ring is kept as is, so the steps can't reach its first token
+        plan.steps.append(step)
+        plan.moved_keys += step.moved_keys
+
+    splits = sum(1 for step in plan.steps if step.action == 'split')
+    merges = sum(1 for step in plan.steps if step.action == 'merge')
+    plan.node_count = len(tokens) + splits - merges
+    return plan
+
+def _align(
+        current_ranks: np.ndarray,
+        ideal_ranks: np.ndarray,
+        current_sizes: np.ndarray,
+        ideal_sizes: np.ndarray,
+    )->tuple[np.ndarray, np.ndarray]:
+    """
+    Aligns the current boundaries with the ideal ones, as an edit distance: a current boundary matches an ideal one
+    at the cost of the keys between them, is merged at the cost of its keys, or an ideal boundary is split at the
+    cost of its keys. The first boundaries (node zero) always match.
+    Each row is solved with vectorized operations: the merges of a row are a running minimum over the cumulative sizes.
+    Returns the cost matrix and the choices, 0 for match, 1 for split and 2 for merge
+    """
+    ideal_count, current_count = len(ideal_ranks), len(current_ranks)
+    merge_sums = np.concatenate(([0], np.cumsum(current_sizes[1:])))      # Cost of merging the current nodes 1..j
+    costs = np.empty((ideal_count, current_count), dtype=np.int64)
+    choices = np.empty((ideal_count, current_count), dtype=np.int8)
+    costs[0] = merge_sums
+    choices[0] = 2
+    choices[0, 0] = 0
+    for ideal in range(1, ideal_count):
+        match_costs = np.full(current_count, np.iinfo(np.int64).max // 2, dtype=np.int64)
+        match_costs[1:] = costs[ideal - 1, :-1] + np.abs(current_ranks[1:] - ideal_ranks[ideal])
+        split_costs = costs[ideal - 1] + ideal_sizes[ideal]
+        best = np.minimum(match_costs, split_costs)
+        row = merge_sums + np.minimum.accumulate(best - merge_sums)
+        costs[ideal] = row
+        choices[ideal] = np.where(row < best, 2, np.where(match_costs <= split_costs, 0, 1))
+    return costs, choices
+
+def _backtrack(costs: np.ndarray, choices: np.ndarray, ideal: int, current: int)->list[tuple[str, int | None, int | None]]:
+    """
+    Returns the (action, ideal boundary, current boundary) steps of the alignment, in ring order, without the
+    match of node zero
+    """
+    path = []
+    while ideal > 0 or current > 0:
+        choice = choices[ideal, current]
+        if choice == 0:
+            path.append(('match', ideal, current))
+            ideal, current = ideal - 1, current - 1
+        elif choice == 1:
+            path.append(('split', ideal, None))
+            ideal -= 1
+        else:
+            path.append(('merge', None, current))
+            current -= 1
+    path.reverse()
+    return path
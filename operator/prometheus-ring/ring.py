@@ -1,10 +1,24 @@
 from .adt.abstract_data_type import AbstractDataType
 from .node import Node
-from .hash import stable_hash
-from .target import Target
+from .columnar_node import ColumnarNode
+from .hash import stable_hash, set_hash_function, hash_space
+from .target import Target, TargetRecord, LabelSets
+from .capacity_class import CapacityClass
+from .resharding import ReshardingPlan, plan_resharding
+from .rwlock import ReadWriteLock
+from .snapshot import NodeSnapshot, RingSnapshot
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Iterator
+from contextlib import contextmanager
+from types import MappingProxyType
+from dataclasses import dataclass, field
+import time
 import threading
+import math
 import uuid
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +31,67 @@ class KeyNotFoundError(Exception):
 class KeyAlreadyExistsError(Exception):
     ...
 
+class NodeAlreadyExistsError(Exception):
+    ...
+
+class InvalidPlacementPolicyError(Exception):
+    ...
+
+class InvalidSplitStrategyError(Exception):
+    ...
+
+class InvalidNodeStorageError(Exception):
+    ...
+
+class ReshardingNotSupportedError(Exception):
+    ...
+
+class StaleReshardingPlanError(Exception):
+    ...
+
+@dataclass
+class RebalanceReport:
+    """
+    Keys moved by a rebalance between two adjacent nodes
+    """
+    left_index: int
+    right_index: int
+    moved_keys: int = 0
+    token_moves: list[tuple[int, int]] = field(default_factory=list)      # (token, new token) of the right node
+
 class Ring:
+    """
+    Consistent hash table of prometheus nodes.
+    Loads are measured in expected series: each target weights its expected_series (1 by default),
+    and node_capacity is the number of series a node holds at 100% load.
+    Placement policies:
+        split: a target always goes to the node owning its hash, which splits as soon as it passes node_max_load
+        bounded_load: a target spills clockwise to the next node if its owner is above load_balance_factor
+            times the mean load. Nodes only split when the whole ring is above node_max_load
+    Split strategies:
+        mean: the new node starts at the mean hash of the split node keys, weighted by their expected series
+        quantile: the new node starts at the split_quantile hash of the split node keys, 0.5 being the weighted median.
+            Skewed keys still split in the asked proportion
+    Capacity classes:
+        without capacity_classes, every node holds node_capacity series. With them, nodes start in the smallest class,
+        and each node taking part in a split gets the smallest class that keeps it halfway between node_min_load and
+        node_max_load (the largest class if none does). Split nodes are only resized up, see pop_resized_nodes
+    Node storages:
+        dict: each node keeps a dict of target records by key
+        columnar: each node keeps parallel columns sorted by key hash, so splits export slices of rows
+    Scale decisions:
+        hysteresis: a node that received the keys of a merge only splits above node_max_load + scale_hysteresis,
+            and a node created or relieved by a split only merges at node_min_load - scale_hysteresis
+        cool-down: a node that split or received a merge is not scaled again for scale_cooldown seconds
+            nor scale_cooldown_operations inserts and deletes, unless it is full. Suppressed events are counted
+    Concurrency:
+        ring_lock is a readers-writer lock over the topology. Inserts and deletes hold its read side and the
+        lock stripe of their node, so the ones landing on different stripes run concurrently. Splits, merges,
+        batches and rebalances hold its write side
+    """
+    placement_policies = ('split', 'bounded_load')
+    split_strategies = ('mean', 'quantile')
+    node_storages = ('dict', 'columnar')
     def __init__(
             self,
             node_capacity: int,
@@ -35,8 +109,21 @@ class Ring:
             metrics_database_url: str | None = None,
             metrics_database_port: int | None = None,
             metrics_database_path: str | None = None,
+            vnode_count: int = 1,               # Number of tokens each node owns in the ring
+            placement_policy: str = 'split',
+            load_balance_factor: float = 1.25,  # Bounded load: maximum load of a node relative to the mean load
+            split_strategy: str = 'mean',
+            split_quantile: float = 0.5,        # Quantile split: fraction of the keys that stays in the split node
+            scale_hysteresis: int = 0,          # Load points (%) added to the thresholds that would undo the last scale event
+            scale_cooldown: float = 0,          # Seconds after a scale event in which the node is not scaled again
+            scale_cooldown_operations: int = 0, # Inserts and deletes after a scale event in which the node is not scaled again
+            rebalance_threshold: int = 20,      # Load points (%) of difference between adjacent nodes that triggers a rebalance
+            lock_stripe_count: int = 64,        # Locks shared by the nodes, so inserts and deletes in different nodes run concurrently
+            node_storage: str = 'dict',         # dict of target records, or columns sorted by hash (see ColumnarNode)
+            capacity_classes: list[CapacityClass] | None = None,   # Node sizes. The smallest one replaces node_capacity
         )->None:
-        self.node_capacity = node_capacity
+        self.capacity_classes = sorted(capacity_classes or [], key=lambda capacity_class: capacity_class.capacity)
+        self.node_capacity = self.capacity_classes[0].capacity if self.capacity_classes else node_capacity
         self.node_min_load = node_min_load
         self.node_max_load = node_max_load
         self.node_replica_count = node_replica_count
@@ -51,121 +138,487 @@ class Ring:
         self.metrics_database_url = metrics_database_url
         self.metrics_database_port = metrics_database_port
         self.metrics_database_path = metrics_database_path
+        self.vnode_count = vnode_count
+        if placement_policy not in self.placement_policies:
+            raise InvalidPlacementPolicyError(f'Placement policy {placement_policy} is not mapped')
+        self.placement_policy = placement_policy
+        self.load_balance_factor = load_balance_factor
+        if split_strategy not in self.split_strategies:
+            raise InvalidSplitStrategyError(f'Split strategy {split_strategy} is not mapped')
+        self.split_strategy = split_strategy
+        self.split_quantile = split_quantile
+        if node_storage not in self.node_storages:
+            raise InvalidNodeStorageError(f'Node storage {node_storage} is not mapped')
+        self.node_storage = node_storage
+        self.split_count = 0
+        self.merge_count = 0
+        self.scale_hysteresis = scale_hysteresis
+        self.scale_cooldown = scale_cooldown
+        self.scale_cooldown_operations = scale_cooldown_operations
+        self.suppressed_split_count = 0
+        self.suppressed_merge_count = 0
+        self.operation_count = 0
+        self.rebalance_threshold = rebalance_threshold
+        self.rebalance_count = 0
+        self.rebalanced_key_count = 0
+        self.scale_events: dict[int, tuple[str, float, int]] = dict()   # Last scale event of each node: (event, time, operation)
+        self.target_count = 0
+        self.key_index: dict[str, tuple[int, Node]] = dict()  # Hash and node of every key, kept by the nodes as keys move
+        self.label_sets = LabelSets()                           # Label sets shared by the records of the ring
+        self.resized_nodes: dict[int, Node] = dict()    # Nodes of the ring whose capacity class changed, see pop_resized_nodes
         
         self.ring = adt
-        self.ring_lock = threading.Lock()
+        self.nodes: dict[int, Node] = dict()           # Nodes by index. With vnodes, a node appears many times in the ADT
+        self.ring_lock = ReadWriteLock()             # Reads share the lock, mutations hold it alone
+        self.generation = 0                         # Incremented by every mutation of the ring
+        self.snapshot_lock = threading.Lock()
+        self.node_locks = [threading.Lock() for _ in range(lock_stripe_count)]     # Lock stripes, by node index
+        self.counter_lock = threading.Lock()
+        self.last_snapshot: RingSnapshot | None = None
+        self.node_snapshots: dict[int, tuple[Node, NodeSnapshot]] = dict()     # Last snapshot of each node, shared until it changes
 
         """
         Creating node zero. It can not be deleted.
         """
-        self.node_zero = Node(
-            index=0,
-            capacity=node_capacity,
-            sd_provider=self.sd_provider,
-            sd_host=self.sd_host,
-            sd_port=self.sd_port,
-            replica_count=self.node_replica_count,
-            sd_refresh_interval=self.sd_refresh_interval,
-            scrape_interval=self.node_scrape_interval,
-            scrape_timeout=self.node_scrape_timeout,
-            metrics_database_url=self.metrics_database_url,
-            metrics_database_port=self.metrics_database_port,
-            metrics_database_path=self.metrics_database_path,
-            port=self.node_base_ports + self.node_count
-            # TODO: Make an more versitile way to set the port
-            )
-        self.node_count += 1
-        self.ring.insert(0, self.node_zero)
+        node_zero_tokens = [0] + [self._vnode_token(0, replica) for replica in range(1, self.vnode_count)]
+        self.node_zero = self._create_node(index=0, tokens=node_zero_tokens)
+        for token in self.node_zero.tokens:
+            self.ring.insert(token, self.node_zero)
 
     def insert(self, target: Target, key: str | None = None)->None | Node:
         """
         Insert an target in the ring. If Ring scaled up, returns the node
         If a node reaches it's maximum load, a new node will be instanciated
-        and the targets will be redistribuited
+        and the targets will be redistribuited.
+        Only the lock stripe of the node is held while inserting, the topology lock is only taken to split it
         """
         if key is None:
             key = str(uuid.uuid4())
-        # Checking for duplicated keys. Current implementations does not support it
-        node_to_search = self._find_node(stable_hash(key))
-        if node_to_search.has_key(key):
-            raise KeyAlreadyExistsError(f'Key {key} already exists')
-        
         key_hash = stable_hash(key)
-        with self.ring_lock:
+        record = TargetRecord.from_target(target, self.label_sets)
+        if self.placement_policy == 'bounded_load':
+            return self._insert_bounded(record, key, key_hash)
+        with self.ring_lock.read():
             node_to_insert: Node = self._find_node(key_hash)
-            logger.debug(f'Inserting {target} into node {node_to_insert}')
+            with self._node_lock(node_to_insert):
+                # Checking for duplicated keys. Current implementations does not support it
+                if key in self.key_index:
+                    self.label_sets.release(record.labels)
+                    raise KeyAlreadyExistsError(f'Key {key} already exists')
+                logger.debug(f'Inserting {record} into node {node_to_insert.index}')
+                node_to_insert.insert(key, record, key_hash)
+                overloaded = node_to_insert.load > self.node_max_load
+            self._count_operation(1)
+        if not overloaded:
+            return None
+
+        with self._mutating():
+            # Other operations may have split the node since the stripe was released
+            if not self._is_live(node_to_insert) or not self._should_split(node_to_insert):
+                return None
+            logger.info(f'Node {node_to_insert.index} is full: scaling up the ring')
+            return self._split_node(node_to_insert)
+
+    def _insert_bounded(self, record: TargetRecord, key: str, key_hash: int)->None | Node:
+        """
+        Bounded load insertion. The placement reads the loads of many nodes, so it holds the topology lock
+        """
+        with self._mutating():
+            # Checking for duplicated keys. Current implementations does not support it
+            if key in self.key_index:
+                self.label_sets.release(record.labels)
+                raise KeyAlreadyExistsError(f'Key {key} already exists')
+
+            node_to_insert = self._find_bounded_node(key_hash, record.expected_series)      # The key may spill from the node owning its hash
+            logger.debug(f'Inserting {record} into node {node_to_insert.index}')
             
-            node_to_insert.insert(key, target)
+            node_to_insert.insert(key, record, key_hash)
+            self.target_count += 1
+            self.operation_count += 1
 
-            if node_to_insert.load > self.node_max_load:                           # Detection if made after deletion to ensure it scales up at the right time
+            if self._should_split(node_to_insert):                                 # Detection if made after deletion to ensure it scales up at the right time
+                # With bounded loads, a node is only overloaded if no other node could take the target
                 logger.info(f'Node {node_to_insert.index} is full: scaling up the ring')
                 new_node = self._split_node(node_to_insert)
                 return new_node
             return None
 
+    def insert_many(self, targets: list[Target], keys: list[str] | None = None)->list[Node]:
+        """
+        Inserts a batch of targets under a single lock acquisition. Returns the nodes created.
+        The keys are hashed once, sorted and placed in their nodes without splitting any of them.
+        The splits are only calculated at the end, once every target is placed.
+        If any key already exists, no target is inserted
+        """
+        if keys is None:
+            keys = [str(uuid.uuid4()) for _ in targets]
+        batch = sorted(zip(map(stable_hash, keys), keys, targets), key=lambda item: item[0])
+        with self._mutating():
+            batch_keys = set()
+            for key_hash, key, target in batch:
+                if key in batch_keys or key in self.key_index:
+                    raise KeyAlreadyExistsError(f'Key {key} already exists')
+                batch_keys.add(key)
+            owners: list[Node] = self.ring.find_many([key_hash + 1 for key_hash, key, target in batch])
+
+            overloaded_nodes: dict[int, Node] = dict()
+            for (key_hash, key, target), owner in zip(batch, owners):
+                record = TargetRecord.from_target(target, self.label_sets)
+                node_to_insert = owner
+                if self.placement_policy == 'bounded_load':
+                    node_to_insert = self._find_bounded_node(key_hash, record.expected_series)
+                node_to_insert.insert(key, record, key_hash)
+                self.target_count += 1
+                if node_to_insert.load > self.node_max_load:
+                    overloaded_nodes[node_to_insert.index] = node_to_insert
+            self.operation_count += len(batch)
+            logger.debug(f'Inserted {len(batch)} targets, {len(overloaded_nodes)} nodes overloaded')
+            return self._split_overloaded_nodes([node for node in overloaded_nodes.values() if self._should_split(node)])
+
     def get(self, key: str)->Target:
         """
         Returns the target of the key. Raises an exception if not found
         """
-        key_hash = stable_hash(key)
-        node_set_to_search: Node = self._find_node(key_hash)
-        if not node_set_to_search.has_key(key):
-            raise KeyNotFoundError(f'Key {key} not found')
-        return node_set_to_search.get(key)
+        with self.ring_lock.read():
+            node = self._get_target_node(key)
+            with self._node_lock(node):                 # Striped inserts and deletes may be changing the node
+                record = node.get(key)
+            if record is None:
+                raise KeyNotFoundError(f'Key {key} not found')
+            return record.to_target()
 
     def get_target_node(self, key: str)->Node:
         """
-        Returns the node a target belongs to
+        Returns the node a target belongs to.
+        Looked up in the key index: the key is not hashed and the ring is not searched
         """
-        key_hash = stable_hash(key)
-        node_set_to_search: Node = self._find_node(key_hash)
-        if not node_set_to_search.has_key(key):
-            raise KeyNotFoundError(f'Key {key} not found')
-        return node_set_to_search
+        with self.ring_lock.read():
+            node = self._get_target_node(key)
+            with self._node_lock(node):                 # Striped deletes may be removing the key
+                if not node.has_key(key):
+                    raise KeyNotFoundError(f'Key {key} not found')
+            return node
 
-    def update(self, key: str, new_target: Target)->None:
+    def has_key(self, key: str)->bool:
         """
-        Updates the Target of a key. Returns old object if update or None if didn't find
-        Probly not useful in this implementation
+        Returns True if the key is in the ring
         """
-        with self.ring_lock:
-            key_hash = stable_hash(key)
-            node_set_to_search: Node = self._find_node(key_hash)
-            if not node_set_to_search.has_key(key):
-                raise KeyNotFoundError(f'Key {key} not found')
-            return node_set_to_search.update(key, new_target)
+        return key in self.key_index
+
+    def update(self, key: str, new_target: Target)->None | Node:
+        """
+        Updates the Target of a key.
+        If its expected series grow past the maximum load of the node, the node is split as on insert. Returns the new node, if any
+        """
+        with self._mutating():
+            node = self._get_target_node(key)
+            old_labels = node.get(key).labels
+            old_weight = node.weight
+            node.update(key, TargetRecord.from_target(new_target, self.label_sets))
+            self.label_sets.release(old_labels)
+            if node.weight > old_weight and self._should_split(node):
+                logger.info(f'Node {node.index} is full: scaling up the ring')
+                return self._split_node(node)
+            return None
         
     def delete(self, key: str)->None | Node:
         """
         Deletes a target from the ring.
-        If node reachs it's minimum load, it will be removed from the ring
+        If node reachs it's minimum load, it will be removed from the ring.
+        Only the lock stripe of the node is held while deleting, the topology lock is only taken to merge it
         """
-        key_hash = stable_hash(key)
-        with self.ring_lock:
-            node_to_search: Node = self._find_node(key_hash)
-            logger.debug(f'Deleting key {key} {key_hash} from node {node_to_search.index}')
-            if not node_to_search.has_key(key):
+        with self.ring_lock.read():
+            node_to_search = self._locate(key)
+            if node_to_search is None:
                 raise KeyNotFoundError(f'Key {key} not found')
-            # TODO: If the previous node is full, it will be overloaded. Should implement something to treat this
-            node_to_search.delete(key)
-            if node_to_search.load <= self.node_min_load:            # Scaling down the cluster
-                if node_to_search == self.node_zero:
-                    """
-                    We can't delete node zero.
-                    In current implementation, the node zero can be underloaded to make it simples
-                    """
-                    logger.debug('node zero: not deleting')
-                    return None
-                logger.info(f'Node {node_to_search.index} is underloaded: scaling down the ring')
-                self._delete_node(node_to_search.index)
-                return node_to_search
+            with self._node_lock(node_to_search):
+                if not node_to_search.has_key(key):                 # Deleted by another operation in the stripe
+                    raise KeyNotFoundError(f'Key {key} not found')
+                logger.debug(f'Deleting key {key} from node {node_to_search.index}')
+                self.label_sets.release(node_to_search.delete(key).labels)
+                underloaded = node_to_search.load <= self.node_min_load
+            self._count_operation(-1)
+        if not underloaded:
+            return None
+        if node_to_search == self.node_zero:
+            """
+            We can't delete node zero.
+            In current implementation, the node zero can be underloaded to make it simples
+            """
+            logger.debug('node zero: not deleting')
             return None
 
+        with self._mutating():
+            # Other operations may have merged the node or inserted into it since the stripe was released
+            if not self._is_live(node_to_search) or not self._should_merge(node_to_search):
+                return None
+            logger.info(f'Node {node_to_search.index} is underloaded: scaling down the ring')
+            return self._merge_node(node_to_search)
+
+    def delete_many(self, keys: list[str])->list[Node]:
+        """
+        Deletes a batch of targets under a single lock acquisition. Returns the nodes removed from the ring.
+        The underloaded nodes are only merged at the end, once every target is deleted.
+        If any key is not found, no target is deleted
+        """
+        batch = list(dict.fromkeys(keys))
+        with self._mutating():
+            nodes_to_search = [self._locate(key) for key in batch]
+            for key, node_to_search in zip(batch, nodes_to_search):
+                if node_to_search is None:
+                    raise KeyNotFoundError(f'Key {key} not found')
+
+            underloaded_nodes: dict[int, Node] = dict()
+            for key, node_to_search in zip(batch, nodes_to_search):
+                self.label_sets.release(node_to_search.delete(key).labels)
+                self.target_count -= 1
+                if node_to_search.load <= self.node_min_load and node_to_search is not self.node_zero:
+                    underloaded_nodes[node_to_search.index] = node_to_search
+            self.operation_count += len(batch)
+            logger.debug(f'Deleted {len(batch)} targets, {len(underloaded_nodes)} nodes underloaded')
+
+            deleted_nodes = []
+            for node in underloaded_nodes.values():
+                if node.load <= self.node_min_load and self._should_merge(node):        # Nodes that received the targets of a merged node may be fine now
+                    logger.info(f'Node {node.index} is underloaded: scaling down the ring')
+                    deleted_node = self._merge_node(node)
+                    if deleted_node is not None:
+                        deleted_nodes.append(deleted_node)
+            return deleted_nodes
+
+    def split_overloaded_nodes(self)->list[Node]:
+        """
+        Splits every node above the maximum load, as a node that received the targets of a merged node.
+        Returns the nodes created
+        """
+        with self._mutating():
+            return self._split_overloaded_nodes([node for node in list(self.nodes.values()) if self._should_split(node)])
+
+    def measure_loads(self, loads: dict[int, float])->list[Node]:
+        """
+        Feeds the loads measured on the prometheus instances, by node index, to the nodes, so they scale on their
+        real series or memory instead of the expected ones. Nodes no longer in the ring are skipped.
+        Splits the nodes left above the maximum load and returns the nodes created
+        """
+        with self._mutating():
+            measured_nodes = [self.nodes[index] for index in loads if index in self.nodes]
+            for node in measured_nodes:
+                node.measure_load(loads[node.index])
+            return self._split_overloaded_nodes([node for node in measured_nodes if self._should_split(node)])
+
+    def stats(self)->dict[str, int]:
+        """
+        Returns the ring counters
+        """
+        with self.ring_lock.read():
+            return {
+                'node_count': len(self.nodes),
+                'target_count': self.target_count,
+                'expected_series': sum(node.weight for node in self.nodes.values()),
+                'split_count': self.split_count,
+                'merge_count': self.merge_count,
+                'suppressed_split_count': self.suppressed_split_count,
+                'suppressed_merge_count': self.suppressed_merge_count,
+                'rebalance_count': self.rebalance_count,
+                'rebalanced_key_count': self.rebalanced_key_count,
+            }
+
+    def rebalance_pair(self, left: Node, right: Node)->RebalanceReport:
+        """
+        Evens the loads of two adjacent nodes by moving the boundary between them, i.e. re-keying the right
+        node in the ring, instead of creating or deleting a node. Only keys between the tokens move.
+        With vnodes, every boundary between a left token and a following right token may move.
+        If the nodes are not adjacent, nothing is moved
+        """
+        with self._mutating():
+            return self._rebalance_pair(left, right)
+
+    def rebalance(self, threshold: int | None = None)->list[RebalanceReport]:
+        """
+        Rebalancing policy: rebalances every pair of adjacent nodes whose loads differ by more than
+        threshold points, rebalance_threshold by default. Returns the reports of the pairs with moved keys
+        """
+        if threshold is None:
+            threshold = self.rebalance_threshold
+        with self._mutating():
+            pairs: dict[tuple[int, int], tuple[Node, Node]] = dict()
+            ring_tokens = self.ring.inorder()
+            for (token, left), (next_token, right) in zip(ring_tokens, ring_tokens[1:]):
+                if left is not right:
+                    pairs[(left.index, right.index)] = (left, right)
+
+            reports = []
+            for left, right in pairs.values():
+                if abs(left.load - right.load) > threshold:
+                    report = self._rebalance_pair(left, right)
+                    if report.moved_keys > 0:
+                        reports.append(report)
+            return reports
+
+    def plan_resharding(self, target_load: int | None = None, max_moved_keys: int | None = None)->ReshardingPlan:
+        """
+        Plans a one-shot defragmentation of the ring, with boundaries at even quantiles of all of the key hashes,
+        so every node ends up at target_load (halfway between the minimum and maximum loads by default).
+        The quantiles are weighted by the expected series of the targets.
+        See resharding.plan_resharding. Only rings with one token per node are supported
+        """
+        if self.vnode_count > 1:
+            raise ReshardingNotSupportedError('Resharding is only supported with one token per node')
+        if target_load is None:
+            target_load = (self.node_min_load + self.node_max_load) // 2
+        with self.ring_lock.read():
+            with self.counter_lock:                     # Striped inserts and deletes may change the ring while planning
+                generation = self.generation
+            node_hashes, node_weights = [], []
+            for node in self.nodes.values():
+                with self._node_lock(node):
+                    node_hashes.append(np.array(node.range_hashes(0, None), dtype=np.uint64))
+                    node_weights.append(np.array(node.range_weights(0, None), dtype=np.int64))
+            hashes, weights = np.concatenate(node_hashes), np.concatenate(node_weights)
+            tokens = [(token, node.index) for token, node in self.ring.inorder()]
+        plan = plan_resharding(hashes, tokens, self.node_capacity * target_load // 100, max_moved_keys, weights)
+        plan.generation = generation
+        return plan
+
+    def apply_resharding(self, plan: ReshardingPlan)->tuple[list[Node], list[Node]]:
+        """
+        Applies a resharding plan at once: the tokens are moved, the nodes created and deleted, and then
+        each key that changed of node is moved, in a single pass. Nodes left above the maximum load, e.g. by
+        a target heavier than a node, are split. Returns the created and the deleted nodes.
+        Raises an exception, without changing the ring, if it changed since the plan was made
+        """
+        with self._mutating():
+            self._check_resharding_plan(plan)
+            moved_nodes: list[tuple[Node, int, int]] = []
+            deleted_nodes: list[Node] = []
+            for step in plan.steps:                     # Removing the tokens first, as the new ones may cross them
+                if step.action == 'move':
+                    moved_nodes.append((self.nodes[step.node_index], step.token, step.new_token))
+                    self.ring.remove(step.token)
+                elif step.action == 'merge':
+                    node = self.nodes.pop(step.node_index)
+                    self.scale_events.pop(node.index, None)
+                    self.resized_nodes.pop(node.index, None)
+                    self.ring.remove(step.token)
+                    deleted_nodes.append(node)
+            for node, token, new_token in moved_nodes:
+                new_token = self._free_token(new_token)
+                node.tokens = [new_token if node_token == token else node_token for node_token in node.tokens]
+                self.ring.insert(new_token, node)
+            new_nodes: list[Node] = []
+            for step in plan.steps:
+                if step.action == 'split':
+                    token = self._free_token(step.new_token)
+                    new_node = self._create_node(index=self._free_index(token), tokens=[token])
+                    self.ring.insert(token, new_node)
+                    new_nodes.append(new_node)
+
+            moved_keys = 0
+            for node in list(self.nodes.values()) + deleted_nodes:
+                items = list(node.hashes.items())
+                owners: list[Node] = self.ring.find_many([key_hash + 1 for key, key_hash in items])
+                for (key, key_hash), owner in zip(items, owners):
+                    if owner is not node:
+                        owner.insert(key, node.delete(key), key_hash)
+                        moved_keys += 1
+            self.split_count += len(new_nodes)
+            self.merge_count += len(deleted_nodes)
+            self._mark_scaled(new_nodes, 'split')
+            new_nodes.extend(self._split_overloaded_nodes([node for node in self.nodes.values() if node.load > self.node_max_load]))
+            logger.info(f'Ring resharded: {len(new_nodes)} nodes created, {len(deleted_nodes)} deleted, {moved_keys} keys moved')
+            return new_nodes, deleted_nodes
+
+    def _check_resharding_plan(self, plan: ReshardingPlan)->None:
+        """
+        Checks that a plan still matches the ring: its generation, and the tokens of the nodes it moves and merges
+        """
+        if plan.generation is not None and plan.generation != self.generation:
+            raise StaleReshardingPlanError(f'Plan made at generation {plan.generation}, the ring is at {self.generation}')
+        for step in plan.steps:
+            if step.action in ('move', 'merge'):
+                node = self.nodes.get(step.node_index)
+                if node is None or step.token not in node.tokens or self.ring.search(step.token) is not node:
+                    raise StaleReshardingPlanError(f'Node {step.node_index} is no longer at token {step.token}')
+
+    def rehash(self, hash_function: str)->list[Node]:
+        """
+        Migrates the ring to another hash function in one pass.
+        Tokens are scaled to the new hash space, so every node keeps its share of the ring,
+        and every key is hashed once and stored in the node owning its new hash.
+        Nodes left overloaded are split. Returns the nodes created by the splits
+        """
+        with self._mutating():
+            old_hash_space = hash_space()
+            set_hash_function(hash_function)
+            new_hash_space = hash_space()
+            logger.info(f'Rehashing the ring with {hash_function}')
+
+            for token, node in self.ring.inorder():
+                self.ring.remove(token)
+            items: list[tuple[str, TargetRecord]] = []
+            for node in self.nodes.values():
+                items.extend(node.pop_all())
+                node.tokens = [self._free_token(token * new_hash_space // old_hash_space) for token in node.tokens]
+                for token in node.tokens:
+                    self.ring.insert(token, node)
+
+            for key, record in items:
+                key_hash = stable_hash(key)
+                self._find_node(key_hash).insert(key, record, key_hash)
+
+            return self._split_overloaded_nodes(list(self.nodes.values()))
+
+    def snapshot(self)->RingSnapshot:
+        """
+        Returns an immutable view of the ring at the current generation, to be read without holding the lock.
+        Copy on write: only the nodes changed since the last snapshot are copied, the others are shared with it.
+        Repeated calls in the same generation return the same snapshot
+        """
+        with self.ring_lock.read(), self.snapshot_lock:
+            with self.counter_lock:                     # Read before copying: later striped changes are left for the next snapshot
+                generation = self.generation
+            if self.last_snapshot is not None and self.last_snapshot.generation == generation:
+                return self.last_snapshot
+            node_snapshots: dict[int, tuple[Node, NodeSnapshot]] = dict()
+            for index, node in self.nodes.items():
+                cached = self.node_snapshots.get(index)
+                with self._node_lock(node):                 # Inserts and deletes may be changing the node
+                    if cached is None or cached[0] is not node or cached[1].version != node.version or cached[1].tokens != tuple(node.tokens):
+                        cached = (node, NodeSnapshot(node.index, tuple(node.tokens), node.capacity, node.version, node.load, node.copy_targets()))
+                node_snapshots[index] = cached
+            self.node_snapshots = node_snapshots
+            ring_tokens = self.ring.inorder()
+            self.last_snapshot = RingSnapshot(
+                generation=generation,
+                tokens=tuple(token for token, node in ring_tokens),
+                token_nodes=tuple(node_snapshots[node.index][1] for token, node in ring_tokens),
+                nodes=MappingProxyType({index: node_snapshot for index, (node, node_snapshot) in node_snapshots.items()}),
+            )
+            return self.last_snapshot
+
     def get_nodes(self)->list[Node]:
         """
         Returns a list of all nodes in the ring
         """
-        return self.ring.list()
+        with self.ring_lock.read():
+            return list(self.iter_nodes())
+
+    def iter_nodes(self)->Iterator[Node]:
+        """
+        Yields the nodes of the ring in order, without building a list of them.
+        With vnodes, each node is yielded at its first token.
+        The lock is not taken: callers iterating while the ring may change must hold ring_lock.read()
+        """
+        if self.vnode_count == 1:
+            return self.ring.iter_values()
+        return self._iter_unique_nodes()
+
+    def _iter_unique_nodes(self)->Iterator[Node]:
+        seen_indexes = set()
+        for node in self.ring.iter_values():
+            if node.index not in seen_indexes:
+                seen_indexes.add(node.index)
+                yield node
 
     def _find_node(self, hash: int)->Node:
         """
@@ -173,15 +626,195 @@ class Ring:
         """
         return self.ring.find_max_smaller_than(hash + 1)            # +1 so if a node hash the same value it will be included
         
-    def _split_node(self, node: Node)->Node:
+    def _node_lock(self, node: Node)->threading.Lock:
         """
-        Splits the node in two, creating a new node with the new_node_index
-        Returns the new node
+        Lock stripe of a node. Holding it with the read side of ring_lock allows changing the targets of the node
         """
-        node_mid_hash = node.calc_mid_hash()        # The new node will get half of the keys of the old node.
-        logger.debug(node_mid_hash)
-        new_node = Node(
-            index=node_mid_hash,
+        return self.node_locks[node.index % len(self.node_locks)]
+
+    def _count_operation(self, target_delta: int)->None:
+        """
+        Counts an insert or delete done under a lock stripe. Stripes run concurrently, so the counters have their own lock
+        """
+        with self.counter_lock:
+            self.target_count += target_delta
+            self.operation_count += 1
+            self.generation += 1
+
+    def _is_live(self, node: Node)->bool:
+        """
+        Returns whether the node is still in the ring
+        """
+        return self.nodes.get(node.index) is node
+
+    @contextmanager
+    def _mutating(self)->Iterator[None]:
+        """
+        Holds the write lock during a mutation and moves the ring to a new generation
+        """
+        with self.ring_lock.write():
+            try:
+                yield
+            finally:
+                self.generation += 1
+
+    def _get_target_node(self, key: str)->Node:
+        node = self._locate(key)
+        if node is None:
+            raise KeyNotFoundError(f'Key {key} not found')
+        return node
+
+    def _locate(self, key: str)->Node | None:
+        """
+        Returns the node storing a key, or None if the key is not in the ring.
+        Uses the key index, so keys that spilled from the node owning their hash are found as well
+        """
+        entry = self.key_index.get(key)
+        return entry[1] if entry is not None else None
+
+    def _find_bounded_node(self, key_hash: int, weight: int = 1)->Node:
+        """
+        Consistent hashing with bounded loads. Walks the ring clockwise from the node owning the hash
+        until finding a node that can take the weight (expected series) of the target without going above
+        load_balance_factor times the mean weight, nor above the maximum load (measured, once measured).
+        If every node is full, returns the owner of the hash.
+        """
+        total_weight = sum(node.weight for node in self.nodes.values()) + weight
+        bound = math.ceil(self.load_balance_factor * total_weight / len(self.nodes))
+        owner: Node = self._find_node(key_hash)
+        token = max(node_token for node_token in owner.tokens if node_token <= key_hash)
+        node = owner
+        for _ in range(len(self.nodes) * self.vnode_count):
+            if node.weight + weight <= min(bound, self._max_weight(node)):
+                return node
+            token = self._next_token(token)
+            if token is None:                           # Going back to the start of the ring
+                token = 0
+            node = self.ring.search(token)
+        return owner
+
+    def _next_token(self, token: int)->int | None:
+        """
+        Returns the first token after the provided one, i.e. the end of its hash range.
+        Returns None if it's the last token of the ring
+        """
+        next_node: Node | None = self.ring.find_min_greater_than(token)
+        if next_node is None:
+            return None
+        return min(node_token for node_token in next_node.tokens if node_token > token)
+
+    def _prior_token(self, token: int)->int | None:
+        """
+        Returns the last token before the provided one. Returns None if it's the first token of the ring
+        """
+        prior_node: Node | None = self.ring.find_max_smaller_than(token)
+        if prior_node is None:
+            return None
+        return max(node_token for node_token in prior_node.tokens if node_token < token)
+
+    def _move_token(self, node: Node, token: int, new_token: int)->None:
+        """
+        Re-keys one of the tokens of a node in the ring. Doesn't move any key
+        """
+        self.ring.remove(token)
+        node.tokens = [new_token if node_token == token else node_token for node_token in node.tokens]
+        self.ring.insert(new_token, node)
+        logger.debug(f'Moving node {node.index} token from {token} to {new_token}')
+
+    def _rebalance_pair(self, left: Node, right: Node)->RebalanceReport:
+        report = RebalanceReport(left_index=left.index, right_index=right.index)
+        # Twice the weight moving to the right node, so both end up with the same load. If negative, to the left node
+        left_load_per_weight, right_load_per_weight = self._load_per_weight(left), self._load_per_weight(right)
+        imbalance = round(2 * (left.weight * left_load_per_weight - right.weight * right_load_per_weight) / (left_load_per_weight + right_load_per_weight))
+        for right_token in sorted(right.tokens):
+            if abs(imbalance) <= 1:
+                break
+            left_token = self._prior_token(right_token)
+            if left_token is None or self.ring.search(left_token) is not left:
+                continue
+            if imbalance > 0:                                       # The right node takes the last keys of the left range
+                hashes = left.range_hashes(left_token + 1, right_token)
+                weights = left.range_weights(left_token + 1, right_token)
+                count = self._balancing_count(list(accumulate(reversed(weights))), imbalance)
+                if count == 0:
+                    continue
+                new_token = hashes[-count]
+                source, destination, first_key_hash, last_key_hash = left, right, new_token, right_token
+            else:                                                   # The left node takes the first keys of the right range
+                hashes = right.range_hashes(right_token, self._next_token(right_token))
+                weights = right.range_weights(right_token, self._next_token(right_token))
+                count = min(self._balancing_count(list(accumulate(weights)), -imbalance), len(hashes) - 1)
+                if count <= 0:
+                    continue
+                new_token = hashes[count]
+                source, destination, first_key_hash, last_key_hash = right, left, right_token, new_token
+            if new_token == right_token:
+                continue
+
+            self._move_token(right, right_token, new_token)
+            target_count, weight = len(source.targets), source.weight
+            source.export_keys(destination, first_key_hash, last_key_hash)
+            moved_keys = target_count - len(source.targets)
+            moved_weight = weight - source.weight
+            imbalance += -2 * moved_weight if imbalance > 0 else 2 * moved_weight
+            report.moved_keys += moved_keys
+            report.token_moves.append((right_token, new_token))
+
+        if report.moved_keys > 0:
+            self.rebalance_count += 1
+            self.rebalanced_key_count += report.moved_keys
+            logger.info(f'Rebalanced nodes {left.index} and {right.index}: {report.moved_keys} keys moved')
+        return report
+
+    @staticmethod
+    def _balancing_count(cumulative_weights: list[int], imbalance: int)->int:
+        """
+        Number of keys to move, in the order of their cumulative weights, that leaves the smallest imbalance between two nodes.
+        With unit weights, it is half of the imbalance
+        """
+        count = bisect_right(cumulative_weights, imbalance // 2)
+        moved_weight = cumulative_weights[count - 1] if count > 0 else 0
+        if count < len(cumulative_weights) and abs(imbalance - 2 * cumulative_weights[count]) < abs(imbalance - 2 * moved_weight):
+            count += 1                                              # Overshooting with the next key evens the nodes better
+        return count
+
+    def _vnode_token(self, index: int, replica: int)->int:
+        """
+        Calculates the position of one of the vnodes of a node, skipping the tokens already taken
+        """
+        token = stable_hash(f'node-{index}-vnode-{replica}')
+        salt = 0
+        while token == 0 or self.ring.search(token) is not None:
+            salt += 1
+            token = stable_hash(f'node-{index}-vnode-{replica}-{salt}')
+        return token
+
+    def _free_token(self, token: int)->int:
+        """
+        Returns the token, or the first following one not taken in the ring
+        """
+        while self.ring.search(token) is not None:
+            token += 1
+        return token
+
+    def _free_index(self, index: int)->int:
+        """
+        Returns the index, or the first following one not taken by a node.
+        Merges and rebalances move tokens without changing the index of their node, so a split hash may be taken
+        """
+        while index in self.nodes:
+            index += 1
+        return index
+
+    def _create_node(self, index: int, tokens: list[int] | None = None)->Node:
+        """
+        Instanciates a node with the ring configurations and registers it.
+        Does not insert it in the ring ADT
+        """
+        node_class = ColumnarNode if self.node_storage == 'columnar' else Node
+        node = node_class(
+            index=index,
+            tokens=tokens,
             capacity=self.node_capacity,
             replica_count=self.node_replica_count,
             sd_provider=self.sd_provider,
@@ -193,29 +826,360 @@ class Ring:
             metrics_database_url=self.metrics_database_url,
             metrics_database_port=self.metrics_database_port,
             metrics_database_path=self.metrics_database_path,
-            port=self.node_base_ports + self.node_count
+            port=self.node_base_ports + self.node_count,
+            # TODO: Make an more versitile way to set the port
+            key_index=self.key_index,
+            capacity_class=self.capacity_classes[0] if self.capacity_classes else None,
         )
-        self.ring.insert(node_mid_hash, new_node)
-        node.export_keys(new_node, node_mid_hash)
+        return self._register_node(node)
+
+    def _register_node(self, node: Node)->Node:
+        """
+        Registers a node created by the ring or split from one of its nodes. Raises an exception if its index is taken
+        """
+        if node.index in self.nodes:
+            raise NodeAlreadyExistsError(f'Node with index {node.index} already exists')
         self.node_count += 1
+        self.nodes[node.index] = node
+        return node
 
-        logger.info(f'New node created with index {node_mid_hash}')
+    def _max_weight(self, node: Node)->int:
+        """
+        Weight (expected series) of a node at the maximum load, from its measured load once it is measured
+        """
+        if node.measured_load_per_weight is not None:
+            return int(self.node_max_load / node.measured_load_per_weight)
+        return node.capacity * self.node_max_load // 100
+
+    def _load_per_weight(self, node: Node)->float:
+        """
+        Load each unit of weight adds to a node: the measured one once its load is measured, else relative to its capacity
+        """
+        if node.measured_load_per_weight is not None:
+            return node.measured_load_per_weight
+        return 100 / node.capacity
+
+    def _capacity_class_for(self, weight: int)->CapacityClass:
+        """
+        Smallest capacity class holding the weight halfway between the minimum and the maximum loads, or the largest one
+        """
+        for capacity_class in self.capacity_classes:
+            if weight * 200 <= capacity_class.capacity * (self.node_min_load + self.node_max_load):
+                return capacity_class
+        return self.capacity_classes[-1]
+
+    def _size_split_nodes(self, split_nodes: list[Node], new_nodes: list[Node])->None:
+        """
+        Chooses the capacity class of the nodes taking part in a split, from the weight each one ended up with.
+        The new nodes are not launched yet, so they take any class. The split nodes are already running,
+        so they are only resized up, and reported by pop_resized_nodes
+        """
+        if not self.capacity_classes:
+            return
+        for node in new_nodes:
+            node.set_capacity_class(self._capacity_class_for(node.weight))
+        for node in split_nodes:
+            capacity_class = self._capacity_class_for(node.weight)
+            if capacity_class.capacity > node.capacity:
+                logger.info(f'Node {node.index} resized from {node.capacity_class.name} to {capacity_class.name}')
+                node.set_capacity_class(capacity_class)
+                self.resized_nodes[node.index] = node
+
+    def pop_resized_nodes(self)->list[Node]:
+        """
+        Returns the running nodes whose capacity class changed since the last call, so their services are resized
+        """
+        with self._mutating():
+            resized_nodes = list(self.resized_nodes.values())
+            self.resized_nodes.clear()
+            return resized_nodes
+
+    def _split_overloaded_nodes(self, nodes: list[Node])->list[Node]:
+        """
+        Splits the nodes until none of them, nor the nodes created, is above the maximum load.
+        Nodes far above the maximum load are split in many nodes at once. Returns the nodes created
+        """
+        new_nodes = []
+        nodes_to_split = list(nodes)
+        while nodes_to_split:
+            node = nodes_to_split.pop()
+            if node.load <= self.node_max_load:
+                continue
+            weight = node.weight
+            split_nodes = self._split_node_many(node, self._split_count(node))
+            new_nodes.extend(split_nodes)
+            nodes_to_split.extend(split_nodes)
+            if split_nodes and node.weight < weight:                    # Only splits the node again if the split relieved it
+                nodes_to_split.append(node)
+        return new_nodes
+
+    def _should_split(self, node: Node)->bool:
+        """
+        Decides if an node above the maximum load splits, applying the hysteresis and the cool-down.
+        Counts the suppressed splits
+        """
+        if node.load <= self.node_max_load:
+            return False
+        last_event = self.scale_events.get(node.index, (None,))[0]
+        if last_event == 'merge' and node.load <= self.node_max_load + self.scale_hysteresis:
+            logger.debug(f'Node {node.index} split suppressed by the hysteresis')
+            self.suppressed_split_count += 1
+            return False
+        if self._in_cooldown(node) and not node.is_full():
+            logger.debug(f'Node {node.index} split suppressed by the cool-down')
+            self.suppressed_split_count += 1
+            return False
+        return True
+
+    def _should_merge(self, node: Node)->bool:
+        """
+        Decides if an node below the minimum load is merged, applying the hysteresis and the cool-down.
+        Counts the suppressed merges
+        """
+        if node is self.node_zero or node.load > self.node_min_load:
+            return False
+        last_event = self.scale_events.get(node.index, (None,))[0]
+        if last_event == 'split' and node.load > self.node_min_load - self.scale_hysteresis:
+            logger.debug(f'Node {node.index} merge suppressed by the hysteresis')
+            self.suppressed_merge_count += 1
+            return False
+        if self._in_cooldown(node):
+            logger.debug(f'Node {node.index} merge suppressed by the cool-down')
+            self.suppressed_merge_count += 1
+            return False
+        return True
+
+    def _in_cooldown(self, node: Node)->bool:
+        scale_event = self.scale_events.get(node.index)
+        if scale_event is None:
+            return False
+        event, scaled_at, scaled_operation = scale_event
+        return (time.monotonic() - scaled_at < self.scale_cooldown
+                or self.operation_count - scaled_operation < self.scale_cooldown_operations)
+
+    def _mark_scaled(self, nodes: list[Node], event: str)->None:
+        """
+        Records a scale event ('split' or 'merge') of the nodes, starting their cool-down
+        """
+        scale_event = (event, time.monotonic(), self.operation_count)
+        for node in nodes:
+            self.scale_events[node.index] = scale_event
+
+    def _split_count(self, node: Node)->int:
+        """
+        Number of nodes an overloaded node must be split in, so each of them ends up
+        halfway between the minimum and the maximum loads. With capacity classes, the parts are sized for the
+        largest class, so hot ranges are packed in big nodes instead of many small ones
+        """
+        capacity = self.capacity_classes[-1].capacity if self.capacity_classes else self.node_capacity
+        weight_per_node = max(capacity * (self.node_min_load + self.node_max_load) // 200, 1)
+        return max(2, math.ceil(node.weight / weight_per_node))
+
+    def _suppress_unsplittable(self, node: Node)->None:
+        """
+        Counts a split suppressed because the node has no keys in its own hash range to split.
+        Logged at debug level, as every insert into such a node tries the split again
+        """
+        logger.debug(f'Node {node.index} has no keys in its own hash range to split')
+        self.suppressed_split_count += 1
+
+    def _split_node_many(self, node: Node, count: int)->list[Node]:
+        """
+        Splits the node in count nodes in one step, at evenly spaced quantiles of its key hashes.
+        Returns the new nodes, which may be less than count - 1 if the node doesn't have enough distinct hashes.
+        With vnodes, the largest of the parts is split until there are count of them
+        """
+        if count <= 2:
+            new_node = self._split_node(node)
+            return [new_node] if new_node is not None else []
+        if self.vnode_count > 1:
+            parts = [node]
+            while len(parts) < count:
+                new_node = self._split_node_vnodes(max(parts, key=lambda part: part.weight))
+                if new_node is None:
+                    break
+                parts.append(new_node)
+            return parts[1:]
+
+        token = node.tokens[0]
+        first_key_hash, last_key_hash = -1, None
+        if self.placement_policy == 'bounded_load':            # Leaves out keys that spilled from other ranges into the node
+            first_key_hash, last_key_hash = token, self._next_token(token)
+        split_hashes = [split_hash for split_hash in node.calc_split_hashes(count, first_key_hash, last_key_hash) if split_hash > token]
+        if len(split_hashes) == 0:
+            self._suppress_unsplittable(node)
+            return []
+        new_nodes = []
+        for split_hash in split_hashes:
+            new_node = self._create_node(index=self._free_index(split_hash), tokens=[split_hash])
+            new_node.measured_load_per_weight = node.measured_load_per_weight
+            self.ring.insert(split_hash, new_node)
+            new_nodes.append(new_node)
+        node.export_keys_many(new_nodes, split_hashes, last_key_hash)
+        self._size_split_nodes([node], new_nodes)
+        self.split_count += len(new_nodes)
+        self._mark_scaled([node] + new_nodes, 'split')
+
+        logger.info(f'Node {node.index} split in {len(new_nodes) + 1} nodes: {split_hashes}')
+        return new_nodes
+
+    def _split_node(self, node: Node)->Node | None:
+        """
+        Splits the node in two, creating a new node with the new_node_index
+        Returns the new node, or None if the node can't be split
+        """
+        if self.vnode_count > 1:
+            return self._split_node_vnodes(node)
+
+        token = node.tokens[0]
+        first_key_hash, last_key_hash = -1, None
+        if self.placement_policy == 'bounded_load':            # Leaves out keys that spilled from other ranges into the node
+            first_key_hash, last_key_hash = token, self._next_token(token)
+        if self.split_strategy == 'quantile':
+            node_mid_hash = node.calc_split_hash(self.split_quantile, first_key_hash, last_key_hash)
+        else:
+            node_mid_hash = node.calc_mid_hash(first_key_hash, last_key_hash)       # The new node will get half of the keys of the old node.
+        logger.debug(node_mid_hash)
+        if node_mid_hash <= token:
+            self._suppress_unsplittable(node)
+            return None
+        new_index = self._free_index(node_mid_hash)
+        new_node = node.split_at(node_mid_hash, index=new_index, last_key_hash=last_key_hash, tokens=[node_mid_hash], port=self.node_base_ports + self.node_count)
+        self._register_node(new_node)
+        self.ring.insert(node_mid_hash, new_node)
+        self._size_split_nodes([node], [new_node])
+        self.split_count += 1
+        self._mark_scaled([node, new_node], 'split')
+
+        logger.info(f'New node created with index {new_index} at token {node_mid_hash}')
+        return new_node
+
+    def _split_node_vnodes(self, node: Node)->Node | None:
+        """
+        Creates a node with vnode_count tokens. Each token splits one of the hash ranges of the
+        overloaded node in half, so the new node takes half of its keys in many small slices.
+        If the node doesn't have enough ranges to split, the remaining tokens are placed by hash,
+        taking small slices of other nodes.
+        Returns None if none of the ranges of the node can be split, as the new node would take no load from it
+        """
+        ranges = [(token, self._next_token(token)) for token in node.tokens]
+        tokens = node.calc_range_mid_hashes(ranges, self.split_quantile)[:self.vnode_count]
+        if len(tokens) == 0:
+            self._suppress_unsplittable(node)
+            return None
+        new_index = self._free_index(self.node_count)   # With vnodes, indexes are not ring positions
+        replica = 0
+        while len(tokens) < self.vnode_count:
+            tokens.append(self._vnode_token(new_index, replica))
+            replica += 1
+
+        new_node = self._create_node(index=new_index, tokens=tokens)
+        token_owners: list[Node] = [self._find_node(token) for token in tokens]
+        for token in tokens:        # Every token is in the ring before the ranges are exported, so each range ends at the next token of the ring
+            self.ring.insert(token, new_node)
+        owners = []
+        for token, owner in zip(tokens, token_owners):
+            owner.export_keys(new_node, token, self._next_token(token))
+            if owner not in owners:
+                owners.append(owner)
+
+        self._size_split_nodes(owners, [new_node])
+        self.split_count += 1
+        self._mark_scaled([new_node] + owners, 'split')
+        logger.info(f'New node created with index {new_index} and tokens {tokens}')
         return new_node
 
-    def _delete_node(self, index: int)->Node:
+    def _merge_node(self, node: Node)->Node | None:
+        """
+        Merges an underloaded node into its neighbours, as planned by _plan_merge.
+        Returns the deleted node, or None if the neighbours can't receive its keys
+        """
+        can_merge, token_shift = self._plan_merge(node)
+        if not can_merge:
+            logger.info(f'Node {node.index} is underloaded, but its neighbours have no headroom to receive its targets')
+            self.suppressed_merge_count += 1
+            return None
+        return self._delete_node(node.index, token_shift)
+
+    def _plan_merge(self, node: Node)->tuple[bool, tuple[int, int] | None]:
+        """
+        Checks if the neighbours of a node can receive its keys without going above the maximum load, weighting
+        each key by its expected series. The loads of the neighbours are the measured ones, once measured.
+        The keys go to the prior node if it has headroom for all of them. Otherwise, they are spread over
+        both neighbours, moving the token of the next node back into the range of the merged node,
+        so both end up with similar loads. With vnodes, each node receiving keys, from any of its ranges, must have headroom for them.
+        Returns whether the node can be merged and the (token, new token) shift of the next node, if any
+        """
+        if self.vnode_count > 1:
+            # Each key goes to the owner of its hash once the node is removed, including the keys that spilled into the node
+            incoming_weights: dict[int, int] = dict()
+            receivers: dict[int, Node] = dict()
+            ring_tokens = [(token, owner) for token, owner in self.ring.inorder() if owner is not node]
+            for position, (token, owner) in enumerate(ring_tokens):
+                next_token = ring_tokens[position + 1][0] if position + 1 < len(ring_tokens) else None
+                weight = sum(node.range_weights(token, next_token))
+                if weight > 0:
+                    incoming_weights[owner.index] = incoming_weights.get(owner.index, 0) + weight
+                    receivers[owner.index] = owner
+            can_merge = all(receivers[index].weight + weight <= self._max_weight(receivers[index]) for index, weight in incoming_weights.items())
+            return can_merge, None
+
+        token = node.tokens[0]
+        prior_node: Node = self._find_node(token - 1)
+        if prior_node.weight + node.weight <= self._max_weight(prior_node):
+            return True, None
+        next_token = self._next_token(token)
+        if next_token is None:
+            return False, None
+        next_node: Node = self.ring.search(next_token)
+        hashes = node.range_hashes(token, next_token)
+        cumulative_weights = list(accumulate(node.range_weights(token, next_token)))
+        range_weight = cumulative_weights[-1] if cumulative_weights else 0
+        # Number of keys going to the prior node, so both neighbours end up with the same load
+        prior_load_per_weight, next_load_per_weight = self._load_per_weight(prior_node), self._load_per_weight(next_node)
+        prior_goal = int(((next_node.weight + range_weight) * next_load_per_weight - prior_node.weight * prior_load_per_weight) // (prior_load_per_weight + next_load_per_weight))
+        prior_count = bisect_right(cumulative_weights, max(prior_goal, 0))
+        prior_weight = cumulative_weights[prior_count - 1] if prior_count > 0 else 0
+        if (prior_node.weight + prior_weight > self._max_weight(prior_node)
+                or next_node.weight + range_weight - prior_weight > self._max_weight(next_node)):
+            return False, None
+        if prior_count == len(hashes):
+            return True, None
+        return True, (next_token, hashes[prior_count])
+
+    def _delete_node(self, index: int, token_shift: tuple[int, int] | None = None)->Node:
         """
         Deletes a node and sends it's targets to the previous node.
+        With vnodes, the targets of each token go to the node owning the previous token.
+        If a token shift is provided, the next node token is moved back before, so it takes the keys above its new token.
         Returns de deleted node.
         """
-        # TODO: check if the prior node has capacity to receive the keys or launch new node after insertion
-        node_to_delete: Node = self.ring.search(index)
+        node_to_delete: Node | None = self.nodes.get(index)
         if node_to_delete is None:
             logger.info(f'Node with index {index} not found to delete')
             raise NodeNotFoundError(f'Node with index {index} not found')
-        prior_node: Node = self.ring.find_max_smaller_than(index)       # Ensures
-        logger.debug(f'prior node: {prior_node}')
-        logger.debug(f'Exporting Keys of node {index} to the node {prior_node.index}')
-        node_to_delete.export_keys(prior_node, 0)           # Uses 0 to ensure that all of if keys are exported
-        self.ring.remove(index)
+        for token in node_to_delete.tokens:
+            self.ring.remove(token)
+        del self.nodes[index]
+        self.scale_events.pop(index, None)
+        self.resized_nodes.pop(index, None)
+        if token_shift is not None:
+            token, new_token = token_shift
+            self._move_token(self.ring.search(token), token, new_token)
+
+        receivers: dict[int, Node] = dict()
+        for token in sorted(node_to_delete.tokens):
+            prior_node: Node = self._find_node(token)
+            logger.debug(f'Exporting Keys of node {index} from token {token} to the node {prior_node.index}')
+            node_to_delete.export_keys(prior_node, token, self._next_token(token))
+            receivers[prior_node.index] = prior_node
+        for key, target in node_to_delete.list_keys():          # Keys that spilled from other ranges into the node, or owned by the shifted node
+            key_hash = node_to_delete.get_hash(key)
+            owner: Node = self._find_node(key_hash)
+            owner.insert(key, target, key_hash)
+            node_to_delete.delete(key)
+            receivers[owner.index] = owner
+        self.merge_count += 1
+        self._mark_scaled(list(receivers.values()), 'merge')
         logger.debug(f'Node {index} removed from the ring successfully')
         return node_to_delete
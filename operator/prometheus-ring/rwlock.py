@@ -0,0 +1,56 @@
+from contextlib import contextmanager
+from typing import Iterator
+import threading
+
+class ReadWriteLock:
+    """
+    Readers-writer lock: any number of readers may hold the lock at once, while a writer holds it alone.
+    Writers are preferred: once a writer is waiting, new readers wait for it, so a steady stream of
+    reads can't starve the writers. Not reentrant, a thread holding the lock must not acquire it again
+    """
+    def __init__(self)->None:
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0                       # Threads holding the read lock
+        self._writer = False                    # Whether a thread holds the write lock
+        self._waiting_writers = 0
+
+    def acquire_read(self)->None:
+        with self._condition:
+            while self._writer or self._waiting_writers > 0:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self)->None:
+        with self._condition:
+            self._readers -= 1
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self)->None:
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers > 0:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self)->None:
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    @contextmanager
+    def read(self)->Iterator[None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self)->Iterator[None]:
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,13 @@
+from bisect import bisect_right
+
+def weighted_quantile_rank(cumulative_weights: list[int], quantile: float)->int:
+    """
+    Returns the rank of a quantile in a collection of sorted values with weights, provided as their cumulative weights:
+    the first value whose cumulative weight goes above quantile times the total weight.
+    The rank is never 0 when there are at least two values, so splitting at it leaves values on both sides
+    """
+    size = len(cumulative_weights)
+    if size == 0:
+        return 0
+    rank = bisect_right(cumulative_weights, quantile * cumulative_weights[-1])
+    return max(min(rank, size - 1), 1 if size > 1 else 0)
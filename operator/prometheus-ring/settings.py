@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from .capacity_class import CapacityClass
 
 class Settings(BaseSettings):
     docker_network: str = "prometheus-ring"
@@ -6,10 +7,28 @@ class Settings(BaseSettings):
 
     api_endpoint: str = "prometheus-ring-api"
     api_port: int = 9988
+    ring_adt: str = 'avl'                   # avl, sorted_array or bst
+    ring_placement_policy: str = 'split'    # split or bounded_load
+    ring_load_balance_factor: float = 1.25
+    ring_split_strategy: str = 'mean'       # mean or quantile
+    ring_split_quantile: float = 0.5
+    ring_hash_function: str = 'sha1'        # sha1 (legacy) or blake2b
+    ring_scale_hysteresis: int = 0
+    ring_scale_cooldown: float = 0          # Seconds
+    ring_scale_cooldown_operations: int = 0
+    ring_rebalance_interval: float = 0      # Seconds. 0 disables the background rebalancing
+    ring_rebalance_threshold: int = 20
+    ring_lock_stripe_count: int = 64
+    ring_load_collect_interval: float = 0   # Seconds. 0 disables the load collector
     node_capacity: int = 2
+    node_capacity_classes: list[CapacityClass] = []     # JSON list, e.g. [{"name": "small", "capacity": 1000, "cpu_reservation": 0.5, "memory_reservation": 536870912}]
     node_min_load: int = 25
     node_max_load: int = 75
     node_replication_num: int = 1
+    node_vnode_count: int = 1
+    node_storage: str = 'dict'              # dict or columnar
+    node_metrics_host: str = 'localhost'    # Host publishing the node ports, where the load collector reads their metrics
+    node_memory_limit: int = 0              # Bytes. 0 ignores the memory of the nodes
     node_scrape_interval: str = '1m'
     node_scrape_timeout: str = '20s'
     sd_refresh_interval: str = '1m'
@@ -0,0 +1,80 @@
+from .target import Target, TargetRecord
+from .columnar_node import TargetColumns
+from .hash import stable_hash
+from dataclasses import dataclass
+from typing import Iterator, Mapping
+from bisect import bisect_right
+
+@dataclass(frozen=True)
+class NodeSnapshot:
+    """
+    Read-only view of a node at a given version. Snapshots of nodes that didn't change are shared between
+    ring snapshots, so taking a snapshot only copies the targets of the nodes changed since the last one
+    """
+    index: int
+    tokens: tuple[int, ...]
+    capacity: int
+    version: int
+    load: int
+    targets: Mapping[str, TargetRecord]
+
+    def has_key(self, key: str)->bool:
+        return key in self.targets
+
+    def get(self, key: str)->TargetRecord | None:
+        return self.targets.get(key)
+
+    def iter_items(self)->Iterator[TargetRecord]:
+        return iter(self.targets.values())
+
+    def iter_endpoints(self)->Iterator[tuple[str, str]]:
+        """
+        Yields the id and the endpoint of each target. Read from the columns of columnar nodes
+        """
+        if isinstance(self.targets, TargetColumns):
+            return self.targets.iter_endpoints()
+        return ((target.id, target.endpoint) for target in self.targets.values())
+
+@dataclass(frozen=True)
+class RingSnapshot:
+    """
+    Read-only view of the ring topology and of the targets of each node at a generation.
+    It is never changed by the ring, so it can be read without holding any lock
+    """
+    generation: int
+    tokens: tuple[int, ...]                                 # Sorted tokens of the ring
+    token_nodes: tuple[NodeSnapshot, ...]                   # Node of each token
+    nodes: Mapping[int, NodeSnapshot]                       # Nodes by index
+
+    def get_target_node(self, key: str, key_hash: int | None = None)->NodeSnapshot | None:
+        """
+        Returns the node storing a key, or None if the key was not in the ring.
+        Keys that spilled from the node owning their hash are searched in every node
+        """
+        if key_hash is None:
+            key_hash = stable_hash(key)
+        node = self.token_nodes[bisect_right(self.tokens, key_hash) - 1]
+        if node.has_key(key):
+            return node
+        return next((node for node in self.nodes.values() if node.has_key(key)), None)
+
+    def get(self, key: str, key_hash: int | None = None)->Target | None:
+        node = self.get_target_node(key, key_hash)
+        return node.get(key).to_target() if node is not None else None
+
+    def iter_nodes(self)->Iterator[NodeSnapshot]:
+        """
+        Yields the nodes in ring order, each one at its first token
+        """
+        seen_indexes = set()
+        for node in self.token_nodes:
+            if node.index not in seen_indexes:
+                seen_indexes.add(node.index)
+                yield node
+
+    def get_nodes(self)->list[NodeSnapshot]:
+        return list(self.iter_nodes())
+
+    @property
+    def target_count(self)->int:
+        return sum(len(node.targets) for node in self.nodes.values())
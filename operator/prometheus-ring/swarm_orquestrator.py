@@ -33,10 +33,32 @@ class SwarmOrquestrator:
             environment: dict | None = None,
         )->None:
         """
-        Instanciates a docker swarm service for a prometheus node
+        Instanciates a docker swarm service for a prometheus node, reserving the resources of its capacity class
         """
-        if environment is None:
-            environment = dict()
+        self.create_nodes([node], environment)
+
+    def create_nodes(
+            self,
+            nodes: list[Node],
+            environment: dict | None = None,
+        )->None:
+        """
+        Instanciates the docker swarm services of many prometheus nodes, as the nodes of a multi-way split.
+        All of the services are created before waiting for any of them to scale up
+        """
+        services = [self._create_service(node, environment) for node in nodes]
+        for node, service in zip(nodes, services):
+            self._scale_service(node, service)
+
+    def _create_service(
+            self,
+            node: Node,
+            environment: dict | None = None,
+        )->Service:
+        """
+        Creates the docker swarm service of a prometheus node
+        """
+        environment = dict() if environment is None else dict(environment)
 
         environment['PROMETHEUS_YML'] = node.yaml
 
@@ -47,10 +69,56 @@ class SwarmOrquestrator:
             env=service_envs,
             name=f'prometheus-{node.index}',
             endpoint_spec=endpoint_spec,
-            networks=[self.docker_network]
+            networks=[self.docker_network],
+            resources=self._resources(node),
             # stop_grace_period= '1m',                                                    # Grace period for stopping the service
         )
         self.services[node.index] = service
+        return service
+
+    def _resources(self, node: Node)->docker.types.Resources | None:
+        """
+        Swarm resource reservations of the capacity class of a node. None if the node has no class
+        """
+        if node.capacity_class is None:
+            return None
+        return docker.types.Resources(
+            cpu_reservation=node.capacity_class.nano_cpu_reservation,
+            mem_reservation=node.capacity_class.memory_reservation,
+        )
+
+    def update_node(self, node: Node)->None:
+        """
+        Updates the resource reservations of the service of a node whose capacity class changed.
+        Swarm restarts its tasks with the new reservations
+        """
+        service = self.services.get(node.index)
+        if service is None:
+            logger.warning(f'Node {node.index} has no service to update')
+            return
+        for attemp in range(API_MAX_RETRIES):
+            try:
+                updated_service: Service = self.client.services.get(service.id)
+                updated_service.update(resources=self._resources(node))
+                break
+            except docker.errors.APIError as e:
+                if "update out of sequence" in str(e):
+                    logger.warning(f'Attemp {attemp} of resizing service {service.name} failed: {str(e)}. Retring...')
+                    time.sleep(2 ** attemp)                                                                             # Progressively increses the await time for the next
+                else:
+                    raise                                                                                               # Only the out of sequence updates are worth retrying
+        else:
+            logger.error(f'Failed resizing service {service.name} after {API_MAX_RETRIES} attemps.')
+            raise UpdatingServiceError(f'Failed resizing service {service.name} after {API_MAX_RETRIES} attemps.')
+
+    def update_nodes(self, nodes: list[Node])->None:
+        """
+        Updates the resource reservations of the services of many prometheus nodes
+        """
+        for node in nodes:
+            self.update_node(node)
+
+    def _scale_service(self, node: Node, service: Service)->None:
         """
         Seems like each change made by service kwargs create a new version of it,
         throwing ("rpc error: code = Unknown desc = update out of sequence").
@@ -95,6 +163,13 @@ class SwarmOrquestrator:
         logger.debug(f'Result: {result}')
 
 
+    def delete_nodes(self, nodes: list[Node])->None:
+        """
+        Deletes the docker swarm services of many prometheus nodes
+        """
+        for node in nodes:
+            self.delete_node(node)
+
     def check_health_node(self, node: Node)->None:
         """
         Heath checks if a prometheus node is running.
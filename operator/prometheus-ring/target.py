@@ -1,12 +1,15 @@
 from pydantic import BaseModel, Field
+import sys
+import threading
 
 class Target(BaseModel, frozen=True):
     id: str
     name: str
     address: str
-    metrics_port: int = Field(default=8000)
+    metrics_port: int = Field(default=8000, ge=0, le=65535)      # Stored in an unsigned array by columnar nodes
     metrics_path: str = Field(default='/metrics')
     labels: dict = Field(default={})
+    expected_series: int = Field(default=1, ge=1)      # Series the target is expected to expose. Weight of the target in the node loads
 
     @property
     def endpoint(self)->str:
@@ -14,4 +17,90 @@ class Target(BaseModel, frozen=True):
 
     # @property
     # def hash(self)->int:
-    #     return hash(id)         # For now, only using the id to hash
\ No newline at end of file
+    #     return hash(id)         # For now, only using the id to hash
+
+def to_label_set(labels: dict)->tuple[tuple[str, object], ...]:
+    """
+    Returns the labels as sorted (name, value) pairs
+    """
+    return tuple(sorted(labels.items()))
+
+class LabelSets:
+    """
+    Interned label sets of a ring, shared by the records with the same labels. Each label set counts the records
+    using it and is dropped when the last one is released, so the labels of deleted targets are not kept.
+    Labels with unhashable values are not shared
+    """
+    def __init__(self)->None:
+        self._label_sets: dict[tuple, list] = dict()       # Label set -> [shared label set, records using it]
+        self._lock = threading.Lock()                       # Striped inserts and deletes intern concurrently
+
+    def intern(self, labels: dict)->tuple[tuple[str, object], ...]:
+        label_set = to_label_set(labels)
+        with self._lock:
+            try:
+                entry = self._label_sets.setdefault(label_set, [label_set, 0])
+            except TypeError:
+                return label_set
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, label_set: tuple)->None:
+        """
+        Releases the label set of a record deleted from the ring
+        """
+        with self._lock:
+            try:
+                entry = self._label_sets.get(label_set)
+            except TypeError:
+                return
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._label_sets[label_set]
+
+    def __len__(self)->int:
+        return len(self._label_sets)
+
+class TargetRecord:
+    """
+    Compact storage of a target in the ring nodes. Uses slots instead of a pydantic model, interns the address
+    and the metrics path, and shares the label sets. Converted from and to Target when entering and leaving the ring
+    """
+    __slots__ = ('id', 'name', 'address', 'metrics_port', 'metrics_path', 'labels', 'expected_series')
+
+    def __init__(self, id: str, name: str, address: str, metrics_port: int, metrics_path: str, labels: tuple, expected_series: int = 1)->None:
+        self.id = id
+        self.name = name
+        self.address = sys.intern(address)
+        self.metrics_port = metrics_port
+        self.metrics_path = sys.intern(metrics_path)
+        self.labels = labels
+        self.expected_series = expected_series
+
+    @classmethod
+    def from_target(cls, target: Target, label_sets: LabelSets | None = None)->'TargetRecord':
+        """
+        Builds the record of a target. Its labels are shared with the other records of label_sets, if provided
+        """
+        labels = label_sets.intern(target.labels) if label_sets is not None else to_label_set(target.labels)
+        return cls(target.id, target.name, target.address, target.metrics_port, target.metrics_path, labels, target.expected_series)
+
+    def to_target(self)->Target:
+        return Target(
+            id=self.id,
+            name=self.name,
+            address=self.address,
+            metrics_port=self.metrics_port,
+            metrics_path=self.metrics_path,
+            labels=dict(self.labels),
+            expected_series=self.expected_series,
+        )
+
+    @property
+    def endpoint(self)->str:
+        return f'{self.address}:{self.metrics_port}'
+
+    def __repr__(self)->str:
+        return f'TargetRecord(id={self.id!r}, address={self.address!r}, metrics_port={self.metrics_port})'
@@ -0,0 +1,50 @@
+import pytest
+import math
+from prometheus_ring.adt.avl_tree import AVLTree
+
+def test_insert_20_10_5_15_30_25_35():
+    """
+    Inserting 20, 10 and 5 rotates the tree to the right and inserting 25 rotates it back to the left
+                 20
+              /      \\
+             10        30
+           /    \\    /    \\
+          5      15 25     35
+    """
+    avl = AVLTree()
+    avl.insert(20, "value20")
+    avl.insert(10, "value10")
+    avl.insert(5, "value5")
+    assert avl.root.key == 10
+    avl.insert(15, "value15")
+    avl.insert(30, "value30")
+    avl.insert(25, "value25")
+    avl.insert(35, "value35")
+
+    assert avl.root.key == 20
+    assert [key for key, value in avl.inorder()] == [5, 10, 15, 20, 25, 30, 35]
+
+def test_ordered_insertion_stays_balanced():
+    """
+    Ordered insertion is the worst case for an unbalanced tree, degrading it to a linked list.
+    The AVL height must stay below 1.44 * log2(n + 2)
+    """
+    avl = AVLTree()
+    n = 1000
+    for key in range(n):
+        avl.insert(key, f'value{key}')
+    assert avl.root.height <= 1.44 * math.log2(n + 2)
+    assert avl.find_max_smaller_than(500) == 'value499'
+
+def test_remove_keeps_balance_and_order():
+    avl = AVLTree()
+    n = 1000
+    for key in range(n):
+        avl.insert(key, f'value{key}')
+    for key in range(0, n, 2):
+        avl.remove(key)
+    assert avl.size == n // 2
+    assert avl.root.height <= 1.44 * math.log2(n // 2 + 2)
+    assert [key for key, value in avl.inorder()] == list(range(1, n, 2))
+    assert avl.find_max_smaller_than(500) == 'value499'
+    assert avl.find_min_greater_than(500) == 'value501'
@@ -0,0 +1,139 @@
+import pytest
+import random
+from prometheus_ring.node import Node
+from prometheus_ring.columnar_node import ColumnarNode
+from prometheus_ring.target import Target, TargetRecord
+
+def record(key: str)->TargetRecord:
+    return TargetRecord.from_target(Target(id=key, name=f't{key}', address=f't{key}-address', labels={'env': 'test'}))
+
+def nodes(index: int = 0)->tuple[Node, ColumnarNode]:
+    return (
+        Node(index=index, capacity=1000, sd_provider='prometheus_ring_sd'),
+        ColumnarNode(index=index, capacity=1000, sd_provider='prometheus_ring_sd'),
+    )
+
+def filled_nodes(hashes: list[int])->tuple[Node, ColumnarNode]:
+    dict_node, columnar_node = nodes()
+    for key_hash in hashes:
+        for node in (dict_node, columnar_node):
+            node.insert(str(key_hash), record(str(key_hash)), key_hash)
+    return dict_node, columnar_node
+
+def test_rows_sorted_by_hash():
+    node = ColumnarNode(index=0, capacity=10, sd_provider='prometheus_ring_sd')
+    for key_hash in [50, 10, 30, 10, 20]:
+        node.insert(f'key-{len(node.targets)}', record(str(key_hash)), key_hash)
+    assert list(node._sorted_hashes) == [10, 10, 20, 30, 50]
+    assert node.get('key-3').id == '10'
+    assert node.get('key-1').to_target() == Target(id='10', name='t10', address='t10-address', labels={'env': 'test'})
+    assert node.get('missing') is None
+    assert node.load == 50
+    assert node.delete('key-1').id == '10'
+    assert list(node._sorted_hashes) == [10, 20, 30, 50]
+    assert node.get('key-3').id == '10'
+    assert not node.has_key('key-1')
+
+def test_update_and_replace():
+    node = ColumnarNode(index=0, capacity=10, sd_provider='prometheus_ring_sd')
+    node.insert('a', record('a'), 10)
+    node.update('a', record('b'))
+    assert node.get('a').id == 'b'
+    node.insert('a', record('c'), 10)
+    assert len(node.targets) == 1
+    assert node.targets['a'].id == 'c'
+
+def test_same_results_as_dict_node():
+    hashes = random.Random(0).sample(range(1, 10 ** 6), 500)
+    dict_node, columnar_node = filled_nodes(hashes)
+    assert sorted(columnar_node.range_hashes(1000, 500000)) == sorted(dict_node.range_hashes(1000, 500000))
+    assert columnar_node.calc_mid_hash() == dict_node.calc_mid_hash()
+    assert columnar_node.calc_mid_hash(1000, 500000) == dict_node.calc_mid_hash(1000, 500000)
+    for quantile in [0.1, 0.5, 0.9]:
+        assert columnar_node.calc_split_hash(quantile) == dict_node.calc_split_hash(quantile)
+        assert columnar_node.calc_split_hash(quantile, 1000, 500000) == dict_node.calc_split_hash(quantile, 1000, 500000)
+    assert columnar_node.calc_split_hashes(4) == dict_node.calc_split_hashes(4)
+    ranges = [(0, 100000), (300000, 310000), (600000, None)]
+    assert columnar_node.calc_range_mid_hashes(ranges) == dict_node.calc_range_mid_hashes(ranges)
+    assert columnar_node.copy_targets().keys() == dict_node.copy_targets().keys()
+
+def test_copied_columns_not_changed_by_node():
+    dict_node, columnar_node = filled_nodes([30, 10, 20])
+    columns = columnar_node.copy_targets()
+    columnar_node.delete('10')
+    columnar_node.insert('40', record('40'), 40)
+    assert list(columns) == ['10', '20', '30']
+    assert '10' in columns and '40' not in columns
+    assert columns['20'].to_target() == dict_node.get('20').to_target()
+    assert list(columns.iter_endpoints()) == [(key, dict_node.get(key).endpoint) for key in ['10', '20', '30']]
+
+def test_export_keys_slice():
+    hashes = list(range(0, 1000, 10))
+    dict_node, columnar_node = filled_nodes(hashes)
+    dict_other, columnar_other = nodes(1)
+    dict_node.export_keys(dict_other, 500, 800)
+    columnar_node.export_keys(columnar_other, 500, 800)
+    assert list(columnar_other._sorted_hashes) == list(range(500, 800, 10))
+    assert sorted(columnar_other.hashes.items()) == sorted(dict_other.hashes.items())
+    assert sorted(columnar_node.hashes.items()) == sorted(dict_node.hashes.items())
+    assert list(columnar_node._sorted_hashes) == list(range(0, 500, 10)) + list(range(800, 1000, 10))
+
+    columnar_node.export_keys(columnar_other, 800)            # After the rows of the other node
+    columnar_node.export_keys(columnar_other, 0, 100)         # Before them
+    columnar_other.export_keys(columnar_node, 900)
+    assert list(columnar_node._sorted_hashes) == list(range(100, 500, 10)) + list(range(900, 1000, 10))
+    assert list(columnar_other._sorted_hashes) == list(range(0, 100, 10)) + list(range(500, 900, 10))
+    columnar_node.export_keys(columnar_other)                 # Interleaved rows are merged
+    assert list(columnar_other._sorted_hashes) == hashes
+    assert len(columnar_node.targets) == 0
+    assert columnar_other.get('100').id == '100'
+
+def test_export_keys_many():
+    hashes = list(range(0, 1000, 10))
+    dict_node, columnar_node = filled_nodes(hashes)
+    dict_others = [Node(index=i, capacity=1000, sd_provider='prometheus_ring_sd') for i in range(1, 4)]
+    columnar_others = [ColumnarNode(index=i, capacity=1000, sd_provider='prometheus_ring_sd') for i in range(1, 4)]
+    dict_node.export_keys_many(dict_others, [200, 455, 700], 900)
+    columnar_node.export_keys_many(columnar_others, [200, 455, 700], 900)
+    for dict_other, columnar_other in zip(dict_others, columnar_others):
+        assert sorted(columnar_other.hashes.items()) == sorted(dict_other.hashes.items())
+    assert sorted(columnar_node.hashes.items()) == sorted(dict_node.hashes.items())
+
+def test_key_index_follows_exports():
+    key_index = dict()
+    node = ColumnarNode(index=0, capacity=10, sd_provider='prometheus_ring_sd', key_index=key_index)
+    other = ColumnarNode(index=1, capacity=10, sd_provider='prometheus_ring_sd', key_index=key_index)
+    for key_hash in [10, 20, 30]:
+        node.insert(str(key_hash), record(str(key_hash)), key_hash)
+    node.export_keys(other, 20)
+    assert key_index == {'10': (10, node), '20': (20, other), '30': (30, other)}
+    assert other.pop_all()[0][0] == '20'
+    assert key_index == {'10': (10, node)}
+
+def test_keys_in_range_and_split_at():
+    dict_node, columnar_node = filled_nodes(random.Random(3).sample(range(1, 10**6), 200))
+    assert columnar_node.keys_in_range(1000, 500000) == dict_node.keys_in_range(1000, 500000)
+    columnar_other = columnar_node.split_at(500000, index=500000)
+    dict_other = dict_node.split_at(500000, index=500000)
+    assert isinstance(columnar_other, ColumnarNode)
+    assert columnar_other.keys_in_range(-1, None) == dict_other.keys_in_range(-1, None)
+    assert columnar_node.keys_in_range(-1, None) == dict_node.keys_in_range(-1, None)
+
+def test_weighted_same_results_as_dict_node():
+    generator = random.Random(5)
+    dict_node, columnar_node = nodes()
+    for key_hash in generator.sample(range(1, 10 ** 6), 300):
+        weighted_record = TargetRecord.from_target(Target(id=str(key_hash), name='t', address='a', expected_series=generator.randint(1, 1000)))
+        for node in (dict_node, columnar_node):
+            node.insert(str(key_hash), weighted_record, key_hash)
+    assert columnar_node.weight == dict_node.weight == sum(dict_node.range_weights(-1, None))
+    assert columnar_node.calc_mid_hash() == dict_node.calc_mid_hash()
+    assert columnar_node.calc_split_hash(0.3, 1000, 500000) == dict_node.calc_split_hash(0.3, 1000, 500000)
+    assert columnar_node.calc_split_hashes(4) == dict_node.calc_split_hashes(4)
+    dict_other, columnar_other = nodes(1)
+    dict_node.export_keys(dict_other, 500000)
+    columnar_node.export_keys(columnar_other, 500000)
+    assert columnar_other.weight == dict_other.weight
+    assert columnar_node.weight == dict_node.weight
+    columnar_node.update(columnar_node._keys[0], record('x'))
+    assert columnar_node.weight == sum(columnar_node._weights)
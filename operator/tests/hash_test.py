@@ -0,0 +1,34 @@
+import pytest
+import hashlib
+from prometheus_ring import hash as hash_module
+from prometheus_ring.hash import stable_hash, set_hash_function, hash_space, sha1_hash, blake2b_hash, HashFunctionDoesNotExist, MAX_HASH_SIZE_DIGITS
+
+@pytest.fixture
+def restore_hash_function():
+    name = hash_module.hash_function_name
+    yield
+    set_hash_function(name)
+
+def test_sha1_hash_is_legacy_hash():
+    for key in ['1234', 'abcd', 'target-1']:
+        assert sha1_hash(key) == int(hashlib.sha1(key.encode()).hexdigest(), 16) % MAX_HASH_SIZE_DIGITS
+
+def test_64_bits_hashes():
+    keys = [f'target-{i}' for i in range(1000)]
+    hashes = [blake2b_hash(key) for key in keys]
+    assert all(0 <= key_hash < 2 ** 64 for key_hash in hashes)
+    assert len(set(hashes)) == len(keys)
+    assert max(hashes) > MAX_HASH_SIZE_DIGITS               # Uses the whole space, not only the legacy one
+
+def test_set_hash_function(restore_hash_function):
+    set_hash_function('sha1')
+    assert stable_hash('1234') == sha1_hash('1234')
+    assert hash_space() == MAX_HASH_SIZE_DIGITS
+    set_hash_function('blake2b')
+    assert stable_hash('1234') == blake2b_hash('1234')
+    assert hash_space() == 2 ** 64
+
+def test_set_invalid_hash_function(restore_hash_function):
+    for name in ['md5', 'fnv1a']:
+        with pytest.raises(HashFunctionDoesNotExist):
+            set_hash_function(name)
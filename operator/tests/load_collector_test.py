@@ -0,0 +1,132 @@
+import pytest
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from prometheus_ring.load_collector import LoadCollector, NodeMetrics, parse_metrics
+from prometheus_ring.ring import Ring
+from prometheus_ring.node import Node
+from prometheus_ring.adt.avl_tree import AVLTree
+from prometheus_ring.target import Target
+from prometheus_ring.capacity_class import CapacityClass
+
+METRICS = """# HELP prometheus_tsdb_head_series Total number of series in the head block.
+# TYPE prometheus_tsdb_head_series gauge
+prometheus_tsdb_head_series 9
+# HELP process_resident_memory_bytes Resident memory size in bytes.
+# TYPE process_resident_memory_bytes gauge
+process_resident_memory_bytes 1.5e+06
+prometheus_tsdb_head_series_created_total 120
+"""
+
+class FakePrometheus(ThreadingHTTPServer):
+    """
+    Serves a /metrics endpoint standing in for the prometheus instance of a node
+    """
+    def __init__(self)->None:
+        super().__init__(('127.0.0.1', 0), FakeMetricsHandler)
+        self.metrics = METRICS
+        self.requests = 0
+
+class FakeMetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self)->None:
+        self.server.requests += 1
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.metrics.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args)->None:
+        ...
+
+@pytest.fixture
+def fake_prometheus():
+    server = FakePrometheus()
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def ring_on(port: int, **kwargs)->Ring:
+    return Ring(
+        node_capacity=10,
+        node_min_load=25,
+        node_max_load=75,
+        sd_provider='prometheus_ring_sd',
+        sd_host='localhost',
+        sd_port='9090',
+        adt=AVLTree(),
+        node_base_ports=port,               # Node zero is published on the port of the fake prometheus
+        **kwargs
+    )
+
+def test_parse_metrics():
+    text = METRICS + 'prometheus_tsdb_head_series{shard="a b"} 3\nprometheus_tsdb_head_series NaN-ish\n'
+    values = parse_metrics(text, {'prometheus_tsdb_head_series', 'process_resident_memory_bytes', 'up'})
+    assert values == {'prometheus_tsdb_head_series': 12, 'process_resident_memory_bytes': 1.5e6}
+
+def test_scrape_node(fake_prometheus):
+    node = Node(index=3, capacity=10, sd_provider='prometheus_ring_sd', port=fake_prometheus.server_port)
+    collector = LoadCollector('127.0.0.1')
+    assert collector.scrape(node) == NodeMetrics(3, 9, 1.5e6)
+    assert collector.collect([node]) == {3: 90}
+    assert LoadCollector('127.0.0.1', memory_limit=10 ** 6).collect([node]) == {3: 150}      # Memory pressure is higher
+
+def test_unreachable_and_invalid_nodes(fake_prometheus):
+    fake_prometheus.metrics = 'up 1\n'
+    node = Node(index=1, capacity=10, sd_provider='prometheus_ring_sd', port=fake_prometheus.server_port)
+    collector = LoadCollector('127.0.0.1', timeout=1)
+    assert collector.collect([node]) == {}
+    fake_prometheus.shutdown()
+    fake_prometheus.server_close()
+    assert collector.collect([node]) == {}
+
+def test_measured_load_splits_node(fake_prometheus):
+    ring = ring_on(fake_prometheus.server_port)
+    targets = [Target(id=str(i), name=f't{i}', address=f't{i}-address') for i in range(4)]
+    ring.insert_many(targets, [target.id for target in targets])
+    assert ring.node_zero.load == 40
+    loads = LoadCollector('127.0.0.1').collect(ring.get_nodes())
+    assert loads == {0: 90}                                 # 9 head series measured, for 4 expected
+    new_nodes = ring.measure_loads(loads)
+    assert len(new_nodes) == 1
+    assert fake_prometheus.requests == 1
+    for node in ring.get_nodes():                           # The measured series move with the targets
+        assert node.load == int(len(node.targets) * 90 / 4)
+        assert node.load <= 75
+
+def test_measured_load_follows_targets(fake_prometheus):
+    ring = ring_on(fake_prometheus.server_port)
+    fake_prometheus.metrics = 'prometheus_tsdb_head_series 1\n'
+    targets = [Target(id=str(i), name=f't{i}', address=f't{i}-address') for i in range(4)]
+    ring.insert_many(targets, [target.id for target in targets])
+    assert ring.measure_loads(LoadCollector('127.0.0.1').collect(ring.get_nodes())) == []
+    assert ring.node_zero.load == 10                        # Fewer series than expected
+    for i in range(4, 8):
+        ring.insert(Target(id=str(i), name=f't{i}', address=f't{i}-address'), str(i))
+    assert ring.node_zero.load == 20
+    assert len(ring.get_nodes()) == 1                       # Unmeasured, 8 targets would have split the node
+
+def test_memory_reservation_of_capacity_class(fake_prometheus):
+    capacity_class = CapacityClass(name='small', capacity=100, memory_reservation=10 ** 6)
+    node = Node(index=2, capacity=10, sd_provider='prometheus_ring_sd', port=fake_prometheus.server_port, capacity_class=capacity_class)
+    assert node.capacity == 100
+    assert LoadCollector('127.0.0.1', memory_limit=10 ** 7).collect([node]) == {2: 150}
+
+def test_zero_measured_load_is_ignored(fake_prometheus):
+    ring = ring_on(fake_prometheus.server_port)
+    fake_prometheus.metrics = 'prometheus_tsdb_head_series 0\n'         # Not scraping its targets yet
+    targets = [Target(id=str(i), name=f't{i}', address=f't{i}-address') for i in range(4)]
+    ring.insert_many(targets, [target.id for target in targets])
+    assert ring.measure_loads(LoadCollector('127.0.0.1').collect(ring.get_nodes())) == []
+    assert ring.node_zero.measured_load_per_weight is None
+    assert ring.node_zero.load == 40                        # Still estimated from its expected series
+    for i in range(4, 10):
+        ring.insert(Target(id=str(i), name=f't{i}', address=f't{i}-address'), str(i))
+    assert len(ring.get_nodes()) > 1
+    for node in ring.get_nodes():
+        assert node.load <= 75
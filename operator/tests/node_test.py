@@ -1,7 +1,7 @@
 import pytest
 import pytest_mock
 from prometheus_ring.node import Node
-from prometheus_ring.target import Target
+from prometheus_ring.target import Target, TargetRecord
 from prometheus_ring.hash import stable_hash
 import math
 
@@ -381,3 +381,114 @@ def test_export_even_number_of_keys():
     assert node2.get(hash_to_ids[hashed_ids[3]]) is not None
     assert node2.get(hash_to_ids[hashed_ids[4]]) is not None
 
+def make_record(key: str)->TargetRecord:
+    """
+    Record of a target keyed by its id, as the ring stores it
+    """
+    return TargetRecord.from_target(Target(id=key, name=f't{key}', address=f't{key}-address'))
+
+def test_calc_split_hash_median(mocker):
+    mocker.patch('prometheus_ring.node.stable_hash', side_effect=lambda x: int(x))
+
+    node1 = Node(index=0, capacity=10, sd_provider='prometheus_ring_sd')
+    for key in ['1', '2', '7', '500', '5001', '18000']:
+        node1.insert(key, make_record(key))
+
+    # The mean (3918) would leave only two keys to the new node
+    assert node1.calc_split_hash() == 500
+    assert node1.calc_split_hash(quantile=0.25) == 2
+    assert node1.calc_split_hash(first_key_hash=0, last_key_hash=5001) == 7
+
+def test_calc_split_hash_hashes_each_key_once(mocker):
+    hash_mock = mocker.patch('prometheus_ring.node.stable_hash', side_effect=lambda x: int(x))
+
+    node1 = Node(index=0, capacity=10, sd_provider='prometheus_ring_sd')
+    for key in ['1', '2', '7', '500', '5001']:
+        node1.insert(key, make_record(key))
+    assert node1.calc_split_hash() == 7
+    assert hash_mock.call_count == 5
+
+def test_insert_keeps_provided_hash(mocker):
+    hash_mock = mocker.patch('prometheus_ring.node.stable_hash', side_effect=lambda x: int(x))
+
+    node1 = Node(index=0, capacity=10, sd_provider='prometheus_ring_sd')
+    node1.insert('1', make_record('1'), key_hash=100)
+    node1.insert('2', make_record('2'))
+    assert node1.get_hash('1') == 100
+    assert node1.get_hash('2') == 2
+    assert hash_mock.call_count == 1
+    node1.delete('1')
+    assert node1.get_hash('1') is None
+
+def test_export_keys_does_not_rehash(mocker):
+    hash_mock = mocker.patch('prometheus_ring.node.stable_hash', side_effect=lambda x: int(x))
+
+    node1 = Node(index=0, capacity=10, sd_provider='prometheus_ring_sd')
+    node2 = Node(index=1, capacity=10, sd_provider='prometheus_ring_sd')
+    for key in ['1', '2', '7', '500', '5001']:
+        node1.insert(key, make_record(key))
+    node1.export_keys(node2, node1.calc_mid_hash())
+    assert sorted(node2.targets.keys()) == ['5001']
+    assert node2.get_hash('5001') == 5001
+    assert hash_mock.call_count == 5
+
+def test_keys_in_range(mocker):
+    mocker.patch('prometheus_ring.node.stable_hash', side_effect=lambda x: int(x))
+
+    node1 = Node(index=0, capacity=10, sd_provider='prometheus_ring_sd')
+    for key in ['500', '7', '5001', '1', '2']:
+        node1.insert(key, make_record(key))
+    assert node1.keys_in_range(2, 500) == ['2', '7']
+    assert node1.keys_in_range(3, None) == ['7', '500', '5001']
+    assert node1.keys_in_range(600, 5001) == []
+    node1.insert('7', make_record('7'), key_hash=1000)
+    node1.delete('500')
+    assert node1.keys_in_range(3, None) == ['7', '5001']
+
+def test_split_at(mocker):
+    mocker.patch('prometheus_ring.node.stable_hash', side_effect=lambda x: int(x))
+
+    key_index = dict()
+    node1 = Node(index=0, capacity=10, sd_provider='prometheus_ring_sd', scrape_interval='2m', key_index=key_index)
+    targets = {key: make_record(key) for key in ['1', '2', '7', '500', '5001']}
+    for key, target in targets.items():
+        node1.insert(key, target)
+    records = {key: node1.get(key) for key in targets}
+    node2 = node1.split_at(7, index=7, last_key_hash=5001)
+    assert node2.index == 7 and node2.tokens == [7]
+    assert node2.scrape_interval == '2m'
+    assert node2.keys_in_range(-1, None) == ['7', '500']
+    assert node1.keys_in_range(-1, None) == ['1', '2', '5001']
+    assert node2.get('500') is records['500']               # Moved, not copied
+    assert key_index['500'] == (500, node2)
+    assert key_index['5001'] == (5001, node1)
+
+def test_export_keys_visits_only_exported_keys(mocker):
+    mocker.patch('prometheus_ring.node.stable_hash', side_effect=lambda x: int(x))
+
+    node1 = Node(index=0, capacity=1000, sd_provider='prometheus_ring_sd')
+    node2 = Node(index=1, capacity=1000, sd_provider='prometheus_ring_sd')
+    for key in range(1000):
+        node1.insert(str(key), make_record(str(key)))
+    insert_spy = mocker.spy(node2, 'insert')
+    node1.export_keys(node2, 990)
+    assert insert_spy.call_count == 10
+    assert len(node1.targets) == len(node1.hashes) == len(node1.sorted_keys) == 990
+    assert node2.keys_in_range(-1, None) == [str(key) for key in range(990, 1000)]
+
+def test_weighted_load(mocker):
+    mocker.patch('prometheus_ring.node.stable_hash', side_effect=lambda x: int(x))
+
+    node1 = Node(index=0, capacity=100, sd_provider='prometheus_ring_sd')
+    node2 = Node(index=1, capacity=100, sd_provider='prometheus_ring_sd')
+    for key, expected_series in [('1', 10), ('2', 10), ('3', 10), ('4', 50)]:
+        node1.insert(key, TargetRecord.from_target(Target(id=key, name=f't{key}', address=f't{key}-address', expected_series=expected_series)))
+    assert node1.load == 80
+    assert node1.calc_mid_hash() == 3                       # (1 * 10 + 2 * 10 + 3 * 10 + 4 * 50) // 80
+    assert node1.calc_split_hash() == 4                     # The heavy key holds most of the series
+    node1.update('4', TargetRecord.from_target(Target(id='4', name='t4', address='t4-address', expected_series=70)))
+    assert node1.is_full()
+    node1.export_keys(node2, 3)
+    assert (node1.weight, node2.weight) == (20, 80)
+    node2.delete('4')
+    assert node2.load == 10
@@ -0,0 +1,65 @@
+import pytest
+import numpy as np
+from prometheus_ring.resharding import ReshardingStep, ideal_boundaries, plan_resharding
+
+def test_ideal_boundaries():
+    hashes = np.arange(100, dtype=np.uint64)
+    np.random.default_rng(0).shuffle(hashes)
+    assert ideal_boundaries(hashes, 4).tolist() == [0, 25, 50, 75]
+    assert ideal_boundaries(hashes, 1).tolist() == [0]
+
+def test_ideal_boundaries_repeated_hashes():
+    hashes = np.array([0, 0, 0, 0, 5, 5, 5, 5], dtype=np.uint64)
+    assert ideal_boundaries(hashes, 4).tolist() == [0, 5]
+
+def test_balanced_ring_has_no_steps():
+    hashes = np.arange(100, dtype=np.uint64)
+    plan = plan_resharding(hashes, [(0, 0), (25, 25), (50, 50), (75, 75)], target_count=25)
+    assert plan.steps == []
+    assert plan.moved_keys == 0
+    assert plan.node_count == 4
+
+def test_plan_minimizes_moved_keys():
+    """
+    Node 90 owns 10 keys and node zero 90. Moving node 90 to 75 and splitting at 25 and 50
+    moves 65 keys, while moving it to 25 and splitting at 50 and 75 would move 115
+    """
+    hashes = np.arange(100, dtype=np.uint64)
+    plan = plan_resharding(hashes, [(0, 0), (90, 90)], target_count=25)
+    assert plan.steps == [
+        ReshardingStep('split', None, None, 25, 25),
+        ReshardingStep('split', None, None, 50, 25),
+        ReshardingStep('move', 90, 90, 75, 15),
+    ]
+    assert plan.moved_keys == 65
+    assert plan.node_count == 4
+
+def test_plan_merges_underloaded_nodes():
+    hashes = np.arange(100, dtype=np.uint64)
+    plan = plan_resharding(hashes, [(0, 0), (10, 10), (20, 20), (50, 50)], target_count=50)
+    assert [step.action for step in plan.steps] == ['merge', 'merge']
+    assert [step.node_index for step in plan.steps] == [10, 20]
+    assert plan.moved_keys == 40
+    assert plan.node_count == 2
+
+def test_plan_with_moved_keys_budget():
+    hashes = np.arange(100, dtype=np.uint64)
+    plan = plan_resharding(hashes, [(0, 0), (90, 90)], target_count=25, max_moved_keys=30)
+    assert plan.steps == [ReshardingStep('split', None, None, 25, 25)]
+    assert plan.moved_keys == 25
+    assert plan.node_count == 3
+
+def test_ideal_boundaries_weighted():
+    """
+    The keys from 50 weigh 3 times the first ones, so they take three quarters of the nodes
+    """
+    hashes = np.arange(100, dtype=np.uint64)
+    weights = np.array([1] * 50 + [3] * 50)
+    assert ideal_boundaries(hashes, 4, weights).tolist() == [0, 50, 67, 84]
+
+def test_plan_with_weights():
+    hashes = np.arange(100, dtype=np.uint64)
+    weights = np.array([1] * 50 + [3] * 50)
+    plan = plan_resharding(hashes, [(0, 0), (50, 50)], target_count=50, weights=weights)
+    assert [(step.action, step.new_token) for step in plan.steps] == [('split', 67), ('split', 84)]
+    assert plan.node_count == 4
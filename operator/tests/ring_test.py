@@ -1,11 +1,16 @@
 import pytest
 import pytest_mock
-from prometheus_ring.ring import Ring, KeyAlreadyExistsError, KeyNotFoundError
+import threading
+import sys
+from prometheus_ring.ring import Ring, RebalanceReport, KeyAlreadyExistsError, KeyNotFoundError, NodeAlreadyExistsError, InvalidPlacementPolicyError, InvalidNodeStorageError, ReshardingNotSupportedError, StaleReshardingPlanError
 from prometheus_ring.node import Node
 from prometheus_ring.adt.abstract_data_type import AbstractDataType
 from prometheus_ring.adt.binary_search_tree import BinarySearchTree
-from prometheus_ring.target import Target
-from prometheus_ring.hash import stable_hash
+from prometheus_ring.adt.avl_tree import AVLTree
+from prometheus_ring.target import Target, TargetRecord
+from prometheus_ring.capacity_class import CapacityClass
+from prometheus_ring import hash as hash_module
+from prometheus_ring.hash import stable_hash, set_hash_function
 
 
 class MockADT(AbstractDataType):
@@ -26,6 +31,14 @@ class MockADT(AbstractDataType):
             
         return None
 
+    def find_min_greater_than(self, hash_value):
+        keys = sorted(self.data.keys())
+        for key in keys:
+            if key > hash_value:
+                return self.data[key]
+
+        return None
+
     def update(self, key, new_value):
         self.data[key] = new_value
 
@@ -35,6 +48,48 @@ class MockADT(AbstractDataType):
     def remove(self, key):
         del self.data[key]
 
+    def inorder(self):
+        return sorted(self.data.items())
+
+    def iter_range(self, first_key, last_key):
+        return iter([(key, value) for key, value in self.inorder() if first_key <= key < last_key])
+
+@pytest.fixture
+def make_ring():
+    """
+    Factory of rings over an AVL tree, with nodes of capacity 10 scaling at 25% and 75%.
+    The keyword arguments replace the default settings
+    """
+    def make(**kwargs)->Ring:
+        settings = dict(
+            node_capacity=10,
+            node_min_load=25,
+            node_max_load=75,
+            sd_provider='prometheus_ring_sd',
+            sd_host='localhost',
+            sd_port='9090',
+            adt=AVLTree(),
+        )
+        return Ring(**(settings | kwargs))
+    return make
+
+@pytest.fixture
+def mocked_hashes(mocker):
+    """
+    The hash of a key is the key as an integer
+    """
+    mocker.patch('prometheus_ring.ring.stable_hash', side_effect=lambda x: int(x))
+    mocker.patch('prometheus_ring.node.stable_hash', side_effect=lambda x: int(x))
+
+def make_targets(count: int, prefix: str = 'target')->list[Target]:
+    return [Target(id=f'{prefix}-{i}', name=f't{i}', address=f't{i}-address') for i in range(count)]
+
+def insert_key(ring: Ring, key: int, expected_series: int = 1)->Node | None:
+    """
+    Inserts a target keyed by an integer, for the rings with mocked hashes
+    """
+    return ring.insert(Target(id=str(key), name=f't{key}', address=f't{key}-address', expected_series=expected_series), str(key))
+
 @pytest.fixture
 def ring_mock_adt():
     adt = MockADT()
@@ -42,7 +97,8 @@ def ring_mock_adt():
         node_capacity=4,
         node_min_load=25,
         node_max_load=75,           # Scaling up at 75%
-        sd_url='localhost',
+        sd_provider='prometheus_ring_sd',
+        sd_host='localhost',
         sd_port='9090',
         adt=adt
     )
@@ -53,11 +109,39 @@ def ring_bst():
         node_capacity=4,
         node_min_load=25,
         node_max_load=75,           # Scaling up at 75%
-        sd_url='localhost',
+        sd_provider='prometheus_ring_sd',
+        sd_host='localhost',
         sd_port='9090',
         adt=BinarySearchTree()
     )
 
+@pytest.fixture
+def ring_vnodes():
+    return Ring(
+        node_capacity=20,
+        node_min_load=25,
+        node_max_load=75,
+        sd_provider='prometheus_ring_sd',
+        sd_host='localhost',
+        sd_port='9090',
+        adt=AVLTree(),
+        vnode_count=8
+    )
+
+@pytest.fixture
+def ring_bounded_load():
+    return Ring(
+        node_capacity=20,
+        node_min_load=25,
+        node_max_load=75,
+        sd_provider='prometheus_ring_sd',
+        sd_host='localhost',
+        sd_port='9090',
+        adt=AVLTree(),
+        placement_policy='bounded_load',
+        load_balance_factor=1.25
+    )
+
 class TestMockAdt:
     def test_insert_target(self, ring_mock_adt):
         target = Target(id='1234', name='t1', address='t1-address', metrics_port=8000, metrics_path='/metrics')
@@ -557,3 +641,1042 @@ class TestBST:
         assert ring_bst.delete('20') is None
         assert ring_bst.delete('10') is None
         assert ring_bst.delete('0') is None
+
+class TestVnodes:
+    def test_node_zero_tokens(self, ring_vnodes):
+        assert len(ring_vnodes.node_zero.tokens) == 8
+        assert 0 in ring_vnodes.node_zero.tokens
+        assert ring_vnodes.get_nodes() == [ring_vnodes.node_zero]
+
+    def test_insert_many_targets(self, ring_vnodes):
+        targets = make_targets(400)
+        new_nodes = [ring_vnodes.insert(target, target.id) for target in targets]
+        new_nodes = [node for node in new_nodes if node is not None]
+        nodes = ring_vnodes.get_nodes()
+
+        assert len(nodes) == len(new_nodes) + 1
+        assert len(ring_vnodes.ring.inorder()) == 8 * len(nodes)          # Every node owns all of its tokens
+        for node in nodes:
+            assert len(node.tokens) == 8
+        for target in targets:
+            assert ring_vnodes.get(target.id) == target
+        assert sum(len(node.targets) for node in nodes) == len(targets)
+
+    def test_split_relieves_overloaded_node(self, ring_vnodes):
+        targets = make_targets(16)
+        for target in targets[:15]:
+            assert ring_vnodes.insert(target, target.id) is None
+        new_node = ring_vnodes.insert(targets[15], targets[15].id)             # 80% of the capacity
+        assert new_node is not None
+        assert ring_vnodes.node_zero.load <= ring_vnodes.node_max_load
+        assert len(new_node.targets) > 0
+
+    def test_no_split_without_splittable_range(self, ring_vnodes, mocked_hashes):
+        """
+        The only key of node zero is at its token 0, so none of its ranges can be split
+        """
+        assert insert_key(ring_vnodes, 0, expected_series=16) is None          # 80% of the capacity
+        assert ring_vnodes.get_nodes() == [ring_vnodes.node_zero]
+        assert len(ring_vnodes.ring.inorder()) == 8
+        assert ring_vnodes.split_count == 0
+        assert ring_vnodes.suppressed_split_count == 1
+        assert ring_vnodes._split_node_many(ring_vnodes.node_zero, 3) == []
+
+    @pytest.mark.parametrize('node_storage', Ring.node_storages)
+    def test_split_range_holding_other_new_token(self, mocker, make_ring, node_storage):
+        """
+        The new tokens 100 and 200 fall in the same range of node zero, and 300 is placed first.
+        The range of 100 ends at 200 and the range of 200 must still be exported
+        """
+        ring = make_ring(vnode_count=3, node_storage=node_storage)
+        mocked_hash = lambda key: int(key) if key.isdigit() else stable_hash(key)
+        mocker.patch('prometheus_ring.ring.stable_hash', side_effect=mocked_hash)
+        mocker.patch('prometheus_ring.node.stable_hash', side_effect=mocked_hash)
+        for key in range(1, 400, 10):
+            ring.node_zero.insert(str(key), TargetRecord.from_target(Target(id=str(key), name=f't{key}', address=f't{key}-address'), ring.label_sets), key)
+        mocker.patch.object(ring.node_zero, 'calc_range_mid_hashes', return_value=[300, 100, 200])
+        new_node = ring._split_node_vnodes(ring.node_zero)
+        assert sorted(new_node.tokens) == [100, 200, 300]
+        assert len(new_node.targets) == 30
+        for node in ring.get_nodes():
+            for key in node.targets:
+                assert ring._find_node(node.get_hash(key)) is node
+
+    def test_merge_spreads_targets_over_neighbours(self, ring_vnodes):
+        targets = make_targets(400)
+        for target in targets:
+            ring_vnodes.insert(target, target.id)
+
+        for target in targets:
+            loads_before = {node.index: len(node.targets) for node in ring_vnodes.get_nodes()}
+            deleted_node = ring_vnodes.delete(target.id)
+            if deleted_node is not None:
+                receivers = [
+                    node for node in ring_vnodes.get_nodes()
+                    if len(node.targets) > loads_before[node.index]
+                ]
+                assert len(receivers) > 1
+                break
+        else:
+            pytest.fail('The ring never scaled down')
+
+    def test_delete_all_targets(self, ring_vnodes):
+        targets = make_targets(400)
+        for target in targets:
+            ring_vnodes.insert(target, target.id)
+        for i, target in enumerate(targets):
+            ring_vnodes.delete(target.id)
+            for remaining_target in targets[i + 1:i + 20]:
+                assert ring_vnodes.get(remaining_target.id) == remaining_target
+        assert sum(len(node.targets) for node in ring_vnodes.get_nodes()) == 0
+        assert len(ring_vnodes.ring.inorder()) == 8 * len(ring_vnodes.get_nodes())
+
+class TestBoundedLoad:
+    def test_invalid_placement_policy(self, make_ring):
+        with pytest.raises(InvalidPlacementPolicyError):
+            make_ring(node_capacity=20, placement_policy='random')
+
+    def test_spills_to_next_node(self, ring_bounded_load, mocked_hashes):
+        """
+        All of the hashes are owned by node 0. The bound is ceil(1.25 * (targets + 1) / nodes)
+        x. (0)[], (1000)[]
+        0. (0)[0], (1000)[]                 # bound 1
+        1. (0)[0, 1], (1000)[]              # bound 2
+        2. (0)[0, 1], (1000)[2]             # bound 2: 2 spills to the next node
+        3. (0)[0, 1, 3], (1000)[2]          # bound 3
+        4. (0)[0, 1, 3, 4], (1000)[2]       # bound 4
+        """
+        second_node = ring_bounded_load._create_node(index=1000)
+        ring_bounded_load.ring.insert(1000, second_node)
+        for i in range(5):
+            target = Target(id=str(i), name=f't{i}', address=f't{i}-address')
+            assert ring_bounded_load.insert(target, target.id) is None
+        assert len(ring_bounded_load.node_zero.targets) == 4
+        assert len(second_node.targets) == 1
+        assert ring_bounded_load.get_target_node('2') is second_node
+        assert ring_bounded_load.get('2').id == '2'
+
+        with pytest.raises(KeyAlreadyExistsError):
+            ring_bounded_load.insert(Target(id='2', name='t2', address='t2-address'), '2')
+        ring_bounded_load.delete('2')
+        assert '2' not in ring_bounded_load.key_index
+        with pytest.raises(KeyNotFoundError):
+            ring_bounded_load.get('2')
+
+    def test_spills_from_node_measured_full(self, ring_bounded_load, mocked_hashes):
+        second_node = ring_bounded_load._create_node(index=1000)
+        ring_bounded_load.ring.insert(1000, second_node)
+        insert_key(ring_bounded_load, 0)
+        ring_bounded_load.measure_loads({0: 75})                # Each series of node zero counts as 75%
+        insert_key(ring_bounded_load, 1)
+        assert ring_bounded_load.get_target_node('1') is second_node
+
+    def test_splits_only_when_ring_is_saturated(self, ring_bounded_load):
+        targets = make_targets(400)
+        for target in targets:
+            ring_bounded_load.insert(target, target.id)
+            mean_load = ring_bounded_load.target_count * 100 // (len(ring_bounded_load.nodes) * ring_bounded_load.node_capacity)
+            assert mean_load <= ring_bounded_load.node_max_load
+        nodes = ring_bounded_load.get_nodes()
+        for target in targets:
+            assert ring_bounded_load.get(target.id) == target
+        for node in nodes:
+            assert node.load <= ring_bounded_load.node_max_load
+        assert sum(len(node.targets) for node in nodes) == len(targets)
+
+    def test_less_nodes_than_split_placement(self, ring_bounded_load, make_ring):
+        targets = make_targets(400)
+        split_ring = make_ring(node_capacity=20)
+        for target in targets:
+            ring_bounded_load.insert(target, target.id)
+            split_ring.insert(target, target.id)
+        assert len(ring_bounded_load.nodes) < len(split_ring.nodes)
+
+    def test_delete_all_targets(self, ring_bounded_load):
+        targets = make_targets(400)
+        for target in targets:
+            ring_bounded_load.insert(target, target.id)
+        for i, target in enumerate(targets):
+            ring_bounded_load.delete(target.id)
+            for remaining_target in targets[i + 1:i + 20]:
+                assert ring_bounded_load.get(remaining_target.id) == remaining_target
+        assert ring_bounded_load.target_count == 0
+        assert ring_bounded_load.key_index == {}
+
+@pytest.fixture
+def restore_hash_function():
+    name = hash_module.hash_function_name
+    yield
+    set_hash_function(name)
+
+class TestRehash:
+    @pytest.mark.parametrize('vnode_count', [1, 8])
+    def test_rehash_to_64_bits(self, restore_hash_function, vnode_count, make_ring):
+        set_hash_function('sha1')
+        ring = make_ring(node_capacity=20, vnode_count=vnode_count)
+        targets = [Target(id=f'target-{i}', name=f't{i}', address=f't{i}-address') for i in range(200)]
+        for target in targets:
+            ring.insert(target, target.id)
+        indexes = set(ring.nodes.keys())
+
+        new_nodes = ring.rehash('blake2b')
+        assert set(ring.nodes.keys()) == indexes | {node.index for node in new_nodes}
+        assert len(ring.ring.inorder()) == vnode_count * len(ring.nodes)
+        for target in targets:
+            assert ring.get(target.id) == target
+            assert ring.get_target_node(target.id).get_hash(target.id) == stable_hash(target.id)
+        for node in ring.get_nodes():
+            assert node.load <= ring.node_max_load
+        assert max(token for node in ring.nodes.values() for token in node.tokens) > hash_module.MAX_HASH_SIZE_DIGITS
+
+class TestInsertMany:
+    @pytest.mark.parametrize('kwargs', [{}, {'vnode_count': 8}, {'placement_policy': 'bounded_load'}, {'split_strategy': 'quantile'}, {'node_storage': 'columnar'}, {'node_storage': 'columnar', 'vnode_count': 8}])
+    def test_insert_many(self, kwargs, make_ring):
+        ring = make_ring(node_capacity=20, **kwargs)
+        targets = make_targets(400)
+        new_nodes = ring.insert_many(targets, [target.id for target in targets])
+
+        assert len(ring.nodes) == len(new_nodes) + 1
+        assert ring.target_count == len(targets)
+        for target in targets:
+            assert ring.get(target.id) == target
+        for node in ring.get_nodes():
+            assert node.load <= ring.node_max_load
+        assert sum(len(node.targets) for node in ring.get_nodes()) == len(targets)
+
+    def test_insert_many_splits_once_at_the_end(self, mocker, make_ring):
+        ring = make_ring(node_capacity=20)
+        targets = make_targets(400)
+        split_mock = mocker.spy(ring, '_split_node_many')
+        new_nodes = ring.insert_many(targets, [target.id for target in targets])
+        assert split_mock.call_count < len(new_nodes)           # Node zero is split in many nodes at once
+        assert ring.split_count == len(new_nodes)
+
+    def test_insert_many_after_insert(self, make_ring):
+        ring = make_ring(node_capacity=20)
+        targets = make_targets(400)
+        for target in targets[:100]:
+            ring.insert(target, target.id)
+        ring.insert_many(targets[100:], [target.id for target in targets[100:]])
+        for target in targets:
+            assert ring.get(target.id) == target
+        for node in ring.get_nodes():
+            assert node.load <= ring.node_max_load
+
+    def test_insert_many_duplicated_keys(self, make_ring):
+        ring = make_ring(node_capacity=20)
+        targets = make_targets(10)
+        ring.insert(targets[0], targets[0].id)
+        with pytest.raises(KeyAlreadyExistsError):
+            ring.insert_many(targets, [target.id for target in targets])
+        with pytest.raises(KeyAlreadyExistsError):
+            ring.insert_many(targets[1:3] * 2, [target.id for target in targets[1:3] * 2])
+        assert ring.target_count == 1                   # Nothing of the failed batches is inserted
+        with pytest.raises(KeyNotFoundError):
+            ring.get(targets[1].id)
+
+    def test_insert_many_without_keys(self, make_ring):
+        ring = make_ring(node_capacity=20)
+        assert ring.insert_many(make_targets(10)) == []
+        assert ring.target_count == 10
+
+class TestMultiwaySplit:
+    def test_split_in_evenly_sized_nodes(self, mocked_hashes, make_ring):
+        ring = make_ring(node_capacity=20)
+        for i in range(1, 61):
+            ring.node_zero.insert(str(i * 10), Target(id=str(i * 10), name=f't{i}', address=f't{i}-address'))
+
+        assert ring._split_count(ring.node_zero) == 6           # 10 targets per node, halfway between 25% and 75%
+        new_nodes = ring._split_node_many(ring.node_zero, 6)
+        assert [node.index for node in new_nodes] == [110, 210, 310, 410, 510]
+        assert [len(node.targets) for node in ring.get_nodes()] == [10] * 6
+        assert ring.split_count == 5
+        for i in range(1, 61):
+            assert ring.get_target_node(str(i * 10)).has_key(str(i * 10))
+
+    @pytest.mark.parametrize('kwargs', [{}, {'vnode_count': 8}, {'placement_policy': 'bounded_load'}, {'node_storage': 'columnar'}, {'node_storage': 'columnar', 'vnode_count': 8}])
+    def test_split_overloaded_node(self, kwargs, make_ring):
+        ring = make_ring(node_capacity=20, **kwargs)
+        targets = [Target(id=f'target-{i}', name=f't{i}', address=f't{i}-address') for i in range(100)]
+        for target in targets:
+            ring.node_zero.insert(target.id, TargetRecord.from_target(target))
+        ring.target_count = len(targets)
+
+        new_nodes = ring._split_overloaded_nodes([ring.node_zero])
+        assert len(new_nodes) >= 9
+        for node in ring.get_nodes():
+            assert node.load <= ring.node_max_load
+        for target in targets:
+            assert ring.get(target.id) == target
+
+class TestDeleteMany:
+    @pytest.mark.parametrize('kwargs', [{}, {'vnode_count': 8}, {'placement_policy': 'bounded_load'}, {'node_storage': 'columnar'}])
+    def test_delete_many(self, kwargs, make_ring):
+        ring = make_ring(node_capacity=20, **kwargs)
+        targets = make_targets(400)
+        ring.insert_many(targets, [target.id for target in targets])
+        node_count = len(ring.nodes)
+
+        deleted_nodes = ring.delete_many([target.id for target in targets[:300]])
+        assert len(ring.nodes) == node_count - len(deleted_nodes)
+        assert ring.target_count == 100
+        for target in targets[:300]:
+            with pytest.raises(KeyNotFoundError):
+                ring.get(target.id)
+        for target in targets[300:]:
+            assert ring.get(target.id) == target
+        for node in deleted_nodes:
+            assert node.index not in ring.nodes
+            assert len(node.targets) == 0
+
+    def test_merges_once_at_the_end(self, mocker, make_ring):
+        ring = make_ring(node_capacity=20)
+        targets = make_targets(400)
+        ring.insert_many(targets, [target.id for target in targets])
+        node_count = len(ring.nodes)
+        delete_node_mock = mocker.spy(ring, '_delete_node')
+
+        deleted_nodes = ring.delete_many([target.id for target in targets])
+        assert ring.target_count == 0
+        assert delete_node_mock.call_count == len(deleted_nodes) == node_count - 1
+        assert ring.get_nodes() == [ring.node_zero]
+
+    def test_delete_many_missing_key(self, make_ring):
+        ring = make_ring(node_capacity=20)
+        targets = make_targets(10)
+        ring.insert_many(targets, [target.id for target in targets])
+        with pytest.raises(KeyNotFoundError):
+            ring.delete_many([targets[0].id, 'missing'])
+        assert ring.get(targets[0].id) == targets[0]          # Nothing of the failed batch is deleted
+        assert ring.target_count == 10
+
+class TestScaleDecisions:
+    """
+    With mocked hashes, inserting 0, 100, 200 and 300 splits node zero at 150.
+    Deleting 300 merges node 150 back into node zero, which splits again when 300 is inserted back
+    """
+    @pytest.fixture
+    def split_ring(self, make_ring, mocked_hashes):
+        def make(**kwargs)->Ring:
+            ring = make_ring(node_capacity=4, **kwargs)
+            for i in range(0, 400, 100):
+                insert_key(ring, i)
+            assert ring.split_count == 1
+            return ring
+        return make
+
+    def _flap(self, ring: Ring, cycles: int)->None:
+        target = Target(id='300', name='t300', address='t300-address')
+        for _ in range(cycles):
+            ring.delete('300')
+            ring.insert(target, '300')
+
+    def test_without_hysteresis_flaps(self, split_ring):
+        ring = split_ring()
+        self._flap(ring, 10)
+        assert ring.split_count == 11
+        assert ring.merge_count == 10
+
+    def test_hysteresis(self, split_ring):
+        ring = split_ring(scale_hysteresis=25)
+        self._flap(ring, 10)
+        assert ring.split_count == 1
+        assert ring.merge_count == 0
+        assert ring.stats()['suppressed_merge_count'] == 10
+        ring.delete('300')
+        ring.delete('200')                  # Node 150 is empty
+        assert ring.merge_count == 1
+        assert ring.get_nodes() == [ring.node_zero]
+
+    def test_cooldown_operations(self, split_ring):
+        ring = split_ring(scale_cooldown_operations=4)
+        self._flap(ring, 2)                 # The split was the 4th operation, the deletes are the 5th and 7th
+        assert ring.merge_count == 0
+        assert ring.suppressed_merge_count == 2
+        self._flap(ring, 1)                 # The 9th operation is out of the cool-down
+        assert ring.merge_count == 1
+
+    def test_cooldown_time(self, mocker, split_ring):
+        monotonic_mock = mocker.patch('prometheus_ring.ring.time.monotonic', return_value=1000.0)
+        ring = split_ring(scale_cooldown=60)
+        self._flap(ring, 5)
+        assert ring.merge_count == 0
+        assert ring.suppressed_merge_count == 5
+        monotonic_mock.return_value = 1060.0
+        ring.delete('300')
+        assert ring.merge_count == 1
+
+    def test_full_node_splits_in_cooldown(self, split_ring):
+        ring = split_ring(scale_cooldown=60)
+        ring.delete('300')
+        ring.delete('200')
+        ring.insert(Target(id='50', name='t50', address='t50-address'), '50')
+        assert ring.split_count == 1                 # Node zero is at 75%
+        ring.insert(Target(id='60', name='t60', address='t60-address'), '60')
+        assert ring.split_count == 2                 # Node zero is full
+        assert ring.suppressed_split_count == 0
+
+    def test_unsplittable_node_is_counted_quietly(self, make_ring, mocked_hashes, caplog):
+        ring = make_ring()
+        insert_key(ring, 0, expected_series=9)          # Over the maximum load at the token of node zero
+        assert ring.get_nodes() == [ring.node_zero]
+        assert ring.suppressed_split_count == 1
+        assert not [record for record in caplog.records if record.levelname == 'WARNING']
+
+    def test_stats(self, split_ring):
+        ring = split_ring()
+        assert ring.stats() == {
+            'node_count': 2,
+            'target_count': 4,
+            'expected_series': 4,
+            'split_count': 1,
+            'merge_count': 0,
+            'suppressed_split_count': 0,
+            'suppressed_merge_count': 0,
+            'rebalance_count': 0,
+            'rebalanced_key_count': 0,
+        }
+
+class TestMergePlanner:
+    """
+    Node zero, node 100 and node 1000 with mocked hashes. Nodes can hold up to 7 targets (75% of 10).
+    Deleting 120 leaves node 100 underloaded with 100 and 110
+    """
+    @pytest.fixture
+    def merge_ring(self, make_ring, mocked_hashes):
+        def make(prior_keys: list[int], next_keys: list[int])->Ring:
+            ring = make_ring()
+            for index in [100, 1000]:
+                ring.ring.insert(index, ring._create_node(index=index))
+            for key in prior_keys + [100, 110, 120] + next_keys:
+                insert_key(ring, key)
+            return ring
+        return make
+
+    def test_absorbed_by_prior_node(self, merge_ring):
+        ring = merge_ring([1, 2, 3, 4, 5], [1000])
+        assert ring.delete('120') is not None
+        assert [len(node.targets) for node in ring.get_nodes()] == [7, 1]
+
+    def test_spread_over_both_neighbours(self, merge_ring):
+        ring = merge_ring([1, 2, 3, 4, 5, 6], [1000, 1001, 1002, 1003, 1004, 1005])
+        deleted_node = ring.delete('120')
+        assert deleted_node.index == 100
+        next_node = ring.nodes[1000]
+        assert next_node.tokens == [110]
+        assert [token for token, node in ring.ring.inorder()] == [0, 110]
+        assert ring.get_target_node('100') is ring.node_zero
+        assert ring.get_target_node('110') is next_node
+        assert [len(node.targets) for node in ring.get_nodes()] == [7, 7]
+        assert ring.merge_count == 1
+
+    def test_skipped_without_headroom(self, merge_ring):
+        ring = merge_ring([1, 2, 3, 4, 5, 6, 7], [1000, 1001, 1002, 1003, 1004, 1005, 1006])
+        assert ring.delete('120') is None
+        assert ring.merge_count == 0
+        assert ring.suppressed_merge_count == 1
+        assert [len(node.targets) for node in ring.get_nodes()] == [7, 2, 7]
+        assert ring.get('110').id == '110'
+
+    def test_measured_load_of_neighbours(self, merge_ring):
+        """
+        Node zero measured at 70% with 5 targets has room for 5 series, so the keys go to the next node
+        """
+        ring = merge_ring([1, 2, 3, 4, 5], [1000])
+        ring.measure_loads({0: 70})
+        assert ring.delete('120') is not None
+        assert [len(node.targets) for node in ring.get_nodes()] == [5, 3]
+
+    def test_split_at_index_of_shifted_node(self, merge_ring):
+        ring = merge_ring([1, 2, 3, 4, 5, 6], [1000, 1001, 1002, 1003, 1004, 1005])
+        ring.delete('120')
+        next_node = ring.nodes[1000]                        # Now at token 110
+        new_node = ring.insert(Target(id='1877', name='t1877', address='t1877-address'), '1877')
+        assert new_node.tokens == [1000]                    # The mean hash of the node is the index of the node
+        assert new_node.index == 1001
+        assert ring.nodes[1000] is next_node
+        assert len(ring.nodes) == len(ring.get_nodes()) == 3
+        with pytest.raises(NodeAlreadyExistsError):
+            ring._register_node(new_node)
+
+    @pytest.mark.parametrize('spilled_series, can_merge', [(2, True), (3, False)])
+    def test_vnode_merge_counts_spilled_keys(self, mocker, make_ring, spilled_series, can_merge):
+        """
+        Node 100 owns the ranges at 100 and 300. Its key 250 spilled from the range of node 200 and goes back to it,
+        which holds 5 series and can only receive 2 more
+        """
+        ring = make_ring(vnode_count=2)
+        mocker.patch('prometheus_ring.ring.stable_hash', side_effect=lambda x: int(x))
+        mocker.patch('prometheus_ring.node.stable_hash', side_effect=lambda x: int(x))
+        for index, tokens in [(100, [100, 300]), (200, [200, 400])]:
+            node = ring._create_node(index=index, tokens=tokens)
+            for token in tokens:
+                ring.ring.insert(token, node)
+        insert_key(ring, 210, expected_series=5)
+        insert_key(ring, 150)
+        spilled_record = TargetRecord.from_target(Target(id='250', name='t250', address='t250-address', expected_series=spilled_series))
+        ring.nodes[100].insert('250', spilled_record, 250)
+        assert ring._plan_merge(ring.nodes[100]) == (can_merge, None)
+
+class TestRebalance:
+    @pytest.fixture
+    def mocked_ring(self, make_ring, mocked_hashes):
+        def make(keys: list[int])->Ring:
+            ring = make_ring()
+            ring.ring.insert(100, ring._create_node(index=100))
+            for key in keys:
+                insert_key(ring, key)
+            return ring
+        return make
+
+    def test_rebalance_to_the_right(self, mocked_ring):
+        ring = mocked_ring([1, 2, 3, 4, 5, 6, 100])
+        right = ring.nodes[100]
+        report = ring.rebalance_pair(ring.node_zero, right)
+        assert report == RebalanceReport(left_index=0, right_index=100, moved_keys=2, token_moves=[(100, 5)])
+        assert right.tokens == [5]
+        assert [token for token, node in ring.ring.inorder()] == [0, 5]
+        assert sorted(right.targets.keys()) == ['100', '5', '6']
+        assert ring.get_target_node('5') is right
+        assert ring.get_target_node('4') is ring.node_zero
+        assert ring.stats()['rebalanced_key_count'] == 2
+
+    def test_rebalance_to_the_left(self, mocked_ring):
+        ring = mocked_ring([1, 100, 101, 102, 103, 104, 105])
+        right = ring.nodes[100]
+        report = ring.rebalance_pair(ring.node_zero, right)
+        assert report.moved_keys == 2
+        assert report.token_moves == [(100, 102)]
+        assert sorted(ring.node_zero.targets.keys()) == ['1', '100', '101']
+        assert ring.get_target_node('101') is ring.node_zero
+        assert ring.get_target_node('102') is right
+
+    def test_balanced_pair(self, mocked_ring):
+        ring = mocked_ring([1, 2, 100, 101])
+        assert ring.rebalance_pair(ring.node_zero, ring.nodes[100]).moved_keys == 0
+        assert ring.nodes[100].tokens == [100]
+
+    def test_rebalance_measured_loads(self, mocked_ring):
+        """
+        Both nodes hold 3 series, but the series of node zero were measured 3 times heavier
+        """
+        ring = mocked_ring([1, 2, 3, 100, 101, 102])
+        right = ring.nodes[100]
+        ring.measure_loads({0: 60, 100: 20})
+        report = ring.rebalance_pair(ring.node_zero, right)
+        assert report.token_moves == [(100, 3)]
+        assert sorted(right.targets.keys()) == ['100', '101', '102', '3']
+
+    def test_split_at_old_token_of_rebalanced_node(self, mocked_ring):
+        ring = mocked_ring([1, 2, 3, 4, 5, 6, 100])
+        right = ring.nodes[100]
+        ring.rebalance_pair(ring.node_zero, right)          # Node 100 is now at token 5
+        for key in [101, 102, 103, 104, 279]:
+            ring.insert(Target(id=str(key), name=f't{key}', address=f't{key}-address'), str(key))
+        new_node = ring.get_target_node('279')
+        assert new_node.tokens == [100]
+        assert new_node.index != 100
+        assert ring.nodes[100] is right
+        assert len(ring.nodes) == len({id(node) for token, node in ring.ring.inorder()}) == 3
+
+    def test_not_adjacent_nodes(self, mocked_ring):
+        ring = mocked_ring([1, 2, 3, 4, 5, 6, 100])
+        assert ring.rebalance_pair(ring.nodes[100], ring.node_zero).moved_keys == 0
+
+    @pytest.mark.parametrize('kwargs', [{}, {'vnode_count': 8}, {'node_storage': 'columnar'}])
+    def test_rebalance_policy(self, kwargs, make_ring):
+        ring = make_ring(**kwargs)
+        targets = [Target(id=f'target-{i}', name=f't{i}', address=f't{i}-address') for i in range(200)]
+        ring.insert_many(targets, [target.id for target in targets])
+        node_count = len(ring.nodes)
+        loads = [node.load for node in ring.get_nodes()]
+
+        reports = ring.rebalance(threshold=0)
+        assert len(reports) > 0
+        assert sum(report.moved_keys for report in reports) == ring.rebalanced_key_count
+        assert len(ring.nodes) == node_count
+        assert max(node.load for node in ring.get_nodes()) - min(node.load for node in ring.get_nodes()) <= max(loads) - min(loads)
+        assert len(ring.ring.inorder()) == ring.vnode_count * node_count
+        for target in targets:
+            assert ring.get(target.id) == target
+
+class TestResharding:
+    @pytest.fixture
+    def fragmented_ring(self, make_ring):
+        """
+        Inserting many targets and deleting a third of them leaves nodes between the minimum and maximum loads
+        """
+        def make(**kwargs)->tuple[Ring, list[Target]]:
+            ring = make_ring(**kwargs)
+            targets = make_targets(600)
+            ring.insert_many(targets, [target.id for target in targets])
+            ring.delete_many([target.id for target in targets[::3]])
+            return ring, [target for i, target in enumerate(targets) if i % 3 != 0]
+        return make
+
+    @pytest.mark.parametrize('kwargs', [{}, {'node_storage': 'columnar'}])
+    def test_apply_resharding_evens_loads(self, kwargs, fragmented_ring):
+        ring, targets = fragmented_ring(**kwargs)
+        plan = ring.plan_resharding()
+        assert len(plan.steps) > 0
+        new_nodes, deleted_nodes = ring.apply_resharding(plan)
+        assert len(ring.nodes) == plan.node_count
+        assert len(ring.ring.inorder()) == len(ring.nodes)
+        assert all(node.index not in ring.nodes for node in deleted_nodes)
+        assert all(ring.nodes[node.index] is node for node in new_nodes)
+        assert max(node.load for node in ring.get_nodes()) - min(node.load for node in ring.get_nodes()) <= 10
+        for target in targets:
+            assert ring.get(target.id) == target
+        assert ring.plan_resharding().steps == []
+
+    def test_merged_nodes_not_resized(self, fragmented_ring):
+        ring, targets = fragmented_ring()
+        ring.resized_nodes.update(ring.nodes)               # As if every node had been resized up by a split
+        new_nodes, deleted_nodes = ring.apply_resharding(ring.plan_resharding())
+        assert len(deleted_nodes) > 0
+        resized_nodes = ring.pop_resized_nodes()
+        assert all(ring.nodes[node.index] is node for node in resized_nodes)
+        assert not any(node in resized_nodes for node in deleted_nodes)
+
+    def test_resharding_weighted_by_expected_series(self, make_ring):
+        """
+        One target out of four is 9 times heavier, so evening the keys of the nodes would leave their loads uneven
+        """
+        ring = make_ring(node_capacity=100)
+        targets = [
+            Target(id=f'target-{i}', name=f't{i}', address=f't{i}-address', expected_series=9 if i % 4 == 0 else 1)
+            for i in range(600)
+        ]
+        ring.insert_many(targets, [target.id for target in targets])
+        ring.delete_many([target.id for target in targets[1::3]])
+        ring.apply_resharding(ring.plan_resharding())
+        loads = [node.load for node in ring.get_nodes()]
+        assert max(loads) <= ring.node_max_load
+        assert max(loads) - min(loads) <= 20
+        assert sum(node.weight for node in ring.get_nodes()) == sum(target.expected_series for i, target in enumerate(targets) if i % 3 != 1)
+
+    def test_apply_resharding_with_moved_keys_budget(self, fragmented_ring):
+        ring, targets = fragmented_ring()
+        plan = ring.plan_resharding(max_moved_keys=20)
+        assert 0 < plan.moved_keys <= 20
+        ring.apply_resharding(plan)
+        assert len(ring.nodes) == plan.node_count
+        for target in targets:
+            assert ring.get(target.id) == target
+
+    def test_stale_plan_rejected(self, fragmented_ring):
+        ring, targets = fragmented_ring()
+        plan = ring.plan_resharding()
+        ring.delete_many([target.id for target in targets[:60]])       # Merges nodes the plan moves
+        ring_tokens = ring.ring.inorder()
+        with pytest.raises(StaleReshardingPlanError):
+            ring.apply_resharding(plan)
+        assert ring.ring.inorder() == ring_tokens
+        plan.generation = None
+        with pytest.raises(StaleReshardingPlanError):                   # Every step is checked before moving any token
+            ring.apply_resharding(plan)
+        assert ring.ring.inorder() == ring_tokens
+        ring.apply_resharding(ring.plan_resharding())
+        for target in targets[60:]:
+            assert ring.get(target.id) == target
+
+    def test_vnodes_not_supported(self, make_ring):
+        ring = make_ring(vnode_count=8)
+        with pytest.raises(ReshardingNotSupportedError):
+            ring.plan_resharding()
+
+class TestConcurrency:
+    @pytest.fixture
+    def frequent_thread_switches(self):
+        """
+        Switching threads more often makes the races more likely to show up
+        """
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        yield
+        sys.setswitchinterval(switch_interval)
+
+    @pytest.mark.parametrize('node_storage', Ring.node_storages)
+    def test_concurrent_readers_and_writers(self, frequent_thread_switches, node_storage, make_ring):
+        """
+        Stress test: writers insert and delete targets, splitting and merging nodes, while readers look up
+        targets that are never deleted. Every read must find its target in a consistent ring
+        """
+        ring = make_ring(node_storage=node_storage)
+        stable_targets = [Target(id=f'stable-{i}', name=f's{i}', address=f's{i}-address') for i in range(100)]
+        ring.insert_many(stable_targets, [target.id for target in stable_targets])
+        errors = []
+        writers_done = threading.Event()
+
+        def write(writer: int):
+            try:
+                for round in range(20):
+                    targets = [Target(id=f'w{writer}-{round}-{i}', name='w', address='w-address') for i in range(10)]
+                    for target in targets:
+                        ring.insert(target, target.id)
+                    for target in targets:
+                        ring.delete(target.id)
+            except Exception as e:
+                errors.append(e)
+
+        def read():
+            try:
+                while not writers_done.is_set():
+                    for target in stable_targets:
+                        assert ring.get(target.id) == target
+                        ring.get_target_node(target.id)     # Checks the key under the read lock, a split may move it right after
+                    snapshot = ring.snapshot()
+                    for target in stable_targets:
+                        assert snapshot.get(target.id) == target
+                    assert snapshot.target_count == sum(len(node.targets) for node in snapshot.get_nodes())
+            except Exception as e:
+                errors.append(e)
+
+        writers = [threading.Thread(target=write, args=(writer,)) for writer in range(4)]
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        writers_done.set()
+        for thread in readers:
+            thread.join()
+
+        assert errors == []
+        assert ring.stats()['target_count'] == len(stable_targets)
+        assert ring.split_count > 0
+        for target in stable_targets:
+            assert ring.get(target.id) == target
+
+    def test_concurrent_writers_keep_counters(self, frequent_thread_switches, make_ring):
+        """
+        Writers on different lock stripes run concurrently, and the ring counters and nodes must stay consistent
+        """
+        ring = make_ring(lock_stripe_count=4)
+        errors = []
+
+        def write(writer: int):
+            try:
+                targets = [Target(id=f'w{writer}-{i}', name='w', address='w-address') for i in range(100)]
+                for target in targets:
+                    ring.insert(target, target.id)
+                for target in targets[::2]:
+                    ring.delete(target.id)
+            except Exception as e:
+                errors.append(e)
+
+        writers = [threading.Thread(target=write, args=(writer,)) for writer in range(8)]
+        for thread in writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+
+        assert errors == []
+        assert ring.target_count == 400
+        assert ring.operation_count == 1200
+        assert sum(len(node.targets) for node in ring.get_nodes()) == 400
+        for writer in range(8):
+            for i in range(1, 100, 2):
+                assert ring.get(f'w{writer}-{i}').id == f'w{writer}-{i}'
+        assert all(node.load <= ring.node_max_load for node in ring.get_nodes())
+
+    def test_stripes_do_not_block_each_other(self, mocked_hashes, make_ring):
+        ring = make_ring(node_capacity=100, node_min_load=0, lock_stripe_count=2)
+        ring.ring.insert(101, ring._create_node(index=101))        # Stripe 1, node zero is in stripe 0
+        target_zero = Target(id='1', name='t1', address='t1-address')
+        target_other = Target(id='102', name='t102', address='t102-address')
+
+        with ring._node_lock(ring.node_zero):
+            inserting_zero = threading.Thread(target=ring.insert, args=(target_zero, target_zero.id))
+            inserting_zero.start()
+            ring.insert(target_other, target_other.id)               # Doesn't wait for the held stripe
+            inserting_zero.join(timeout=0.1)
+            assert inserting_zero.is_alive()
+            assert not ring.node_zero.has_key('1')
+        inserting_zero.join(timeout=5)
+        assert ring.get('1') == target_zero
+        assert ring.get('102') == target_other
+
+class TestSnapshot:
+    def test_generation_increases_on_mutations(self, make_ring):
+        ring = make_ring()
+        generation = ring.generation
+        target = make_targets(1)[0]
+        ring.insert(target, target.id)
+        assert ring.generation > generation
+        generation = ring.generation
+        ring.get(target.id)
+        ring.get_nodes()
+        assert ring.generation == generation
+        ring.delete(target.id)
+        assert ring.generation > generation
+
+    @pytest.mark.parametrize('node_storage', Ring.node_storages)
+    def test_snapshot_is_not_changed_by_the_ring(self, node_storage, make_ring):
+        ring = make_ring(node_storage=node_storage)
+        targets = make_targets(50)
+        ring.insert_many(targets, [target.id for target in targets])
+        snapshot = ring.snapshot()
+        node_count = len(snapshot.nodes)
+
+        new_targets = make_targets(50, 'new')
+        ring.insert_many(new_targets, [target.id for target in new_targets])
+        ring.delete_many([target.id for target in targets[:40]])
+        assert snapshot.generation < ring.generation
+        assert len(snapshot.nodes) == node_count
+        assert snapshot.target_count == 50
+        for target in targets:
+            assert snapshot.get(target.id) == target
+            assert snapshot.get_target_node(target.id).has_key(target.id)
+        assert snapshot.get(new_targets[0].id) is None
+        with pytest.raises(TypeError):
+            snapshot.nodes[0].targets['key'] = targets[0]
+
+    @pytest.mark.parametrize('node_storage', Ring.node_storages)
+    def test_snapshot_matches_the_ring(self, node_storage, make_ring):
+        ring = make_ring(node_storage=node_storage)
+        targets = make_targets(100)
+        ring.insert_many(targets, [target.id for target in targets])
+        snapshot = ring.snapshot()
+        assert [node.index for node in snapshot.get_nodes()] == [node.index for node in ring.get_nodes()]
+        for node_snapshot, node in zip(snapshot.get_nodes(), ring.get_nodes()):
+            assert {key: target.to_target() for key, target in node_snapshot.targets.items()} == {key: target.to_target() for key, target in node.targets.items()}
+            assert list(node_snapshot.iter_endpoints()) == [(target.id, target.endpoint) for target in node.iter_items()]
+            assert node_snapshot.load == node.load
+        for target in targets:
+            assert snapshot.get_target_node(target.id).index == ring.get_target_node(target.id).index
+
+    def test_snapshot_shares_unchanged_nodes(self, make_ring):
+        ring = make_ring()
+        targets = make_targets(100)
+        ring.insert_many(targets, [target.id for target in targets])
+        snapshot = ring.snapshot()
+        assert ring.snapshot() is snapshot                  # Same generation
+
+        new_target = Target(id='new', name='new', address='new-address')
+        ring.insert(new_target, new_target.id)
+        new_snapshot = ring.snapshot()
+        changed_index = new_snapshot.get_target_node(new_target.id).index
+        assert new_snapshot is not snapshot
+        for index, node_snapshot in new_snapshot.nodes.items():
+            if index == changed_index:
+                assert node_snapshot is not snapshot.nodes[index]
+            else:
+                assert node_snapshot is snapshot.nodes[index]
+
+    def test_insert_while_copying_other_node(self, mocker, mocked_hashes, make_ring):
+        ring = make_ring()
+        ring.ring.insert(100, ring._create_node(index=100))             # Not in the stripe of node zero
+        for key in ['1', '100']:
+            ring.insert(Target(id=key, name=f't{key}', address=f't{key}-address'), key)
+        ring.snapshot()
+        ring.insert(Target(id='101', name='t101', address='t101-address'), '101')
+
+        node = ring.nodes[100]
+        copy_targets = node.copy_targets
+        def insert_into_copied_node():
+            thread = threading.Thread(target=ring.insert, args=(Target(id='2', name='t2', address='t2-address'), '2'))
+            thread.start()
+            thread.join()
+            return copy_targets()
+        mocker.patch.object(node, 'copy_targets', side_effect=insert_into_copied_node)
+        snapshot = ring.snapshot()
+        assert snapshot.get('101') is not None
+        assert snapshot.get('2') is None
+        assert snapshot.generation < ring.generation
+        assert ring.snapshot().get('2') is not None
+
+def test_invalid_node_storage(make_ring):
+    with pytest.raises(InvalidNodeStorageError):
+        make_ring(node_capacity=20, node_storage='rows')
+
+@pytest.mark.parametrize('node_storage', Ring.node_storages)
+def test_label_sets_released_with_deleted_targets(make_ring, node_storage):
+    ring = make_ring(node_storage=node_storage)
+    targets = [Target(id=f'target-{i}', name=f't{i}', address=f't{i}-address', labels={'shard': i % 50}) for i in range(200)]
+    ring.insert_many(targets[:100], [target.id for target in targets[:100]])
+    for target in targets[100:]:
+        ring.insert(target, target.id)
+    with pytest.raises(KeyAlreadyExistsError):
+        ring.insert(targets[0], targets[0].id)
+    ring.update(targets[0].id, Target(id=targets[0].id, name='t0', address='t0-address', labels={'shard': 'updated'}))
+    assert len(ring.label_sets) == 51
+    shared_labels = ring.get_target_node(targets[50].id).get(targets[50].id).labels
+    assert ring.get_target_node(targets[150].id).get(targets[150].id).labels is shared_labels
+    ring.delete_many([target.id for target in targets[:100]])
+    for target in targets[100:]:
+        ring.delete(target.id)
+    assert len(ring.label_sets) == 0
+
+class TestKeyIndex:
+    def _assert_index_matches_nodes(self, ring: Ring):
+        indexed_keys = 0
+        for node in ring.nodes.values():
+            for key in node.targets:
+                assert ring.key_index[key] == (node.get_hash(key), node)
+                indexed_keys += 1
+        assert len(ring.key_index) == indexed_keys == ring.target_count
+
+    @pytest.mark.parametrize('kwargs', [{}, {'vnode_count': 4}, {'placement_policy': 'bounded_load'}, {'node_storage': 'columnar'}])
+    def test_index_follows_splits_and_merges(self, kwargs, make_ring):
+        ring = make_ring(**kwargs)
+        targets = [Target(id=f'target-{i}', name=f't{i}', address=f't{i}-address') for i in range(300)]
+        for target in targets[:150]:
+            ring.insert(target, target.id)
+        ring.insert_many(targets[150:], [target.id for target in targets[150:]])
+        assert ring.split_count > 0
+        self._assert_index_matches_nodes(ring)
+
+        for target in targets[:100]:
+            ring.delete(target.id)
+        ring.delete_many([target.id for target in targets[100:200]])
+        assert ring.merge_count > 0
+        self._assert_index_matches_nodes(ring)
+        ring.rebalance(threshold=0)
+        self._assert_index_matches_nodes(ring)
+        assert not ring.has_key(targets[0].id)
+        assert ring.has_key(targets[-1].id)
+
+    def test_index_follows_resharding(self, make_ring):
+        ring = make_ring()
+        targets = [Target(id=f'target-{i}', name=f't{i}', address=f't{i}-address') for i in range(300)]
+        ring.insert_many(targets, [target.id for target in targets])
+        ring.delete_many([target.id for target in targets[::3]])
+        ring.apply_resharding(ring.plan_resharding())
+        self._assert_index_matches_nodes(ring)
+
+    def test_index_follows_rehash(self, restore_hash_function, make_ring):
+        ring = make_ring()
+        targets = [Target(id=f'target-{i}', name=f't{i}', address=f't{i}-address') for i in range(100)]
+        ring.insert_many(targets, [target.id for target in targets])
+        ring.rehash('blake2b')
+        self._assert_index_matches_nodes(ring)
+        assert ring.key_index[targets[0].id][0] == stable_hash(targets[0].id)
+
+    def test_lookups_do_not_hash_nor_search(self, mocker, make_ring):
+        ring = make_ring()
+        targets = [Target(id=f'target-{i}', name=f't{i}', address=f't{i}-address') for i in range(100)]
+        ring.insert_many(targets, [target.id for target in targets])
+        hash_spy = mocker.patch('prometheus_ring.ring.stable_hash', side_effect=stable_hash)
+        search_spy = mocker.spy(ring.ring, 'find_max_smaller_than')
+        for target in targets:
+            assert ring.get(target.id) == target
+            assert ring.get_target_node(target.id).has_key(target.id)
+        ring.delete(targets[0].id)
+        with pytest.raises(KeyNotFoundError):
+            ring.get(targets[0].id)
+        assert hash_spy.call_count == 0
+        assert search_spy.call_count == 0
+
+@pytest.mark.parametrize('node_storage', ['dict', 'columnar'])
+class TestWeightedTargets:
+    """
+    Loads measured in expected series with mocked hashes. Nodes hold up to 7 series (75% of 10)
+    """
+    def test_heavy_target_splits_node(self, node_storage, make_ring, mocked_hashes):
+        ring = make_ring(node_storage=node_storage)
+        for key in [1, 2, 3]:
+            assert insert_key(ring, key) is None
+        new_node = insert_key(ring, 4, expected_series=6)
+        assert new_node.tokens == [3]                       # Weighted mean of the hashes. Unweighted, it would be 2
+        assert [node.weight for node in ring.get_nodes()] == [2, 7]
+        assert [node.load for node in ring.snapshot().get_nodes()] == [20, 70]
+        assert ring.stats()['expected_series'] == 9
+
+    def test_quantile_split_at_weighted_median(self, node_storage, make_ring, mocked_hashes):
+        ring = make_ring(node_storage=node_storage, split_strategy='quantile')
+        for key in [1, 2, 3]:
+            insert_key(ring, key)
+        new_node = insert_key(ring, 4, expected_series=6)
+        assert new_node.tokens == [4]
+        assert [len(node.targets) for node in ring.get_nodes()] == [3, 1]
+
+    def test_growing_update_splits_node(self, node_storage, make_ring, mocked_hashes):
+        ring = make_ring(node_storage=node_storage)
+        for key in [1, 2, 3, 4]:
+            insert_key(ring, key)
+        assert ring.update('4', Target(id='4', name='t4', address='t4-address', expected_series=2)) is None
+        new_node = ring.update('4', Target(id='4', name='t4', address='t4-address', expected_series=6))
+        assert new_node.tokens == [3]                       # As if the heavy target had been inserted
+        assert [node.weight for node in ring.get_nodes()] == [2, 7]
+        assert ring.update('4', Target(id='4', name='t4', address='t4-address', expected_series=5)) is None
+
+    def test_merge_needs_headroom_for_series(self, node_storage, make_ring, mocked_hashes):
+        ring = make_ring(node_storage=node_storage)
+        ring.ring.insert(100, ring._create_node(index=100))
+        insert_key(ring, 1, expected_series=7)
+        insert_key(ring, 100)
+        insert_key(ring, 110)
+        assert ring.delete('110') is None                   # Node zero holds a single target, but 7 series
+        assert ring.suppressed_merge_count == 1
+        ring.update('1', Target(id='1', name='t1', address='t1-address', expected_series=6))
+        ring.delete('100')
+        assert ring.merge_count == 1
+
+    def test_rebalance_moves_series(self, node_storage, make_ring, mocked_hashes):
+        ring = make_ring(node_storage=node_storage)
+        ring.ring.insert(100, ring._create_node(index=100))
+        for key, expected_series in [(1, 1), (2, 1), (3, 4)]:
+            insert_key(ring, key, expected_series)
+        insert_key(ring, 100)
+        report = ring.rebalance_pair(ring.node_zero, ring.nodes[100])
+        assert report.token_moves == [(100, 3)]             # Moving the heavy key evens the series, 2 and 5
+        assert report.moved_keys == 1
+
+class TestCapacityClasses:
+    """
+    Small, medium and large nodes with mocked hashes. Halfway between the minimum and maximum loads (50%),
+    they hold 5, 10 and 20 series
+    """
+    capacity_classes = [
+        CapacityClass(name='large', capacity=40, cpu_reservation=2, memory_reservation=4 * 2 ** 30),
+        CapacityClass(name='small', capacity=10, cpu_reservation=0.5, memory_reservation=2 ** 30),
+        CapacityClass(name='medium', capacity=20, cpu_reservation=1, memory_reservation=2 * 2 ** 30),
+    ]
+
+    def test_nodes_start_small(self, make_ring, mocked_hashes):
+        ring = make_ring(capacity_classes=self.capacity_classes)
+        assert ring.node_capacity == 10
+        assert ring.node_zero.capacity_class.name == 'small'
+        for key in range(1, 9):
+            insert_key(ring, key)
+        assert [(node.capacity_class.name, len(node.targets)) for node in ring.get_nodes()] == [('small', 3), ('small', 5)]
+        assert ring.pop_resized_nodes() == []
+
+    def test_new_node_class_from_its_half(self, make_ring, mocked_hashes):
+        ring = make_ring(capacity_classes=self.capacity_classes)
+        insert_key(ring, 1)
+        insert_key(ring, 2)
+        new_node = insert_key(ring, 3, expected_series=6)
+        assert new_node.tokens == [2]
+        assert (new_node.capacity_class.name, new_node.capacity, new_node.load) == ('medium', 20, 35)
+        assert ring.node_zero.capacity_class.name == 'small'
+        assert ring.pop_resized_nodes() == []               # New nodes are launched with their class
+
+    def test_split_node_resized_up(self, make_ring, mocked_hashes):
+        ring = make_ring(capacity_classes=self.capacity_classes, split_strategy='quantile')
+        insert_key(ring, 1, expected_series=6)
+        insert_key(ring, 2)
+        new_node = insert_key(ring, 3)
+        assert new_node.capacity_class.name == 'small'
+        assert (ring.node_zero.capacity_class.name, ring.node_zero.load) == ('medium', 30)
+        assert ring.pop_resized_nodes() == [ring.node_zero]
+        assert ring.pop_resized_nodes() == []
+
+    def test_hot_range_packed_in_large_nodes(self, make_ring, mocked_hashes):
+        ring = make_ring(capacity_classes=self.capacity_classes)
+        targets = [Target(id=str(key), name=f't{key}', address=f't{key}-address') for key in range(1, 31)]
+        new_nodes = ring.insert_many(targets, [target.id for target in targets])
+        assert len(new_nodes) == 1                          # Six small nodes without capacity classes
+        assert [(node.capacity_class.name, node.load) for node in ring.get_nodes()] == [('large', 35), ('large', 40)]
+
+    def test_merge_headroom_of_receiver(self, make_ring, mocked_hashes):
+        ring = make_ring(capacity_classes=self.capacity_classes)
+        ring.ring.insert(100, ring._create_node(index=100))
+        ring.node_zero.set_capacity_class(self.capacity_classes[0])
+        for key in range(1, 8):
+            insert_key(ring, key)
+        insert_key(ring, 100)
+        insert_key(ring, 110)
+        assert ring.delete('110') is not None               # A small node zero couldn't take an eighth series
+        assert len(ring.node_zero.targets) == 8
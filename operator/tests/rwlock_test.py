@@ -0,0 +1,56 @@
+import pytest
+import threading
+from prometheus_ring.rwlock import ReadWriteLock
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    readers_in = threading.Barrier(3, timeout=5)
+    def read():
+        with lock.read():
+            readers_in.wait()               # Only returns if the three readers hold the lock at once
+    threads = [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not readers_in.broken
+
+def test_writer_waits_for_readers():
+    lock = ReadWriteLock()
+    events = []
+    lock.acquire_read()
+    writer = threading.Thread(target=lambda: (lock.acquire_write(), events.append('write'), lock.release_write()))
+    writer.start()
+    writer.join(timeout=0.1)
+    assert events == []
+    events.append('read')
+    lock.release_read()
+    writer.join(timeout=5)
+    assert events == ['read', 'write']
+
+def test_waiting_writer_blocks_new_readers():
+    lock = ReadWriteLock()
+    events = []
+    lock.acquire_read()
+    writer = threading.Thread(target=lambda: (lock.acquire_write(), events.append('write'), lock.release_write()))
+    writer.start()
+    while lock._waiting_writers == 0:
+        pass
+    reader = threading.Thread(target=lambda: (lock.acquire_read(), events.append('read'), lock.release_read()))
+    reader.start()
+    reader.join(timeout=0.1)
+    assert events == []                     # The new reader queues behind the waiting writer
+    lock.release_read()
+    writer.join(timeout=5)
+    reader.join(timeout=5)
+    assert events == ['write', 'read']
+
+def test_lock_released_on_exception():
+    lock = ReadWriteLock()
+    with pytest.raises(ValueError):
+        with lock.write():
+            raise ValueError()
+    with lock.read():
+        pass
+    with lock.write():
+        pass
@@ -0,0 +1,14 @@
+from prometheus_ring.selection import weighted_quantile_rank
+from itertools import accumulate
+
+def test_weighted_quantile_rank():
+    unit_weights = list(range(1, 11))
+    assert weighted_quantile_rank(unit_weights, 0.5) == 5
+    assert weighted_quantile_rank(list(range(1, 6)), 0.5) == 2
+    assert weighted_quantile_rank(unit_weights, 0.25) == 2
+    assert weighted_quantile_rank(unit_weights, 0) == 1                                     # Always leaves values on both sides
+    assert weighted_quantile_rank(unit_weights, 1) == 9
+    assert weighted_quantile_rank([1], 0.5) == 0
+    assert weighted_quantile_rank(list(accumulate([1, 1, 1, 10])), 0.5) == 3             # The heavy value holds most of the weight
+    assert weighted_quantile_rank(list(accumulate([10, 1, 1, 1])), 0.5) == 1             # Always leaves values on both sides
+    assert weighted_quantile_rank([], 0.5) == 0
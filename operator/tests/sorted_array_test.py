@@ -0,0 +1,104 @@
+import pytest
+from prometheus_ring.adt.sorted_array import SortedArray
+
+def test_insert_keeps_keys_sorted():
+    array = SortedArray()
+    array.insert(20, "value20")
+    array.insert(10, "value10")
+    array.insert(5, "value5")
+    array.insert(15, "value15")
+    assert array.keys == [5, 10, 15, 20]
+    assert array.values == ["value5", "value10", "value15", "value20"]
+
+def test_insert_existing_key_replaces_value():
+    array = SortedArray()
+    array.insert(10, "value10")
+    array.insert(10, "new_value10")
+    assert array.keys == [10]
+    assert array.search(10) == "new_value10"
+
+def test_search_10_5_15():
+    array = SortedArray()
+    array.insert(10, "value10")
+    array.insert(5, "value5")
+    array.insert(15, "value15")
+    assert array.search(10) == "value10"
+    assert array.search(5) == "value5"
+    assert array.search(15) == "value15"
+    assert array.search(20) is None
+
+def test_update_10_5_15():
+    array = SortedArray()
+    array.insert(10, "value10")
+    array.insert(5, "value5")
+    array.insert(15, "value15")
+    old_value = array.update(10, "new_value10")
+    assert old_value == "value10"
+    assert array.search(10) == "new_value10"
+    assert array.update(20, "value20") is None
+
+def test_inorder_10_5_15():
+    array = SortedArray()
+    array.insert(10, "value10")
+    array.insert(5, "value5")
+    array.insert(15, "value15")
+    assert array.inorder() == [(5, "value5"), (10, "value10"), (15, "value15")]
+    assert array.list() == ["value5", "value10", "value15"]
+
+def test_remove_10_5_15():
+    array = SortedArray()
+    array.insert(10, "value10")
+    array.insert(5, "value5")
+    array.insert(15, "value15")
+    assert array.remove(10) == "value10"
+    assert array.search(10) is None
+    assert array.keys == [5, 15]
+    assert array.remove(10) is None
+
+def test_find_max_smaller_than_10_5_15():
+    array = SortedArray()
+    array.insert(10, "value10")
+    array.insert(5, "value5")
+    array.insert(15, "value15")
+    assert array.find_max_smaller_than(15) == "value10"
+    assert array.find_max_smaller_than(10) == "value5"
+    assert array.find_max_smaller_than(5) == None
+
+def test_find_min_greater_than():
+    array = SortedArray()
+    array.insert(10, "value10")
+    array.insert(5, "value5")
+    array.insert(15, "value15")
+    assert array.find_min_greater_than(5) == "value10"
+    assert array.find_min_greater_than(10) == "value15"
+    assert array.find_min_greater_than(15) == None
+
+def test_find_many_keeps_query_order():
+    array = SortedArray()
+    array.insert(0, "value0")
+    array.insert(10, "value10")
+    array.insert(20, "value20")
+    hashes = [25, 1, 11, 0, 20, 10, 1000]
+    assert array.find_many(hashes) == ["value20", "value0", "value10", None, "value10", "value0", "value20"]
+    assert array.find_many(hashes) == [array.find_max_smaller_than(hash) for hash in hashes]
+    assert array.find_many([]) == []
+
+def test_find_many_at_the_ends_of_the_hash_space():
+    array = SortedArray()
+    array.insert(0, ("value", 0))
+    array.insert(2 ** 64 - 1, ("value", 2 ** 64 - 1))
+    hashes = [0, 1, 2 ** 64 - 1, 2 ** 64]
+    assert array.find_many(hashes) == [None, ("value", 0), ("value", 0), ("value", 2 ** 64 - 1)]
+    array.remove(2 ** 64 - 1)                   # The cached arrays follow the changes
+    array.insert(10, "value10")
+    assert array.find_many(hashes) == [array.find_max_smaller_than(hash) for hash in hashes]
+
+def test_iter_range():
+    array = SortedArray()
+    for key in [20, 10, 5, 15, 30, 25, 35]:
+        array.insert(key, f"value{key}")
+    assert list(array.iter_values()) == [f"value{key}" for key in [5, 10, 15, 20, 25, 30, 35]]
+    assert [key for key, value in array.iter_range(10, 30)] == [10, 15, 20, 25]
+    assert [key for key, value in array.iter_range(11, 26)] == [15, 20, 25]
+    assert [key for key, value in array.iter_range(0, 5)] == []
+    assert [key for key, value in array.iter_range(36, 100)] == []
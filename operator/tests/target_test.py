@@ -0,0 +1,73 @@
+import pytest
+import tracemalloc
+from pydantic import ValidationError
+from prometheus_ring.target import Target, TargetRecord, LabelSets
+
+def bytes_per_target(count: int, compact: bool)->float:
+    """
+    Measures with tracemalloc the memory allocated to keep count targets parsed from JSON, as Target models
+    or as records sharing their label sets
+    """
+    lines = [
+        f'{{"id": "target-{i}", "name": "name-{i}", "address": "10.0.{i % 16}.1", "metrics_path": "/metrics", '
+        f'"labels": {{"env": "prod", "team": "observability"}}}}'
+        for i in range(count)
+    ]
+    label_sets = LabelSets()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    targets = [Target.model_validate_json(line) for line in lines]
+    if compact:
+        targets = [TargetRecord.from_target(target, label_sets) for target in targets]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return allocated / count
+
+def test_record_round_trip():
+    target = Target(id='1', name='t1', address='t1-address', metrics_port=9100, metrics_path='/probe', labels={'env': 'prod', 'team': 'a'})
+    record = TargetRecord.from_target(target)
+    assert record.endpoint == target.endpoint == 't1-address:9100'
+    assert record.to_target() == target
+    assert TargetRecord.from_target(Target(id='2', name='t2', address='t2-address')).to_target().labels == {}
+
+@pytest.mark.parametrize('metrics_port', [-1, 65536, 2 ** 32])
+def test_invalid_metrics_port(metrics_port):
+    with pytest.raises(ValidationError):
+        Target(id='1', name='t1', address='t1-address', metrics_port=metrics_port)
+
+def test_records_share_strings_and_labels():
+    label_sets = LabelSets()
+    first = TargetRecord.from_target(Target(id='1', name='t1', address=''.join(['host', '-a']), labels={'env': 'prod', 'team': 'a'}), label_sets)
+    second = TargetRecord.from_target(Target(id='2', name='t2', address=''.join(['host', '-a']), labels={'team': 'a', 'env': 'prod'}), label_sets)
+    assert first.address is second.address
+    assert first.metrics_path is second.metrics_path
+    assert first.labels is second.labels
+    assert not hasattr(first, '__dict__')
+
+def test_unhashable_labels_are_kept():
+    label_sets = LabelSets()
+    target = Target(id='1', name='t1', address='t1-address', labels={'owners': ['a', 'b']})
+    record = TargetRecord.from_target(target, label_sets)
+    assert record.to_target() == target
+    assert len(label_sets) == 0
+    label_sets.release(record.labels)
+
+def test_label_sets_released_with_their_last_record():
+    label_sets = LabelSets()
+    records = [TargetRecord.from_target(Target(id=str(i), name='t', address='a', labels={'env': 'prod'}), label_sets) for i in range(3)]
+    other = TargetRecord.from_target(Target(id='3', name='t', address='a', labels={'env': 'dev'}), label_sets)
+    assert len(label_sets) == 2
+    for record in records[:2]:
+        label_sets.release(record.labels)
+    assert len(label_sets) == 2
+    label_sets.release(records[2].labels)
+    label_sets.release(other.labels)
+    assert len(label_sets) == 0
+
+def test_records_use_less_memory():
+    """
+    tracemalloc benchmark: run bytes_per_target with more targets for the actual numbers
+    """
+    model_bytes = bytes_per_target(2000, compact=False)
+    record_bytes = bytes_per_target(2000, compact=True)
+    assert record_bytes < model_bytes / 3
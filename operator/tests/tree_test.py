@@ -0,0 +1,112 @@
+import pytest
+from prometheus_ring.adt.avl_tree import AVLTree
+from prometheus_ring.adt.binary_search_tree import BinarySearchTree
+
+@pytest.fixture(params=[BinarySearchTree, AVLTree])
+def tree(request):
+    """
+    Empty tree of each kind. The cases insert balanced trees, so both kinds take the same shape
+    """
+    return request.param()
+
+@pytest.fixture
+def tree_10_5_15(tree):
+    """
+        10
+      /    \\
+    5       15
+    """
+    tree.insert(10, "value10")
+    tree.insert(5, "value5")
+    tree.insert(15, "value15")
+    return tree
+
+def test_insert_10_5_15(tree_10_5_15):
+    assert tree_10_5_15.root.key == 10
+    assert tree_10_5_15.root.left.key == 5
+    assert tree_10_5_15.root.right.key == 15
+
+def test_insert_20_10_30_5_15_25_35(tree):
+    """
+                 20
+              /      \\
+             10        30
+           /    \\    /    \\
+          5      15 25     35
+    """
+    for key in [20, 10, 30, 5, 15, 25, 35]:
+        tree.insert(key, f"value{key}")
+    assert tree.root.key == 20
+    assert tree.root.left.key == 10
+    assert tree.root.left.left.key == 5
+    assert tree.root.left.right.key == 15
+    assert tree.root.right.key == 30
+    assert tree.root.right.left.key == 25
+    assert tree.root.right.right.key == 35
+    for key in [20, 10, 30, 5, 15, 25, 35]:
+        assert tree.search(key) == f"value{key}"
+    assert tree.search(26) is None
+
+def test_search_10_5_15(tree_10_5_15):
+    assert tree_10_5_15.search(10) == "value10"
+    assert tree_10_5_15.search(5) == "value5"
+    assert tree_10_5_15.search(15) == "value15"
+    assert tree_10_5_15.search(20) is None
+
+def test_update_10_5_15(tree_10_5_15):
+    old_value = tree_10_5_15.update(10, "new_value10")
+    assert old_value == "value10"
+    assert tree_10_5_15.search(10) == "new_value10"
+    assert tree_10_5_15.update(20, "value20") is None
+
+def test_inorder_10_5_15(tree_10_5_15):
+    assert tree_10_5_15.inorder() == [(5, "value5"), (10, "value10"), (15, "value15")]
+
+def test_remove_10_5_15(tree_10_5_15):
+    assert tree_10_5_15.remove(10) == "value10"
+    assert tree_10_5_15.search(10) is None
+    assert tree_10_5_15.search(15) == "value15"          # The successor keeps its own value
+    assert tree_10_5_15.root.key == 15
+    assert tree_10_5_15.root.left.key == 5
+    assert tree_10_5_15.inorder() == [(5, "value5"), (15, "value15")]
+    assert tree_10_5_15.remove(10) is None
+
+def test_remove_root_without_children(tree):
+    tree.insert(10, "value10")
+    assert tree.remove(10) == "value10"
+    assert tree.root is None
+    assert tree.search(10) is None
+    assert tree.remove(10) is None
+
+def test_remove_root_with_one_child(tree):
+    tree.insert(10, "value10")
+    tree.insert(15, "value15")
+    assert tree.remove(10) == "value10"
+    assert tree.root.key == 15
+    assert tree.inorder() == [(15, "value15")]
+
+def test_find_max_smaller_than_10_5_15(tree_10_5_15):
+    assert tree_10_5_15.find_max_smaller_than(15) == "value10"
+    assert tree_10_5_15.find_max_smaller_than(10) == "value5"
+    assert tree_10_5_15.find_max_smaller_than(5) == None
+
+def test_find_min_greater_than(tree_10_5_15):
+    assert tree_10_5_15.find_min_greater_than(5) == "value10"
+    assert tree_10_5_15.find_min_greater_than(10) == "value15"
+    assert tree_10_5_15.find_min_greater_than(15) == None
+
+def test_iter_items_and_values(tree):
+    assert list(tree.iter_items()) == []
+    for key in [20, 10, 5, 15, 30, 25, 35]:
+        tree.insert(key, f"value{key}")
+    assert list(tree.iter_items()) == [(key, f"value{key}") for key in [5, 10, 15, 20, 25, 30, 35]]
+    assert list(tree.iter_values()) == [f"value{key}" for key in [5, 10, 15, 20, 25, 30, 35]]
+    assert tree.list() == [f"value{key}" for key in [5, 10, 15, 20, 25, 30, 35]]
+
+def test_iter_range(tree):
+    for key in [20, 10, 5, 15, 30, 25, 35]:
+        tree.insert(key, f"value{key}")
+    assert [key for key, value in tree.iter_range(10, 30)] == [10, 15, 20, 25]
+    assert [key for key, value in tree.iter_range(11, 26)] == [15, 20, 25]
+    assert [key for key, value in tree.iter_range(0, 5)] == []
+    assert [key for key, value in tree.iter_range(36, 100)] == []
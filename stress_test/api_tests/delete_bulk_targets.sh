@@ -0,0 +1,4 @@
+#!/bin/bash
+# Unregisters the same targets as delete_many_targets.sh with a single request
+ids=$(seq -s ',' -f '"%g"' 0 14)
+curl -X DELETE http://localhost:9988/unregister-targets -H "Content-Type: application/json" -d "[$ids]"
@@ -0,0 +1,7 @@
+#!/bin/bash
+# Registers the same targets as insert_many_targets.sh with a single NDJSON request
+targets=""
+for ((i=0; i < 15; i++)); do
+    targets+='{"id": "'$i'", "name": "replica '$i'", "address": "prometheus_ring-cloud-metrics-generator-'$i'", "metrics_port": 8000, "metrics_path": "/metrics"}'$'\n'
+done
+curl -X POST http://localhost:9988/register-targets -H "Content-Type: application/x-ndjson" --data-binary "$targets"